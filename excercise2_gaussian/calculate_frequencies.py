@@ -127,37 +127,72 @@ def estimate_frequencies_with_estimated_limits(iters=5):
     
     return freqs[:2], params[[0,3,4]], limits
 
-def plot_3D(data, filename, E_span=None, classical_limit=False, limits=None):
+def decimate_grid(distances, angles, energies, max_triangles):
+    """
+    Subsamples the energy grid so that the plotted surface has at most (roughly) max_triangles triangles.
+    The edges of the grid and the row/column with the minimum energy are always kept.
+    """
+    n_r, n_theta = energies.shape
+    n_triangles = 2*(n_r-1)*(n_theta-1)
+    if n_triangles <= max_triangles:
+        return distances, angles, energies
+
+    # Use the same stride in both directions
+    stride = int(np.ceil(np.sqrt(n_triangles/max_triangles)))
+
+    min_r, min_theta = np.unravel_index(np.ma.argmin(energies), energies.shape)
+    r_idx = np.unique(np.concatenate([np.arange(0, n_r, stride), [n_r-1, min_r]]))
+    theta_idx = np.unique(np.concatenate([np.arange(0, n_theta, stride), [n_theta-1, min_theta]]))
+
+    return distances[r_idx], angles[theta_idx], energies[np.ix_(r_idx, theta_idx)]
+
+def plot_3D(data, filename, E_span=None, classical_limit=False, limits=None, max_triangles=20000, output=None):
+    """
+    Plots the potential energy surface.
+    The grid is decimated to at most max_triangles triangles. If output is given, the graph is saved to this file instead of shown.
+    """
+    distances = data["distances"]
+    angles = data["angles"]
+    energies = data["energies"]
+
     if E_span is not None:
-        z_min = np.min(data["energies"])
-        data["energies"] = np.where(data["energies"] > z_min+E_span, None, data["energies"])
+        z_min = np.min(energies)
+        energies = np.ma.masked_greater(energies, z_min+E_span)
     elif classical_limit:
         def find_limits(arr, min_val, max_val):
             min_idx = np.argmin(np.where(arr < min_val, np.inf, arr))
             max_idx = np.argmax(np.where(arr > max_val, -np.inf, arr))
             return min_idx, max_idx
         
-        r_lims = find_limits(data["distances"], *limits[0])
-        theta_lims = find_limits(data["angles"], *limits[1])
+        r_lims = find_limits(distances, *limits[0])
+        theta_lims = find_limits(angles, *limits[1])
 
-        data["distances"] = data["distances"][r_lims[0]:r_lims[1]+1]
-        data["angles"] = data["angles"][theta_lims[0]:theta_lims[1]+1]
-        data["energies"] = data["energies"][r_lims[0]:r_lims[1]+1,theta_lims[0]:theta_lims[1]+1]
+        distances = distances[r_lims[0]:r_lims[1]+1]
+        angles = angles[theta_lims[0]:theta_lims[1]+1]
+        energies = energies[r_lims[0]:r_lims[1]+1,theta_lims[0]:theta_lims[1]+1]
 
-    dist, angl = np.meshgrid(data["distances"], data["angles"])
+    distances, angles, energies = decimate_grid(distances, angles, energies, max_triangles)
+
+    dist, angl = np.meshgrid(distances, angles)
 
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
 
-    surf = ax.plot_surface(dist, angl, data["energies"].T, cmap="coolwarm",
+    # The grid is already decimated, so matplotlib should not downsample it again
+    surf = ax.plot_surface(dist, angl, energies.T, cmap="coolwarm",
+                           rcount=len(angles), ccount=len(distances),
                            linewidth=0, antialiased=True)
 
-    
-
     ax.set_title(filename)
     ax.set_xlabel("r [A]")
     ax.set_ylabel("angle [degree]")
     ax.set_zlabel("E [hartree]")
-    plt.show()
+
+    if output is not None:
+        fig.savefig(output, dpi=200)
+        plt.close(fig)
+        logging.info(f"Graph saved to '{output}'")
+    else:
+        plt.show()
 
 
 if __name__ == "__main__":
@@ -174,16 +209,31 @@ if __name__ == "__main__":
     
     zlim = None
     classical_limit = False
+    max_triangles = 20000
+    output = None
     for arg in sys.argv:
         if arg.startswith("--zlim="):
             if arg == "--zlim=2-classical-limits":
                 classical_limit=True
-                break
+                continue
             try:
                 zlim = float(arg[7:])
             except Exception as ex:
                 logging.error(f"Cannot parse the zlim to float {arg}")
                 exit()
+        elif arg.startswith("--max-triangles="):
+            try:
+                max_triangles = int(arg[16:])
+            except Exception as ex:
+                logging.error(f"Cannot parse the number of triangles to int {arg}")
+                exit()
+        elif arg.startswith("--save="):
+            output = arg[7:]
+            graph = True
+
+    # Render off-screen when the graph is only saved to a file
+    if output is not None:
+        plt.switch_backend("Agg")
 
 
     # Load the data
@@ -222,6 +272,6 @@ if __name__ == "__main__":
 
     if graph:
         limits = [[minimum[1]-2*limits[0], minimum[1]+2*limits[0]], [minimum[2]-2*limits[1], minimum[2]+2*limits[1]]]
-        plot_3D(data, filename, zlim, classical_limit, limits)
+        plot_3D(data, filename, zlim, classical_limit, limits, max_triangles, output)
 
     logging.info("Program terminated successfuly.")
\ No newline at end of file
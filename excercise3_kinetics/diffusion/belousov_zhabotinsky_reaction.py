@@ -1,9 +1,11 @@
 # This script simulates simplified equations describing the Belousov-Zabotinsky reaction
-# Run using: python belousov_zabotinsky_reaction.py [output_file_name.mp4] [resolution] [duration]
+# Run using: python belousov_zabotinsky_reaction.py [output_file_name.mp4] [resolution] [duration] [--store=, --float32, --splitting, --dt=, optional]
+# With --store=[folder], the frames are saved to the given folder (otherwise a temporary folder is used), --float32 saves them in single precision
+# With --splitting, the equations are solved using Strang splitting (spectral diffusion, explicit reaction), --dt=[step] uses fixed steps
+# A checkpoint is saved in the store folder every 100 frames (change with --checkpoint-every=), --seed=[number] sets the seed of the initial noise
+# With --resume, the simulation continues from the checkpoint in the --store= folder (e.g. after it was killed, or with longer duration)
 
 import numpy as np
-from scipy.integrate import solve_ivp
-from scipy.signal import convolve2d
 
 from matplotlib import pyplot as plt
 from matplotlib import animation as animation
@@ -14,8 +16,17 @@ from datetime import datetime
 from PIL import Image
 
 from sys import argv
+import tempfile
+
+from frame_store import FrameStore, integrate_to_store
+from checkpoint import save_checkpoint, load_checkpoint, check_params, remove_checkpoint
+from render import render_video
+from reaction_diffusion import ReactionDiffusionRHS, StrangSplittingIntegrator, lotka_volterra
 
 # Parse the input arguments
+FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+argv = [arg for arg in argv if not arg.startswith("--")]
+
 if len(argv) != 4:
     print("ERROR: Incorrect number of arguments")
     print("Run this script using: python belousov_zabotinsky_reaction.py [output_file_name.mp4] [resolution] [duration]")
@@ -41,6 +52,42 @@ except Exception as ex:
     print("Run this script using: python belousov_zabotinsky_reaction.py [output_file_name.mp4] [resolution] [duration]")
     exit()
 
+DTYPE = np.float32 if "--float32" in FLAGS else np.float64
+
+STORE_PATH = None
+for flag in FLAGS:
+    if flag.startswith("--store="):
+        STORE_PATH = flag[8:]
+RESUME = "--resume" in FLAGS
+if RESUME and STORE_PATH is None:
+    print("ERROR: The folder with the checkpoint must be given using --store= to resume the simulation")
+    exit()
+if STORE_PATH is None:
+    temp_folder = tempfile.TemporaryDirectory()
+    STORE_PATH = temp_folder.name
+
+CHECKPOINT_EVERY = 100
+SEED = None
+for flag in FLAGS:
+    try:
+        if flag.startswith("--checkpoint-every="):
+            CHECKPOINT_EVERY = int(flag[19:])
+        elif flag.startswith("--seed="):
+            SEED = int(flag[7:])
+    except Exception as ex:
+        print(f"ERROR: Could not parse {flag} to an integer")
+        exit()
+
+SPLITTING = "--splitting" in FLAGS
+DT = None
+for flag in FLAGS:
+    if flag.startswith("--dt="):
+        try:
+            DT = float(flag[5:])
+        except Exception as ex:
+            print(f"ERROR: Could not parse {flag[5:]} to a float")
+            exit()
+
 # Custom colormap
 orange = np.array([207, 112, 64])/255
 blue = np.array([167, 115, 250])/255
@@ -48,82 +95,109 @@ x = np.linspace(0,1,255)
 colors = [orange*(1-i)+blue*(i) for i in x]
 colormap = ListedColormap(colors)
 
-# Define the initial conditions
+# Define the simulation constants
 SHAPE = (2,RESOLUTION,RESOLUTION)
-y0 = np.zeros(SHAPE, dtype=float)
-y0[0] = 1.
-y0[1] = 1.
 TIME = np.arange(DURATION)
 
-# Random noise used to initialize the concentrations
-noise = Image.fromarray((np.random.rand(RESOLUTION//30,RESOLUTION//30)*255).astype(np.uint8), 'L').resize(SHAPE[1:], Image.Resampling.BICUBIC)
-noise = np.array(noise, dtype=float)/255
-noise = noise**4
-
-y0[1] = 0.3+0.7*noise
-
-
 # Definition of the differential equations
-def dy(t, y):
-    # Constants
-    alpha=0.5
-    beta=-0.2
-    gamma=0.1
-    delta=-0.2
-
-    # Reshape the array to [compound, x, y]
-    y = np.reshape(y, SHAPE)
-    
-    a,b = y # Getting the individual compounds
-
-    # Calculate the derivatives due to reaction
-    da = a*alpha + a*b*beta
-    db = a*b*gamma + b*delta
-
-    # Calculate the derivatives due to diffusion
-    filt = [[0,1,0],[1,-4,1],[0,1,0]]
-
-    diff_da = convolve2d(a,filt,mode="same")
-    diff_db = convolve2d(a,filt,mode="same")
-
-    # Handle the edges
-    peri = np.zeros(SHAPE[1:])
-    peri[0,:] += 1.
-    peri[:,1] += 1.
-    peri[-1,:] += 1.
-    peri[:,-1] += 1.
-
-    diff_da += peri*a
-    diff_db += peri*b
-
-    # Return the combined derivatives. The derivative due to diffusion is scaled (larger scale = faster diffusion)
-    K = 3e-3
-    return np.array([da+diff_da*K, db+diff_db*K]).flatten()
+# The reaction terms and the zero-flux Laplacian are evaluated in preallocated buffers (see reaction_diffusion.py)
+# The derivative due to diffusion is scaled (larger scale = faster diffusion)
+K = 3e-3
+dy = ReactionDiffusionRHS(SHAPE, lotka_volterra, [K, K])
+
+# The parameters which must not change when the simulation is resumed
+PARAMS = {"resolution": RESOLUTION, "K": K, "splitting": SPLITTING, "dt": DT}
+
+if RESUME:
+    checkpoint = load_checkpoint(STORE_PATH)
+    if checkpoint is None:
+        print(f"ERROR: There is no checkpoint in '{STORE_PATH}'")
+        exit()
+    try:
+        check_params(checkpoint, PARAMS)
+    except ValueError as ex:
+        print(f"ERROR: {ex}")
+        exit()
+
+    # The frames written after the checkpoint are discarded and simulated again
+    store = FrameStore(STORE_PATH, mode="a")
+    try:
+        store.truncate(checkpoint["n_frames"])
+    except ValueError as ex:
+        print(f"ERROR: The checkpoint does not match the saved frames. {ex}")
+        exit()
+    y_start, t_start, step_size, SEED = checkpoint["y"], checkpoint["t"], checkpoint["step_size"], checkpoint["seed"]
+    print(f"Resuming from t = {t_start} ({len(store)} frames)")
+else:
+    if SEED is None:
+        SEED = int(np.random.randint(2**31))
+    rng = np.random.default_rng(SEED)
+
+    # Define the initial conditions
+    y_start = np.zeros(SHAPE, dtype=float)
+    y_start[0] = 1.
+    y_start[1] = 1.
+
+    # Random noise used to initialize the concentrations
+    noise = Image.fromarray((rng.random((RESOLUTION//30,RESOLUTION//30))*255).astype(np.uint8), 'L').resize(SHAPE[1:], Image.Resampling.BICUBIC)
+    noise = np.array(noise, dtype=float)/255
+    noise = noise**4
+
+    y_start[1] = 0.3+0.7*noise
+    t_start, step_size = 0., 1e-2
+
+    # The frames are written to disk as they are reached, so only the current state is kept in memory
+    # The checkpoint of a previous simulation in the same folder is removed, so it can not be resumed with the new frames
+    remove_checkpoint(STORE_PATH)
+    store = FrameStore(STORE_PATH, SHAPE, dtype=DTYPE, mode="w")
+
+def checkpoint(t, y, step_size):
+    save_checkpoint(STORE_PATH, y, t, len(store), step_size, SEED, PARAMS)
 
 # Solve the equations 
 print("Solving equations...")
 start = datetime.now()
 
-solution = solve_ivp(dy, (0,DURATION), y0.flatten(), t_eval=TIME, method='DOP853', rtol=1e-5, atol=1e-5, first_step=1e-2)
+if len(store) >= DURATION:
+    success, message = True, "The simulation was already finished."
+elif SPLITTING:
+    # Diffusion is solved spectrally and the reaction explicitly, with fixed steps if --dt= was given
+    integrator = StrangSplittingIntegrator(y_start, lotka_volterra, [K, K], dt=DT or step_size or 0.1, rtol=None if DT else 1e-5, atol=1e-5, t0=t_start)
+    for t in TIME[len(store):]:
+        store.append(integrator.advance(t))
+        if len(store) % CHECKPOINT_EVERY == 0 or len(store) == DURATION:
+            store.flush()
+            checkpoint(integrator.t, integrator.y, integrator.dt)
+    success = np.all(np.isfinite(integrator.y))
+    message = "The integration reached the end of the interval." if success else "The integration diverged."
+else:
+    success, message = integrate_to_store(dy, y_start.flatten(), TIME[len(store):], store, method='DOP853', t0=t_start,
+                                          checkpoint=checkpoint, checkpoint_every=CHECKPOINT_EVERY,
+                                          rtol=1e-5, atol=1e-5, first_step=min(step_size, TIME[-1]-t_start))
 
 print("Finished in", datetime.now()-start)
-print(solution.message)
+print(message)
 
 # Check that the integration converged
-if not solution.success:
+if not success:
     print("ERROR: integration did not converge")
     exit()
 
-# Reshape the solution to [t, compound, x, y]
-solution = np.reshape(solution.y,[*SHAPE,DURATION]).transpose([3,0,1,2])
+# The frames are read lazily from the disk and rendered in parallel, only the second compound is used for visualization
+print("Saving the animation...")
+try:
+    render_video(FILENAME, store, DURATION, colormap, 0, 7, fps=20, component=1)
+except RuntimeError as ex:
+    print(f"ERROR: {ex}")
+    exit()
+print("Animation saved")
 
-# Only the second compound is used for visualization
-solution = solution[:,1]
+get_frame = lambda i: store[i][1]
 
 # Animate the result
 fig, ax = plt.subplots(figsize=(6,6))
 
-img = ax.imshow(solution[0], vmin=0, vmax=7, cmap=colormap)
+img = ax.imshow(get_frame(0), vmin=0, vmax=7, cmap=colormap)
 time_text = ax.text(0.05, 0.95,'',horizontalalignment='left',verticalalignment='top', transform=ax.transAxes)
 
 # Remove white spaces around the figure
@@ -133,15 +207,10 @@ fig.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=None, hspace=None)
 ax.margins(0,0)
 
 def animate(i):
-    img.set_array(solution[i])
+    img.set_array(get_frame(i))
     time_text.set_text(f'Frame: {i+1}')
     return img, time_text
 
 ani = animation.FuncAnimation(fig, animate, frames=range(DURATION), interval=50, blit=True, save_count=50)
 
-print("Saving the animation...")
-FFwriter = animation.FFMpegWriter(fps=20)
-ani.save(FILENAME, writer = FFwriter)
-print("Animation saved")
-
 plt.show()
\ No newline at end of file
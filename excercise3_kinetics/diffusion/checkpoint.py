@@ -0,0 +1,81 @@
+# This module saves and loads checkpoints of long simulations, so that they can be resumed or extended
+# The checkpoint is saved in the folder of the frame store and is always replaced atomically
+
+import json
+import os
+
+import numpy as np
+
+FILENAME = "checkpoint.npz"
+
+def save_checkpoint(folder, y, t, n_frames, step_size=None, seed=None, params=None):
+    """
+    Saves the state vector y at time t together with the number of saved frames, the step size of the integrator,
+    the seed of the random number generator and the simulation parameters (a json-serializable dictionary).
+    """
+    tmp = os.path.join(folder, FILENAME + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, y=y, t=t, n_frames=n_frames,
+                 step_size=np.nan if step_size is None else step_size,
+                 seed=-1 if seed is None else seed,
+                 params=json.dumps(params or {}))
+    os.replace(tmp, os.path.join(folder, FILENAME))
+
+def load_checkpoint(folder):
+    """Returns the latest checkpoint in the folder as a dictionary, or None if there is no checkpoint"""
+    path = os.path.join(folder, FILENAME)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        step_size = float(data["step_size"])
+        seed = int(data["seed"])
+        return {"y": data["y"], "t": float(data["t"]), "n_frames": int(data["n_frames"]),
+                "step_size": None if np.isnan(step_size) else step_size,
+                "seed": None if seed < 0 else seed,
+                "params": json.loads(str(data["params"]))}
+
+def remove_checkpoint(folder):
+    """Removes the checkpoint from the folder, used when a new simulation is started in the folder of an old one"""
+    path = os.path.join(folder, FILENAME)
+    if os.path.exists(path):
+        os.remove(path)
+
+def check_params(checkpoint, params):
+    """Raises an error if the checkpoint was made for different simulation parameters"""
+    for key, value in params.items():
+        if checkpoint["params"].get(key) != value:
+            raise ValueError(f"The checkpoint was made with {key} = {checkpoint['params'].get(key)}, not {value}")
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    import tempfile
+
+    print("Running tests...")
+
+    with tempfile.TemporaryDirectory() as folder:
+        assert load_checkpoint(folder) is None
+
+        y = np.random.rand(2,4,4)
+        save_checkpoint(folder, y, 12.5, 13, 0.25, 42, {"resolution": 4})
+        save_checkpoint(folder, y*2, 20., 21, None, None, {"resolution": 4})
+        checkpoint = load_checkpoint(folder)
+
+        assert np.all(checkpoint["y"] == y*2)
+        assert checkpoint["t"] == 20. and checkpoint["n_frames"] == 21
+        assert checkpoint["step_size"] is None and checkpoint["seed"] is None
+        assert os.listdir(folder) == [FILENAME]
+
+        check_params(checkpoint, {"resolution": 4})
+        try:
+            check_params(checkpoint, {"resolution": 8})
+            assert False
+        except ValueError:
+            pass
+
+        remove_checkpoint(folder)
+        assert load_checkpoint(folder) is None
+        remove_checkpoint(folder)
+
+    print("All tests passed")
@@ -1,5 +1,7 @@
 # This script simulates 1D diffusion in closed finite space
-# Run this using: python diffusion_1D.py
+# Run this using: python diffusion_1D.py [--spectral, --video=, optional]
+# With --spectral, the concentrations are calculated exactly for each frame using DCT instead of numerical integration
+# With --video=[file.mp4], the concentrations are rendered as a colored strip into the video file (using ffmpeg) instead of being shown
 # First, integral of the concentration over time is shown (to show that the amount of material stays constant)
 # Then, the animation of the diffusion is shown
 
@@ -9,16 +11,17 @@ from scipy.integrate import solve_ivp
 from matplotlib import pyplot as plt
 from matplotlib import animation as animation
 
-# Definition of the differential equations
-def D_conc(t, conc):
-    filt = [1,-2,1]
-    d_conc = np.convolve(conc, filt, mode='same')
+from sys import argv
 
-    # Handle the edges
-    d_conc[0] += conc[0]
-    d_conc[-1] += conc[-1]
+from laplacian import DiffusionOperator
+from spectral import SpectralDiffusion
+from render import render_video
 
-    return d_conc
+SPECTRAL = "--spectral" in argv
+VIDEO = None
+for arg in argv:
+    if arg.startswith("--video="):
+        VIDEO = arg[8:]
 
 # Define the initial state
 x = np.linspace(0,10,100)
@@ -27,11 +30,31 @@ conc0 = np.where((x>=3)&(x<=3.5), 1, 0)+np.where((x>=7)&(x<=7.5), 1, 0)
 # Define the simulation timepoints
 TIME = np.linspace(0,50,200)
 
-# Solve the differential equation
-solution = solve_ivp(D_conc, [TIME[0],TIME[-1]], conc0, t_eval=TIME, max_step=1, method="DOP853")
+if SPECTRAL:
+    # The frames are calculated lazily when they are needed, no time stepping is needed
+    solver = SpectralDiffusion(conc0)
+    frames = solver.frame_source(TIME)
+else:
+    # Definition of the differential equations
+    # The sparse Laplacian also provides the Jacobian, so an implicit integrator with large steps can be used
+    diffusion = DiffusionOperator((100,))
+
+    # Solve the differential equation
+    solution = solve_ivp(diffusion.rhs, [TIME[0],TIME[-1]], conc0, t_eval=TIME, jac=diffusion.jacobian, method="BDF")
+    frames = solution.y.T
+
+if VIDEO is not None:
+    print("Rendering the video...")
+    try:
+        render_video(VIDEO, frames, len(TIME), 'hot', 0, 1, strip_height=10)
+    except RuntimeError as ex:
+        print(f"ERROR: {ex}")
+        exit()
+    print(f"Video saved to {VIDEO}")
+    exit()
 
 # Plot the integral over time to show that the total amount of the substance does not change
-integrals = np.sum(solution.y, axis=0)
+integrals = np.array([np.sum(frames[i]) for i in range(len(TIME))])
 plt.plot(TIME, integrals)
 plt.ylim(0,np.max(integrals)*1.1)
 plt.xlabel("Time")
@@ -50,10 +73,10 @@ ax.set_ylabel("Concentration")
 
 def animate(i):
     """Updates the data for each animation frame"""
-    line.set_ydata(solution.y[:,i])
+    line.set_ydata(frames[i])
     time_text.set_text(f"Time: {TIME[i]:0.1f}")
     return line,time_text
 
 ani = animation.FuncAnimation(fig, animate, frames=range(200), interval=50, blit=True, save_count=50)
 
-plt.show()
\ No newline at end of file
+plt.show()
@@ -1,69 +1,141 @@
 # This scripts simulates 2D diffusion in a closed square container
-# Run using: python diffusion_2D.py
+# Run using: python diffusion_2D.py [--spectral, --store=, --float32, --video=, --frames=, --resume, optional]
+# With --spectral, the concentrations are calculated exactly for each frame using DCT instead of numerical integration
+# With --store=[folder], the frames are saved to the given folder (otherwise a temporary folder is used), --float32 saves them in single precision
+# With --video=[file.mp4], the animation is rendered into the video file (using ffmpeg) instead of being shown
+# --frames=[number] sets the number of simulated frames (200 by default)
+# A checkpoint is saved in the store folder every 50 frames, with --resume the simulation continues from the checkpoint in the --store= folder
 
 import numpy as np
-from scipy.integrate import solve_ivp
-from scipy.signal import convolve2d
 
 from matplotlib import pyplot as plt
 from matplotlib import animation as animation
 
 from datetime import datetime
+from sys import argv
+import tempfile
+
+from laplacian import DiffusionOperator
+from spectral import SpectralDiffusion
+from frame_store import FrameStore, integrate_to_store
+from checkpoint import save_checkpoint, load_checkpoint, check_params, remove_checkpoint
+from render import render_video
+
+SPECTRAL = "--spectral" in argv
+DTYPE = np.float32 if "--float32" in argv else np.float64
+
+STORE_PATH = None
+for arg in argv:
+    if arg.startswith("--store="):
+        STORE_PATH = arg[8:]
+VIDEO = None
+for arg in argv:
+    if arg.startswith("--video="):
+        VIDEO = arg[8:]
+N_FRAMES = 200
+for arg in argv:
+    if arg.startswith("--frames="):
+        try:
+            N_FRAMES = int(arg[9:])
+        except Exception as ex:
+            print(f"ERROR: Could not parse {arg[9:]} to an integer")
+            exit()
+RESUME = "--resume" in argv
+if RESUME and STORE_PATH is None:
+    print("ERROR: The folder with the checkpoint must be given using --store= to resume the simulation")
+    exit()
+if STORE_PATH is None:
+    temp_folder = tempfile.TemporaryDirectory()
+    STORE_PATH = temp_folder.name
 
 # Define the simulation constants
 SHAPE = (256,256)
-TIME = np.linspace(0,200,200)
+TIME = np.arange(N_FRAMES)*200/199
+CHECKPOINT_EVERY = 50
 
 # Define the initial state
 conc0 = np.zeros(SHAPE, dtype=float)
 conc0[100:150,100:180] = 1.
 
-# Define the differential equations
-def D_conc(t, conc):
-    # Reshape the array to correct shape
-    conc = np.reshape(conc, SHAPE)
-
-    # Apply the convolution to get derivative
-    filt = [[0,1,0],[1,-4,1],[0,1,0]]
-    Dconc = convolve2d(conc, filt, mode='same')
-
-    # Handle the edges
-    edges = np.zeros(SHAPE)
-    edges[0,:]+=1
-    edges[:,0]+=1
-    edges[-1,:]+=1
-    edges[:,-1]+=1
-    Dconc += edges*conc
-
-    # return the flattened array with derivatives
-    return Dconc.flatten()
-
-# Solve the differential equation
-print("Solving equations...")
-start = datetime.now()
-
-solution = solve_ivp(D_conc, [TIME[0],TIME[-1]], conc0.flatten(), t_eval=TIME, max_step=1, method="DOP853")
-
-print("Finished in", datetime.now()-start)
-print(solution.message)
-
-# Reshape the solution to [t,x,y]
-solution = np.reshape(solution.y,[*SHAPE,len(TIME)]).transpose([2,0,1])
+if SPECTRAL:
+    # The frames are calculated lazily when they are animated, no time stepping is needed
+    solver = SpectralDiffusion(conc0)
+    frames = solver.frame_source(TIME)
+else:
+    # Define the differential equations
+    # The sparse Laplacian also provides the Jacobian, so an implicit integrator with large steps can be used
+    diffusion = DiffusionOperator(SHAPE)
+
+    # Solve the differential equation
+    print("Solving equations...")
+    start = datetime.now()
+
+    if RESUME:
+        checkpoint = load_checkpoint(STORE_PATH)
+        if checkpoint is None:
+            print(f"ERROR: There is no checkpoint in '{STORE_PATH}'")
+            exit()
+        try:
+            check_params(checkpoint, {"shape": list(SHAPE)})
+        except ValueError as ex:
+            print(f"ERROR: {ex}")
+            exit()
+
+        # The frames written after the checkpoint are discarded and simulated again
+        store = FrameStore(STORE_PATH, mode="a")
+        try:
+            store.truncate(checkpoint["n_frames"])
+        except ValueError as ex:
+            print(f"ERROR: The checkpoint does not match the saved frames. {ex}")
+            exit()
+        y_start, t_start, step_size = checkpoint["y"], checkpoint["t"], checkpoint["step_size"]
+        print(f"Resuming from t = {t_start:0.1f} ({len(store)} frames)")
+    else:
+        # The frames are written to disk as they are reached, so only the current state is kept in memory
+        # The checkpoint of a previous simulation in the same folder is removed, so it can not be resumed with the new frames
+        remove_checkpoint(STORE_PATH)
+        store = FrameStore(STORE_PATH, SHAPE, dtype=DTYPE, mode="w")
+        y_start, t_start, step_size = conc0.flatten(), TIME[0], None
+
+    checkpoint = lambda t, y, step_size: save_checkpoint(STORE_PATH, y, t, len(store), step_size, params={"shape": list(SHAPE)})
+
+    if len(store) >= len(TIME):
+        success, message = True, "The simulation was already finished."
+    else:
+        success, message = integrate_to_store(diffusion.rhs, y_start, TIME[len(store):], store, method="BDF", t0=t_start,
+                                              checkpoint=checkpoint, checkpoint_every=CHECKPOINT_EVERY,
+                                              jac=diffusion.jacobian, first_step=step_size)
+
+    print("Finished in", datetime.now()-start)
+    print(message)
+
+    # The frames are read lazily from the disk
+    frames = store
+
+if VIDEO is not None:
+    print("Rendering the video...")
+    try:
+        render_video(VIDEO, frames, len(TIME), 'hot', 0, 1)
+    except RuntimeError as ex:
+        print(f"ERROR: {ex}")
+        exit()
+    print(f"Video saved to {VIDEO}")
+    exit()
 
 # Animate the result
 fig, ax = plt.subplots()
 
-img = ax.imshow(solution[0], vmin=0, vmax=1, cmap='hot')
+img = ax.imshow(frames[0], vmin=0, vmax=1, cmap='hot')
 time_text = ax.text(0.05, 0.95,'',horizontalalignment='left',verticalalignment='top', transform=ax.transAxes, color='white')
 fig.colorbar(img)
 
 def animate(i):
     """Updates the data for each animation frame"""
-    img.set_array(solution[i])
+    img.set_array(frames[i])
     time_text.set_text(f"Time: {TIME[i]:0.0f}")
     return img, time_text
 
 
 ani = animation.FuncAnimation(fig, animate, frames=len(TIME), interval=50, blit=True, save_count=50)
 
-plt.show()
\ No newline at end of file
+plt.show()
@@ -0,0 +1,242 @@
+# This module saves simulation frames to disk as they are produced, so that the memory usage does not grow with the duration
+# The frames are saved in chunks of memory-mapped .npy files in one folder, and can be read back lazily
+
+import json
+import os
+
+import numpy as np
+from scipy.integrate import RK23, RK45, DOP853, Radau, BDF, LSODA
+
+METHODS = {"RK23": RK23, "RK45": RK45, "DOP853": DOP853, "Radau": Radau, "BDF": BDF, "LSODA": LSODA}
+
+class FrameStore:
+    """
+    Chunked on-disk array of frames, saved in the folder path.
+    Use mode="w" to create a new store (frame_shape must be given), mode="a" to append to an existing store and mode="r" to only read.
+    """
+    def __init__(self, path, frame_shape=None, dtype=np.float64, chunk_size=32, mode="r"):
+        self.path = path
+        self.mode = mode
+
+        if mode == "w":
+            if frame_shape is None:
+                raise ValueError("The frame shape must be given when creating a new store")
+            os.makedirs(path, exist_ok=True)
+            # Remove the chunks of any previous store in the same folder
+            for filename in os.listdir(path):
+                if filename.startswith("chunk_") and filename.endswith(".npy"):
+                    os.remove(os.path.join(path, filename))
+            self.frame_shape = tuple(frame_shape)
+            self.dtype = np.dtype(dtype)
+            self.chunk_size = chunk_size
+            self.n_frames = 0
+            self._save_meta()
+        elif mode in ("r", "a"):
+            with open(os.path.join(path, "meta.json"), "r") as f:
+                meta = json.load(f)
+            self.frame_shape = tuple(meta["frame_shape"])
+            self.dtype = np.dtype(meta["dtype"])
+            self.chunk_size = meta["chunk_size"]
+            self.n_frames = meta["n_frames"]
+        else:
+            raise ValueError(f"Unknown mode '{mode}'")
+
+        self._chunk = None
+        self._chunk_idx = None
+
+    def _save_meta(self):
+        """Saves the metadata, the file is replaced atomically so it is never left half-written"""
+        meta = {"frame_shape": self.frame_shape, "dtype": self.dtype.str, "chunk_size": self.chunk_size, "n_frames": self.n_frames}
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _chunk_path(self, chunk_idx):
+        return os.path.join(self.path, f"chunk_{chunk_idx:06d}.npy")
+
+    def _open_chunk(self, chunk_idx, writable):
+        """Memory-maps the chunk, only one chunk is kept open at a time"""
+        if self._chunk_idx == chunk_idx and (not writable or self._chunk.mode != "r"):
+            return self._chunk
+        self._close_chunk()
+
+        path = self._chunk_path(chunk_idx)
+        if not writable:
+            self._chunk = np.load(path, mmap_mode="r")
+        elif os.path.exists(path):
+            self._chunk = np.load(path, mmap_mode="r+")
+        else:
+            self._chunk = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=(self.chunk_size, *self.frame_shape))
+        self._chunk_idx = chunk_idx
+        return self._chunk
+
+    def _close_chunk(self):
+        if self._chunk is not None and self._chunk.mode != "r":
+            self._chunk.flush()
+        self._chunk = None
+        self._chunk_idx = None
+
+    def append(self, frame):
+        """Writes the frame at the end of the store"""
+        if self.mode == "r":
+            raise IOError("The store is opened as read-only")
+
+        chunk_idx, idx = divmod(self.n_frames, self.chunk_size)
+        chunk = self._open_chunk(chunk_idx, writable=True)
+        chunk[idx] = np.reshape(frame, self.frame_shape)
+        self.n_frames += 1
+
+        # Only finished chunks are recorded, so a crash never leaves frames which were not written
+        if idx == self.chunk_size-1:
+            self._close_chunk()
+            self._save_meta()
+
+    def flush(self):
+        """Writes all the frames to disk and updates the metadata"""
+        if self.mode != "r":
+            self._close_chunk()
+            self._save_meta()
+
+    def close(self):
+        self.flush()
+
+    def truncate(self, n_frames):
+        """Discards all frames after the first n_frames (e.g. frames written after the last checkpoint)"""
+        if n_frames > self.n_frames:
+            raise ValueError(f"Cannot truncate the store with {self.n_frames} frames to {n_frames} frames")
+        self._close_chunk()
+        self.n_frames = n_frames
+        self._save_meta()
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, i):
+        """Returns the i-th frame, only the chunk containing it is mapped into memory"""
+        if i < 0:
+            i += self.n_frames
+        if not 0 <= i < self.n_frames:
+            raise IndexError(f"Frame {i} is out of range, the store has {self.n_frames} frames")
+
+        chunk_idx, idx = divmod(i, self.chunk_size)
+        return self._open_chunk(chunk_idx, writable=self.mode != "r" and self._chunk_idx == chunk_idx)[idx]
+
+    def __iter__(self):
+        for i in range(self.n_frames):
+            yield self[i]
+
+    def __getstate__(self):
+        # Memory maps cannot be pickled, the chunks are opened again when needed
+        state = self.__dict__.copy()
+        state["_chunk"] = None
+        state["_chunk_idx"] = None
+        return state
+
+def integrate_to_store(fun, y0, times, store, method="DOP853", frame=None, t0=None, checkpoint=None, checkpoint_every=100, **options):
+    """
+    Integrates the differential equation and appends the state at each of the given times to the store.
+    Only the current state of the integrator is held in memory, the frames are written as soon as they are reached.
+    frame is an optional function which converts the state vector into the saved frame.
+    The integration starts at t0 (by default the first of the times), this is used to resume from a checkpoint.
+    checkpoint(t, y, step_size) is called after each checkpoint_every frames and at the end, the store is flushed before the call.
+    The remaining options are passed to the scipy integrator (e.g. rtol, atol, first_step, jac).
+
+    Returns (success, message)
+    """
+    if frame is None:
+        frame = lambda y: y
+    if t0 is None:
+        t0 = times[0]
+
+    solver = METHODS[method](fun, t0, y0, times[-1], **options)
+    last_checkpoint = len(store)
+
+    i = 0
+    while i < len(times) and times[i] <= solver.t:
+        store.append(frame(solver.y))
+        i += 1
+
+    while solver.status == "running":
+        message = solver.step()
+        if solver.status == "failed":
+            store.flush()
+            return False, message
+
+        # Interpolate the frames which were passed in this step
+        if i < len(times) and times[i] <= solver.t:
+            interpolant = solver.dense_output()
+            while i < len(times) and times[i] <= solver.t:
+                store.append(frame(interpolant(times[i])))
+                i += 1
+
+            if checkpoint is not None and len(store) >= last_checkpoint + checkpoint_every:
+                store.flush()
+                checkpoint(solver.t, solver.y, solver.step_size)
+                last_checkpoint = len(store)
+
+    store.flush()
+    if checkpoint is not None:
+        checkpoint(solver.t, solver.y, solver.step_size)
+    return True, "The solver successfully reached the end of the integration interval."
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    import tempfile
+    import pickle
+    from scipy.integrate import solve_ivp
+
+    print("Running tests...")
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Frames are read back the same as they were written, also across chunks
+        store = FrameStore(os.path.join(folder, "a"), (2,3), chunk_size=4, mode="w")
+        frames = np.random.rand(10,2,3)
+        for f in frames:
+            store.append(f)
+        store.close()
+
+        store = FrameStore(os.path.join(folder, "a"))
+        assert len(store) == 10
+        assert np.all(np.array(list(store)) == frames)
+
+        # Appending to an existing store
+        store = FrameStore(os.path.join(folder, "a"), mode="a")
+        store.append(np.ones((2,3)))
+        store.close()
+        store = pickle.loads(pickle.dumps(FrameStore(os.path.join(folder, "a"))))
+        assert len(store) == 11 and np.all(store[-1] == 1.)
+
+        # A new store in the folder of an old one does not reuse its chunks, even with a different shape or dtype
+        store = FrameStore(os.path.join(folder, "a"), (3,), dtype=np.float32, chunk_size=4, mode="w")
+        store.append(np.arange(3))
+        store.close()
+        store = FrameStore(os.path.join(folder, "a"))
+        assert len(store) == 1 and store[0].dtype == np.float32 and np.all(store[0] == np.arange(3))
+        assert sorted(os.listdir(os.path.join(folder, "a"))) == ["chunk_000000.npy", "meta.json"]
+
+        # The streamed integration gives the same result as solve_ivp
+        fun = lambda t, y: -y*np.array([1., 2.])
+        times = np.linspace(0, 2, 7)
+        store = FrameStore(os.path.join(folder, "b"), (2,), dtype=np.float32, mode="w")
+        success, message = integrate_to_store(fun, [1., 1.], times, store, rtol=1e-8, atol=1e-10)
+        reference = solve_ivp(fun, (0, 2), [1., 1.], t_eval=times, method="DOP853", rtol=1e-8, atol=1e-10)
+        assert success
+        assert store.dtype == np.float32
+        assert np.allclose(np.array(list(store)).T, reference.y, atol=1e-6)
+
+        # Resuming from a checkpoint gives the same frames
+        checkpoints = []
+        store = FrameStore(os.path.join(folder, "c"), (2,), mode="w")
+        integrate_to_store(fun, [1., 1.], times, store, rtol=1e-8, atol=1e-10,
+                           checkpoint=lambda t, y, h: checkpoints.append((t, y.copy(), len(store))), checkpoint_every=3)
+        assert len(checkpoints) == 3
+        t, y, n_frames = checkpoints[0]
+        store = FrameStore(os.path.join(folder, "c"), mode="a")
+        store.truncate(n_frames)
+        integrate_to_store(fun, y, times[n_frames:], store, t0=t, rtol=1e-8, atol=1e-10)
+        assert len(store) == len(times)
+        assert np.allclose(np.array(list(store)).T, reference.y, atol=1e-6)
+
+    print("All tests passed")
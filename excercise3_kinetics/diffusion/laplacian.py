@@ -0,0 +1,90 @@
+# This module builds the finite-difference Laplacian of a closed container as a sparse matrix
+# The matrix can be used both to calculate the derivatives and as the (constant) Jacobian for implicit integrators
+
+import numpy as np
+from scipy import sparse
+
+def neumann_laplacian_1D(n):
+    """
+    Returns the 1D Laplacian with zero-flux boundaries as a sparse (n,n) matrix.
+    This is the same as the convolution with (1,-2,1) where the edges are corrected by +1.
+    """
+    diagonal = np.full(n, -2.)
+    diagonal[0] += 1.
+    diagonal[-1] += 1.
+    off_diagonal = np.ones(n-1)
+
+    return sparse.diags([off_diagonal, diagonal, off_diagonal], [-1, 0, 1], format="csr")
+
+def neumann_laplacian(shape, scale=1.):
+    """
+    Returns the Laplacian with zero-flux boundaries for a grid of given shape (1D, 2D or 3D) as a CSR matrix.
+    The matrix acts on the flattened (C-order) array and is multiplied by scale (the diffusion coefficient).
+    """
+    if len(shape) not in (1, 2, 3):
+        raise ValueError(f"Only 1D, 2D and 3D grids are supported, not {len(shape)}D")
+
+    # The Laplacian is the Kronecker sum of the 1D Laplacians along each axis
+    L = sparse.csr_matrix((int(np.prod(shape)),)*2)
+    for axis, n in enumerate(shape):
+        left = sparse.identity(int(np.prod(shape[:axis])), format="csr")
+        right = sparse.identity(int(np.prod(shape[axis+1:])), format="csr")
+        L = L + sparse.kron(sparse.kron(left, neumann_laplacian_1D(n)), right, format="csr")
+
+    return (L*scale).tocsr()
+
+class DiffusionOperator:
+    """
+    The right-hand side of the diffusion equation dc/dt = scale*Laplacian(c) with its analytic Jacobian.
+    Use as solve_ivp(op.rhs, ..., jac=op.jacobian, method="BDF")
+    """
+    def __init__(self, shape, scale=1.):
+        self.shape = tuple(shape)
+        self.laplacian = neumann_laplacian(self.shape, scale)
+
+    def rhs(self, t, conc):
+        """Returns the derivatives of the flattened concentrations"""
+        return self.laplacian @ conc
+
+    def jacobian(self, t, conc):
+        """Returns the Jacobian, which is constant for diffusion"""
+        return self.laplacian
+
+    @property
+    def sparsity(self):
+        """The sparsity pattern of the Jacobian (can be passed as jac_sparsity)"""
+        pattern = self.laplacian.copy()
+        pattern.data[:] = 1.
+        return pattern
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from scipy.signal import convolve2d
+
+    print("Running tests...")
+
+    # 1D Laplacian is the same as the convolution with corrected edges
+    conc = np.random.rand(20)
+    d_conc = np.convolve(conc, [1,-2,1], mode="same")
+    d_conc[0] += conc[0]
+    d_conc[-1] += conc[-1]
+    assert np.allclose(neumann_laplacian((20,)) @ conc, d_conc)
+
+    # 2D Laplacian is the same as the convolution with corrected edges
+    conc = np.random.rand(12,17)
+    d_conc = convolve2d(conc, [[0,1,0],[1,-4,1],[0,1,0]], mode="same")
+    edges = np.zeros(conc.shape)
+    edges[0,:] += 1
+    edges[:,0] += 1
+    edges[-1,:] += 1
+    edges[:,-1] += 1
+    d_conc += edges*conc
+    assert np.allclose(neumann_laplacian(conc.shape) @ conc.flatten(), d_conc.flatten())
+
+    # The total amount of substance is conserved in 3D
+    L = neumann_laplacian((5,6,7), 0.3)
+    assert np.allclose(L.sum(axis=0), 0)
+    assert np.allclose((L-L.T).data, 0)
+
+    print("All tests passed")
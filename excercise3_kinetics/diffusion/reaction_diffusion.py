@@ -0,0 +1,278 @@
+# This module contains allocation-free kernels and an operator-splitting integrator for reaction-diffusion systems
+# The state has the shape [compound, x, y, ...] and all the work is done in preallocated buffers
+
+import numpy as np
+from scipy import fft
+
+from spectral import laplacian_eigenvalues
+
+# Constants of the Lotka-Volterra equations used to simulate the Belousov-Zhabotinsky reaction
+ALPHA = 0.5
+BETA = -0.2
+GAMMA = 0.1
+DELTA = -0.2
+
+def lotka_volterra(y, out):
+    """Writes the derivatives due to the reaction into out, y and out have the shape [2, x, y, ...]"""
+    a, b = y
+    da, db = out
+
+    # da = a*alpha + a*b*beta
+    np.multiply(b, BETA, out=da)
+    da += ALPHA
+    da *= a
+
+    # db = a*b*gamma + b*delta
+    np.multiply(a, GAMMA, out=db)
+    db += DELTA
+    db *= b
+
+    return out
+
+def laplacian_inplace(conc, out, axes=None):
+    """
+    Writes the Laplacian with zero-flux boundaries (see laplacian.py) of the array conc into out.
+    Works for any number of dimensions, no temporary arrays are created.
+    If axes are given, only the second derivatives along these axes are included.
+    """
+    if axes is None:
+        axes = range(conc.ndim)
+    np.multiply(conc, -2*len(axes), out=out)
+    for axis in axes:
+        lower = [slice(None)]*conc.ndim
+        upper = [slice(None)]*conc.ndim
+        lower[axis] = slice(None, -1)
+        upper[axis] = slice(1, None)
+        lower, upper = tuple(lower), tuple(upper)
+
+        # Add the neighbours on both sides
+        out[upper] += conc[lower]
+        out[lower] += conc[upper]
+
+        # The missing neighbour at the edge is replaced by the pixel itself (zero flux)
+        first = [slice(None)]*conc.ndim
+        last = [slice(None)]*conc.ndim
+        first[axis] = slice(0, 1)
+        last[axis] = slice(-1, None)
+        out[tuple(first)] += conc[tuple(first)]
+        out[tuple(last)] += conc[tuple(last)]
+
+    return out
+
+def rk4_inplace(reaction, y, dt, k, stage):
+    """
+    Integrates dy/dt = reaction(y) for time dt using one RK4 step, y is updated in place.
+    k (shape [4, *y.shape]) and stage (shape y.shape) are preallocated buffers.
+    """
+    reaction(y, k[0])
+    np.multiply(k[0], dt/2, out=stage)
+    stage += y
+    reaction(stage, k[1])
+    np.multiply(k[1], dt/2, out=stage)
+    stage += y
+    reaction(stage, k[2])
+    np.multiply(k[2], dt, out=stage)
+    stage += y
+    reaction(stage, k[3])
+
+    # y += dt/6*(k1 + 2*k2 + 2*k3 + k4)
+    k[1] += k[2]
+    k[1] *= 2
+    k[0] += k[1]
+    k[0] += k[3]
+    k[0] *= dt/6
+    y += k[0]
+
+class ReactionDiffusionRHS:
+    """
+    Right-hand side of the reaction-diffusion equations for scipy integrators.
+    reaction(y, out) writes the reaction derivatives, diffusion_coeffs contains one coefficient for each compound.
+    """
+    def __init__(self, shape, reaction, diffusion_coeffs):
+        self.shape = tuple(shape)
+        self.reaction = reaction
+        self.diffusion_coeffs = diffusion_coeffs
+        self._diffusion = np.empty(self.shape[1:])
+
+    def __call__(self, t, y):
+        y = np.reshape(y, self.shape)
+        # The scipy integrators keep references to the returned derivatives, so the output must be a new array
+        out = np.empty(self.shape)
+        self.reaction(y, out)
+        for i, coeff in enumerate(self.diffusion_coeffs):
+            laplacian_inplace(y[i], self._diffusion)
+            self._diffusion *= coeff
+            out[i] += self._diffusion
+
+        return out.reshape(-1)
+
+class StrangSplittingIntegrator:
+    """
+    Integrates reaction-diffusion equations using Strang splitting.
+    Diffusion is solved exactly (spectrally, see spectral.py) for half a step, then the reaction is integrated explicitly (RK4) for a full step,
+    followed by another half step of diffusion.
+
+    If rtol is None, fixed steps of dt are used, otherwise the step is adapted using step doubling.
+    """
+    def __init__(self, y0, reaction, diffusion_coeffs, dt=0.1, rtol=None, atol=1e-6, t0=0.):
+        self.y = np.array(y0, dtype=float)
+        self.t = t0
+        self.dt = dt
+        self.reaction = reaction
+        self.rtol = rtol
+        self.atol = atol
+
+        self.eigvals = np.array([laplacian_eigenvalues(self.y.shape[1:], coeff) for coeff in diffusion_coeffs])
+        self._propagator = None
+        self._propagator_dt = None
+
+        # Preallocated buffers for the RK4 stages
+        self._k = np.empty((4, *self.y.shape))
+        self._stage = np.empty(self.y.shape)
+
+        # Preallocated buffers for step doubling
+        if rtol is not None:
+            self._full = np.empty(self.y.shape)
+            self._error = np.empty(self.y.shape)
+
+    def _diffuse(self, y, dt):
+        """Applies the exact diffusion propagator for time dt to y"""
+        if self._propagator_dt != dt:
+            self._propagator = np.exp(self.eigvals*dt)
+            self._propagator_dt = dt
+        for i in range(len(y)):
+            coeffs = fft.dctn(y[i], type=2, norm="ortho", overwrite_x=True)
+            coeffs *= self._propagator[i]
+            y[i] = fft.idctn(coeffs, type=2, norm="ortho", overwrite_x=True)
+
+    def _react(self, y, dt):
+        """Integrates the reaction terms for time dt using RK4 in the preallocated buffers"""
+        rk4_inplace(self.reaction, y, dt, self._k, self._stage)
+
+    def _strang_step(self, y, dt):
+        self._diffuse(y, dt/2)
+        self._react(y, dt)
+        self._diffuse(y, dt/2)
+
+    def step(self, dt):
+        """
+        Makes one step of at most dt and returns the size of the step which was taken.
+        With adaptive steps, the step is repeated with a smaller dt until the error is acceptable.
+        """
+        if self.rtol is None:
+            self._strang_step(self.y, dt)
+            self.t += dt
+            return dt
+
+        while True:
+            # One full step and two half steps, the difference estimates the error
+            self._full[:] = self.y
+            self._strang_step(self._full, dt)
+            self._error[:] = self.y
+            self._strang_step(self._error, dt/2)
+            self._strang_step(self._error, dt/2)
+
+            self._full -= self._error
+            np.abs(self._full, out=self._full)
+            np.abs(self._error, out=self._stage)
+            self._stage *= self.rtol
+            self._stage += self.atol
+            self._full /= self._stage
+            error = np.max(self._full)
+
+            # The scheme is second order, so the local error scales as dt^3
+            factor = 0.9*error**(-1/3) if error > 0 else 5.
+            if error <= 1:
+                self.y[:] = self._error
+                self.t += dt
+                self.dt = dt*min(5., factor)
+                return dt
+            dt *= max(0.2, factor)
+
+    def advance(self, t_end):
+        """
+        Integrates the equations until t_end, the last step is shortened to reach t_end exactly.
+        The step size used after that is not reduced only because of the shortened step.
+        """
+        while self.t < t_end - 1e-12:
+            remaining = t_end - self.t
+            if self.dt < remaining:
+                self.step(self.dt)
+            else:
+                dt = self.dt
+                if self.step(remaining) == remaining:
+                    self.dt = max(self.dt, dt)
+        return self.y
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from scipy.integrate import solve_ivp
+    from laplacian import neumann_laplacian
+
+    print("Running tests...")
+
+    # The in-place stencil is the same as the sparse Laplacian in 1D, 2D and 3D
+    for shape in [(7,), (6,9), (4,5,6)]:
+        conc = np.random.rand(*shape)
+        out = np.empty(shape)
+        laplacian_inplace(conc, out)
+        assert np.allclose(out.flatten(), neumann_laplacian(shape) @ conc.flatten())
+
+    # Laplacian along some axes only
+    conc = np.random.rand(4,5,6)
+    out = np.empty(conc.shape)
+    laplacian_inplace(conc, out, axes=(1,2))
+    expected = np.array([neumann_laplacian(conc.shape[1:]) @ c.flatten() for c in conc]).reshape(conc.shape)
+    assert np.allclose(out, expected)
+
+    # The reaction terms match the Lotka-Volterra equations
+    y = np.random.rand(2,5,5)
+    out = lotka_volterra(y, np.empty(y.shape))
+    assert np.allclose(out[0], y[0]*ALPHA + y[0]*y[1]*BETA)
+    assert np.allclose(out[1], y[0]*y[1]*GAMMA + y[1]*DELTA)
+
+    # Both fixed and adaptive splitting agree with the reference solution
+    y0 = 1. + 0.5*np.random.rand(2,16,16)
+    rhs = ReactionDiffusionRHS(y0.shape, lotka_volterra, [0.3, 0.1])
+    reference = solve_ivp(rhs, (0, 5), y0.flatten(), method="DOP853", rtol=1e-10, atol=1e-10).y[:,-1]
+
+    fixed = StrangSplittingIntegrator(y0, lotka_volterra, [0.3, 0.1], dt=0.05)
+    assert np.allclose(fixed.advance(5.).flatten(), reference, atol=1e-3)
+
+    adaptive = StrangSplittingIntegrator(y0, lotka_volterra, [0.3, 0.1], dt=0.05, rtol=1e-6, atol=1e-8)
+    assert np.allclose(adaptive.advance(5.).flatten(), reference, atol=1e-4)
+    assert abs(adaptive.t - 5.) < 1e-9
+
+    # A step shortened to reach a frame does not shrink the following steps
+    frames = StrangSplittingIntegrator(y0, lotka_volterra, [0.3, 0.1], dt=0.2, rtol=1e-3, atol=1e-6)
+    frames.advance(1e-3)
+    assert frames.t == 1e-3 and frames.dt >= 0.2
+
+    # The 3D simulation split into slabs over several processes is the same as one process and as a serial explicit integration
+    import os
+    import tempfile
+    from frame_store import FrameStore
+    from reaction_diffusion_3D import simulate_3D, initial_state, K
+    y0 = initial_state(10, True, np.random.default_rng(0))
+    with tempfile.TemporaryDirectory() as folder:
+        results = []
+        for n_workers in (1, 3):
+            store = FrameStore(os.path.join(folder, str(n_workers)), y0.shape[1:], mode="w")
+            simulate_3D(y0, store, 3, dt=0.05, n_workers=n_workers)
+            results.append(np.array(list(store)))
+    assert np.array_equal(results[0], results[1])
+
+    y = y0.copy()
+    diffusion, k, stage = np.empty(y.shape[1:]), np.empty((4, *y.shape)), np.empty(y.shape)
+    expected = [y[1].copy()]
+    for step in range(40):
+        for i in range(len(y)):
+            laplacian_inplace(y[i], diffusion, axes=(0, 1, 2))
+            y[i] += diffusion*0.05*K
+        rk4_inplace(lotka_volterra, y, 0.05, k, stage)
+        if (step+1) % 20 == 0:
+            expected.append(y[1].copy())
+    assert np.allclose(results[0], expected, rtol=1e-12, atol=1e-12)
+
+    print("All tests passed")
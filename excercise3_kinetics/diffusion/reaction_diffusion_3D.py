@@ -0,0 +1,188 @@
+# This script simulates the Belousov-Zhabotinsky reaction (or pure diffusion) in a closed 3D cube using several processes
+# Run using: python reaction_diffusion_3D.py [output folder] [resolution] [duration] [--workers=, --diffusion, --dt=, --float32, optional]
+#   [output folder] - the folder where the frames (3D concentrations of the second compound) will be saved, see frame_store.py
+#   [resolution] - the resolution of the spatial dimensions, e.g. 64 will simulate 64x64x64 voxels
+#   [duration] - the number of the simulated frames
+#   --workers=[number] - number of worker processes (all cores by default)
+#   --diffusion - simulate only the diffusion of a cube in the middle of the container
+#   --dt=[step] - the time step (default 0.05)
+#   --float32 - save the frames in single precision
+#
+# The cube is split into slabs along the first axis, one for each worker. The state is kept in shared memory and in each step,
+# each worker copies its slab together with the neighbouring planes (halo layers) of the other slabs, and writes back its new slab.
+# Diffusion is integrated explicitly and the reaction by RK4 (Lie splitting), the boundaries have zero flux as in the 2D scripts.
+
+import numpy as np
+from scipy.ndimage import zoom
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+from datetime import datetime
+from sys import argv
+import os
+
+from reaction_diffusion import laplacian_inplace, lotka_volterra, rk4_inplace
+from frame_store import FrameStore
+
+# The diffusion coefficient, the same as in belousov_zhabotinsky_reaction.py
+K = 3e-3
+
+def split_domain(n, n_workers):
+    """Returns the (start, end) of the slab for each worker, the slabs differ in size by at most one plane"""
+    bounds = np.linspace(0, n, n_workers+1).round().astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _worker(shm_name, shape, slab, n_steps, steps_per_frame, dt, diffusion_coeff, react, step_barrier, frame_barrier):
+    """Integrates the equations on one slab, the state of the whole domain is in the shared memory shm_name"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        state = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        start, end = slab
+        n_species, n = shape[0], shape[1]
+
+        # Preallocated local buffers: the slab with one halo plane on each side
+        padded = np.empty((n_species, end-start+2, *shape[2:]))
+        center = padded[:, 1:-1]
+        diffusion = np.empty(center.shape[1:])
+        k = np.empty((4, *center.shape))
+        stage = np.empty(center.shape)
+
+        for step in range(n_steps):
+            # Halo exchange, the plane outside the domain is the edge plane itself (zero flux)
+            padded[:, 1:-1] = state[:, start:end]
+            padded[:, 0] = state[:, max(start-1, 0)]
+            padded[:, -1] = state[:, min(end, n-1)]
+
+            # Every worker must read the state before anybody writes the new one
+            step_barrier.wait()
+
+            # Explicit step of diffusion, along the first axis using the halo planes
+            for i in range(n_species):
+                laplacian_inplace(center[i], diffusion, axes=(1, 2))
+                diffusion += padded[i, :-2]
+                diffusion += padded[i, 2:]
+                diffusion -= center[i]
+                diffusion -= center[i]
+                diffusion *= dt*diffusion_coeff
+                state[i, start:end] += diffusion
+
+            # The reaction is local, so it is integrated on the slab only
+            if react:
+                center[:] = state[:, start:end]
+                rk4_inplace(lotka_volterra, center, dt, k, stage)
+                state[:, start:end] = center
+
+            step_barrier.wait()
+
+            # The main process saves the frame while the workers wait
+            if (step+1) % steps_per_frame == 0:
+                frame_barrier.wait()
+                frame_barrier.wait()
+    except BaseException:
+        # Release the other processes, otherwise they would wait at the barriers forever
+        step_barrier.abort()
+        frame_barrier.abort()
+        raise
+    finally:
+        shm.close()
+
+def simulate_3D(y0, store, n_frames, dt=0.05, n_workers=None, react=True, component=1):
+    """
+    Simulates the reaction-diffusion (or only diffusion if react is False) starting from y0 [compound, x, y, z]
+    and appends the given compound at times 0, 1, ..., n_frames-1 to the store.
+    """
+    n_workers = n_workers or os.cpu_count()
+    n_workers = min(n_workers, y0.shape[1])
+    steps_per_frame = int(round(1/dt))
+    dt = 1/steps_per_frame
+
+    shm = shared_memory.SharedMemory(create=True, size=y0.nbytes)
+    try:
+        state = np.ndarray(y0.shape, dtype=np.float64, buffer=shm.buf)
+        state[:] = y0
+        store.append(state[component])
+
+        # The workers are forked, so that the calling script is not run again in them
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        step_barrier = context.Barrier(n_workers)
+        frame_barrier = context.Barrier(n_workers+1)
+        n_steps = (n_frames-1)*steps_per_frame
+
+        workers = [context.Process(target=_worker, args=(shm.name, y0.shape, slab, n_steps, steps_per_frame, dt, K, react, step_barrier, frame_barrier))
+                   for slab in split_domain(y0.shape[1], n_workers)]
+        for worker in workers:
+            worker.start()
+
+        for frame in range(1, n_frames):
+            frame_barrier.wait()
+            store.append(state[component])
+            frame_barrier.wait()
+
+        for worker in workers:
+            worker.join()
+        store.flush()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def initial_state(resolution, react, rng):
+    """Returns the initial concentrations [compound, x, y, z]"""
+    y0 = np.ones((2, resolution, resolution, resolution))
+    if react:
+        # Smooth random noise, the same as in the 2D simulation
+        coarse = max(resolution//30, 2)
+        noise = zoom(rng.random((coarse,)*3), resolution/coarse, order=3)[:resolution, :resolution, :resolution]
+        noise = np.clip(noise, 0, 1)**4
+        y0[1] = 0.3+0.7*noise
+    else:
+        # A cube in the middle of the container
+        y0[:] = 0.
+        y0[:, resolution*3//8:resolution*5//8, resolution*3//8:resolution*5//8, resolution*3//8:resolution*5//8] = 1.
+    return y0
+
+
+if __name__ == "__main__":
+    USAGE = "Run this script using: python reaction_diffusion_3D.py [output folder] [resolution] [duration] [--workers=, --diffusion, --dt=, --float32, optional]"
+
+    # Parse the input arguments
+    FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+    argv = [arg for arg in argv if not arg.startswith("--")]
+
+    if len(argv) != 4:
+        print("ERROR: Incorrect number of arguments")
+        print(USAGE)
+        exit()
+
+    FOLDER = argv[1]
+
+    try:
+        RESOLUTION = int(argv[2])
+        DURATION = int(argv[3])
+    except Exception as ex:
+        print(f"ERROR: Could not parse the resolution and duration to integers")
+        print(USAGE)
+        exit()
+
+    WORKERS = None
+    DT = 0.05
+    for flag in FLAGS:
+        try:
+            if flag.startswith("--workers="):
+                WORKERS = int(flag[10:])
+            elif flag.startswith("--dt="):
+                DT = float(flag[5:])
+        except Exception as ex:
+            print(f"ERROR: Could not parse {flag}")
+            exit()
+    REACT = "--diffusion" not in FLAGS
+    DTYPE = np.float32 if "--float32" in FLAGS else np.float64
+
+    y0 = initial_state(RESOLUTION, REACT, np.random.default_rng())
+    store = FrameStore(FOLDER, y0.shape[1:], dtype=DTYPE, mode="w")
+
+    print("Solving equations...")
+    start = datetime.now()
+    simulate_3D(y0, store, DURATION, DT, WORKERS, REACT)
+    print("Finished in", datetime.now()-start)
+    print(f"{len(store)} frames saved to {FOLDER}")
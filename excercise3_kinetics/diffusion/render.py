@@ -0,0 +1,141 @@
+# This module renders simulation frames into a video without matplotlib
+# The frames are converted to RGB using a colormap lookup table in worker processes and streamed in order into an ffmpeg pipe
+
+import subprocess
+import multiprocessing
+
+import numpy as np
+from matplotlib import colormaps
+
+def colormap_lut(cmap, n=256):
+    """Returns the colormap (name or matplotlib colormap) as a (n,3) lookup table of uint8 RGB colors"""
+    if isinstance(cmap, str):
+        cmap = colormaps[cmap]
+    return (cmap(np.linspace(0, 1, n))[:,:3]*255).round().astype(np.uint8)
+
+def frame_to_rgb(frame, lut, vmin, vmax, strip_height=1):
+    """
+    Maps the values of the frame to RGB colors, values outside (vmin, vmax) are clipped.
+    1D frames are drawn as a horizontal strip which is strip_height pixels high.
+    """
+    frame = np.asarray(frame)
+    if frame.ndim == 1:
+        frame = np.broadcast_to(frame, (strip_height, len(frame)))
+
+    idx = (frame - vmin)*((len(lut)-1)/(vmax - vmin))
+    idx = np.clip(idx, 0, len(lut)-1, out=idx).astype(np.intp)
+    return lut[idx]
+
+class FrameRenderer:
+    """Picklable function which renders the i-th frame of the source into raw RGB bytes"""
+    def __init__(self, source, lut, vmin, vmax, component=None, strip_height=1):
+        self.source = source
+        self.lut = lut
+        self.vmin = vmin
+        self.vmax = vmax
+        self.component = component
+        self.strip_height = strip_height
+
+    def __call__(self, i):
+        frame = self.source[i]
+        if self.component is not None:
+            frame = frame[self.component]
+        return frame_to_rgb(frame, self.lut, self.vmin, self.vmax, self.strip_height).tobytes()
+
+def render_video(filename, source, n_frames, cmap, vmin, vmax, fps=20, workers=None, component=None, strip_height=1):
+    """
+    Renders the frames source[0], ..., source[n_frames-1] into a video file using ffmpeg.
+    source can be any picklable object with indexable frames (e.g. FrameStore), component selects a compound from each frame.
+    The frames are rendered in parallel by the given number of worker processes (all cores by default).
+    The worker processes are forked, so that the calling script is not run again in them. On platforms without fork
+    (e.g. Windows), the frames are rendered in the main process.
+    Raises RuntimeError if ffmpeg is not installed or if it fails.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        workers = 1
+
+    lut = colormap_lut(cmap)
+    renderer = FrameRenderer(source, lut, vmin, vmax, component, strip_height)
+
+    # The size of the video is given by the first frame
+    first = source[0] if component is None else source[0][component]
+    height, width = frame_to_rgb(first, lut, vmin, vmax, strip_height).shape[:2]
+
+    # ffmpeg reads the raw frames from stdin, the image is padded to even size required by the codec
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+               "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p", filename]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg was not found, install it and make sure it is on the PATH")
+
+    # ffmpeg can exit before all frames are written (e.g. the output file can not be created), then the pipe is broken
+    broken_pipe = False
+    try:
+        if workers == 1:
+            for i in range(n_frames):
+                process.stdin.write(renderer(i))
+        else:
+            # The pool is terminated when leaving the with block, also when the pipe breaks
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                # imap keeps the order of the frames
+                for frame in pool.imap(renderer, range(n_frames), chunksize=4):
+                    process.stdin.write(frame)
+    except BrokenPipeError:
+        broken_pipe = True
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            broken_pipe = True
+        process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}")
+    if broken_pipe:
+        raise RuntimeError("ffmpeg exited before all frames were written")
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    print("Running tests...")
+
+    # The lookup table gives the same colors as matplotlib
+    lut = colormap_lut("hot")
+    frame = np.random.rand(5,7)
+    expected = (colormaps["hot"](np.floor(frame*255)/255)[...,:3]*255).round()
+    assert np.allclose(frame_to_rgb(frame, lut, 0, 1), expected)
+
+    # Values are clipped and 1D frames become strips
+    rgb = frame_to_rgb(np.array([-1., 0.5, 2.]), lut, 0, 1, strip_height=3)
+    assert rgb.shape == (3,3,3)
+    assert (rgb[:,0] == lut[0]).all() and (rgb[:,-1] == lut[-1]).all()
+
+    # The renderer selects the compound and is picklable
+    import pickle
+    renderer = pickle.loads(pickle.dumps(FrameRenderer(np.random.rand(4,2,3,5), lut, 0, 1, component=1)))
+    assert len(renderer(2)) == 3*5*3
+
+    # Missing ffmpeg and ffmpeg which exits early are reported as errors
+    import os
+    import tempfile
+    path = os.environ.get("PATH", "")
+    with tempfile.TemporaryDirectory() as folder:
+        frames = np.random.rand(200, 64, 64)
+        for fake_ffmpeg, workers in [(None, 1), ("#!/bin/sh\nexit 1\n", 1), ("#!/bin/sh\nexit 0\n", 2)]:
+            if fake_ffmpeg is None:
+                os.environ["PATH"] = folder
+            else:
+                with open(os.path.join(folder, "ffmpeg"), "w") as f:
+                    f.write(fake_ffmpeg)
+                os.chmod(os.path.join(folder, "ffmpeg"), 0o755)
+                os.environ["PATH"] = folder + os.pathsep + path
+            try:
+                render_video(os.path.join(folder, "video.mp4"), frames, len(frames), "hot", 0, 1, workers=workers)
+                assert False, "The error was not reported"
+            except RuntimeError:
+                pass
+    os.environ["PATH"] = path
+
+    print("All tests passed")
@@ -0,0 +1,151 @@
+# This module integrates many independent copies of the Oregonator with different rate constants together
+# The systems are stacked into one large system with a block-diagonal sparse Jacobian, so the per-step overhead of the integrator is shared.
+# Instead of saving the trajectories, each run is reduced on the fly to the period, amplitude and onset of the oscillations of one species.
+
+import numpy as np
+from scipy import sparse
+from scipy.integrate import BDF
+
+
+import equations as eq
+
+class StackedSystem:
+    """Independent copies of the reaction network with different rate constants ln_k [system, reaction], integrated as one system"""
+    def __init__(self, network, ln_k):
+        self.network = network
+        self.ln_k = np.asarray(ln_k).T
+        self.n_species = len(network.species)
+        self.n_systems = self.ln_k.shape[1]
+
+        # The positions of the Jacobian entries in the block-diagonal matrix
+        rows, cols, _ = network.log_jacobian_entries(np.zeros((self.n_species, 1)), self.ln_k[:,:1])
+        offsets = self.n_species*np.arange(self.n_systems)
+        self._rows = (rows[:,None] + offsets).ravel()
+        self._cols = (cols[:,None] + offsets).ravel()
+
+    def _unstack(self, y):
+        """The state vector is ordered [system, species], returns [species, system]"""
+        return np.reshape(y, (self.n_systems, self.n_species)).T
+
+    def rhs(self, t, y):
+        return self.network.log_rhs(t, self._unstack(y), self.ln_k).T.ravel()
+
+    def jacobian(self, t, y):
+        _, _, data = self.network.log_jacobian_entries(self._unstack(y), self.ln_k)
+        n = self.n_species*self.n_systems
+        return sparse.csc_matrix((data.ravel(), (self._rows, self._cols)), shape=(n, n))
+
+class OscillationFeatures:
+    """
+    Collects the features of the oscillations of one variable sampled at equally spaced times, for many systems at once.
+    A peak is a local maximum which is at least prominence above the lowest value since the previous peak,
+    its time is refined by a parabola through the three samples around it.
+    """
+    def __init__(self, n_systems, prominence=np.log(10)):
+        self.prominence = prominence
+        self.prev = np.full(n_systems, np.nan)
+        self.prev2 = np.full(n_systems, np.nan)
+        self.trough = np.full(n_systems, np.inf)
+        self.peak_max = np.full(n_systems, -np.inf)
+        self.lowest = np.full(n_systems, np.inf)
+        self.has_peak = np.zeros(n_systems, dtype=bool)
+        self.peaks = [[] for _ in range(n_systems)]
+        self.prev_t = None
+        self.dt = None
+
+    def update(self, t, values):
+        """Processes the values of the variable at time t, the times must be equally spaced"""
+        is_peak = (self.prev > self.prev2) & (self.prev >= values) & (self.prev - self.trough >= self.prominence)
+        for i in np.nonzero(is_peak)[0]:
+            curvature = self.prev2[i] - 2*self.prev[i] + values[i]
+            shift = 0.5*(self.prev2[i] - values[i])/curvature if curvature < 0 else 0.
+            self.peaks[i].append(self.prev_t + shift*self.dt)
+        self.peak_max = np.where(is_peak, np.maximum(self.peak_max, self.prev), self.peak_max)
+        self.has_peak |= is_peak
+        self.lowest = np.where(self.has_peak, np.minimum(self.lowest, values), self.lowest)
+        self.trough = np.where(is_peak, values, np.minimum(self.trough, values))
+
+        if self.prev_t is not None:
+            self.dt = t - self.prev_t
+        self.prev2, self.prev, self.prev_t = self.prev, values, t
+
+    def summary(self):
+        """Returns the period, the amplitude (in decades) and the onset time of the oscillations for each system, nan if it does not oscillate"""
+        result = np.full((len(self.peaks), 3), np.nan)
+        for i, peaks in enumerate(self.peaks):
+            if len(peaks) >= 2:
+                # The first period is skipped, because it is affected by the initial conditions
+                intervals = np.diff(peaks[1:]) if len(peaks) >= 3 else np.diff(peaks)
+                result[i] = [np.median(intervals), (self.peak_max[i]-self.lowest[i])/np.log(10), peaks[0]]
+        return result
+
+def simulate_block(ln_k, t_max=300., variable="X", rtol=1e-3, atol=1e-3, sample_dt=0.05):
+    """
+    Integrates the Oregonator for each set of rate constants ln_k [system, reaction].
+    The variable is sampled every sample_dt seconds from the interpolant of the integrator, independently of its step sizes.
+    Returns the features [system, (period, amplitude, onset)] and whether the integration failed [system].
+    When the integration of the block fails, the block is split into halves which are integrated again,
+    so only the systems which fail on their own are marked as failed.
+    """
+    system = StackedSystem(eq.network, ln_k)
+    y0 = np.tile(eq.initial_concs, system.n_systems)
+    solver = BDF(system.rhs, 0, y0, t_max, jac=system.jacobian, rtol=rtol, atol=atol)
+
+    idx = eq.network.species.index(variable)
+    times = np.arange(0, t_max, sample_dt)
+    features = OscillationFeatures(system.n_systems)
+    features.update(times[0], system._unstack(solver.y)[idx])
+    i = 1
+    while solver.status == "running":
+        solver.step()
+        if solver.status == "failed":
+            if system.n_systems == 1:
+                return np.full((1, 3), np.nan), np.ones(1, dtype=bool)
+            half = system.n_systems//2
+            parts = [simulate_block(part, t_max, variable, rtol, atol, sample_dt) for part in (ln_k[:half], ln_k[half:])]
+            return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+        # The samples which were passed in this step
+        end = np.searchsorted(times, solver.t, side="right")
+        if end > i:
+            samples = solver.dense_output()(times[i:end])
+            for j in range(i, end):
+                features.update(times[j], system._unstack(samples[:,j-i])[idx])
+            i = end
+
+    return features.summary(), np.zeros(system.n_systems, dtype=bool)
+
+def sample_parameters(n, spread, rng):
+    """Draws n sets of ln(rate constants) uniformly within +-spread around the values in equations.py"""
+    return eq.network.ln_k + rng.uniform(-spread, spread, size=(n, len(eq.network.ln_k)))
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from scipy.integrate import solve_ivp
+    from scipy.signal import find_peaks
+
+    print("Running tests...")
+
+    # The peak times are refined between the samples, the period of a sampled sine is found much more precisely than the sampling step
+    features = OscillationFeatures(1)
+    for t in np.arange(0, 100, 0.5):
+        features.update(t, np.array([5*np.sin(2*np.pi*t/10.3)]))
+    period, amplitude, onset = features.summary()[0]
+    assert abs(period - 10.3) < 0.02 and abs(onset - 10.3/4) < 0.02
+    assert np.isclose(amplitude, 10/np.log(10), rtol=1e-2)
+
+    # Identical parameter sets in one block give identical features
+    features, failed = simulate_block(np.tile(eq.network.ln_k, (3, 1)), t_max=150., rtol=1e-6, atol=1e-6)
+    assert not np.any(failed) and np.all(~np.isnan(features))
+    assert np.allclose(features, features[0], rtol=1e-4)
+
+    # The period is the same as in the solution of solve.py (with the peaks found on a fine grid)
+    times = np.arange(0, 150, 0.005)
+    solution = solve_ivp(eq.conc_changes, (0, 150), eq.initial_concs, t_eval=times, method="BDF", jac=eq.jacobian, vectorized=True, rtol=1e-8, atol=1e-8)
+    peaks, _ = find_peaks(solution.y[eq.variables.index("X")], prominence=np.log(10))
+    assert np.isclose(features[0,0], np.median(np.diff(times[peaks[1:]])), rtol=2e-3)
+    # The first peak is very sharp, its time is only resolved to about the sampling step
+    assert abs(features[0,2] - times[peaks[0]]) < 0.1
+
+    print("All tests passed")
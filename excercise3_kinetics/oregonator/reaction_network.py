@@ -0,0 +1,220 @@
+# This module compiles a list of mass-action reactions into the rate equations and their analytic Jacobian
+# The reactions are written one per line as "A + Y -> X + P; k1", where k1 is the name of the rate constant
+
+import re
+
+import numpy as np
+from scipy import sparse
+
+TERM_REGEX = re.compile(r"^\s*(\d*)\s*([A-Za-z_]\w*)\s*$")
+
+def parse_side(text):
+    """Parses one side of the reaction (e.g. "2X + Y") into a dictionary {species: stoichiometric coefficient}"""
+    result = {}
+    text = text.strip()
+    if text in ("", "0"):
+        return result
+
+    for term in text.split("+"):
+        match = TERM_REGEX.match(term)
+        if match is None:
+            raise ValueError(f"Cannot parse '{term.strip()}' in '{text}'")
+        coeff = int(match.group(1)) if match.group(1) else 1
+        result[match.group(2)] = result.get(match.group(2), 0) + coeff
+    return result
+
+def parse_reactions(text):
+    """Parses the reactions into a list of (reactants, products, rate constant name), empty lines and comments (#) are skipped"""
+    reactions = []
+    for line in text.splitlines():
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+        if ";" not in line or "->" not in line:
+            raise ValueError(f"The reaction must be written as 'A + B -> C; k', not '{line}'")
+        equation, rate_constant = line.split(";")
+        reactants, products = equation.split("->")
+        reactions.append((parse_side(reactants), parse_side(products), rate_constant.strip()))
+    return reactions
+
+class ReactionNetwork:
+    """
+    Mass-action kinetics of the given reactions.
+    ln_k is a dictionary with the logarithms of the rate constants, species gives the order of the variables
+    (by default the order in which they first appear in the reactions).
+    The Jacobians are returned as sparse matrices if sparse_jacobian is True, dense arrays are faster for small networks.
+    """
+    def __init__(self, reactions, ln_k, species=None, sparse_jacobian=False):
+        self.sparse_jacobian = sparse_jacobian
+        parsed = parse_reactions(reactions)
+        if species is None:
+            species = []
+            for reactants, products, _ in parsed:
+                for name in [*reactants, *products]:
+                    if name not in species:
+                        species.append(name)
+        self.species = list(species)
+        self.rate_constant_names = [name for _, _, name in parsed]
+        self.ln_k = np.array([ln_k[name] for name in self.rate_constant_names], dtype=float)
+
+        # The reaction orders and the stoichiometry matrix [species, reaction]
+        n_species, n_reactions = len(self.species), len(parsed)
+        self.orders = np.zeros((n_species, n_reactions))
+        products = np.zeros((n_species, n_reactions))
+        for j, (reactants, prods, _) in enumerate(parsed):
+            for name, coeff in reactants.items():
+                self.orders[self.species.index(name), j] = coeff
+            for name, coeff in prods.items():
+                products[self.species.index(name), j] = coeff
+        self.stoichiometry = products - self.orders
+
+        # The non-zero entries of the stoichiometry matrix, only these are evaluated
+        self._rows, self._cols = np.nonzero(self.stoichiometry)
+        self._vals = self.stoichiometry[self._rows, self._cols]
+        self._scatter = sparse.csr_matrix((np.ones(len(self._rows)), (self._rows, np.arange(len(self._rows)))),
+                                          shape=(n_species, len(self._rows)))
+
+        # The Jacobian in log space: J_il = sum_j M_ij*(orders_lj - delta_il), where M_ij = S_ij*exp(ln_r_j - ln_c_i)
+        jac_rows, jac_cols, jac_entry, jac_coeff = [], [], [], []
+        for e, (i, j) in enumerate(zip(self._rows, self._cols)):
+            for l in np.nonzero(self.orders[:,j])[0]:
+                jac_rows.append(i)
+                jac_cols.append(l)
+                jac_entry.append(e)
+                jac_coeff.append(self.orders[l,j])
+            jac_rows.append(i)
+            jac_cols.append(i)
+            jac_entry.append(e)
+            jac_coeff.append(-1.)
+        self._jac_rows = np.array(jac_rows)
+        self._jac_cols = np.array(jac_cols)
+        self._jac_entry = np.array(jac_entry)
+        self._jac_coeff = np.array(jac_coeff)
+
+    def _broadcast_ln_k(self, ln_k, ndim):
+        """Returns the ln(rate constants) with the shape [reaction, 1, ...] so that they broadcast over the extra dimensions"""
+        ln_k = self.ln_k if ln_k is None else np.asarray(ln_k)
+        if ln_k.ndim == 1:
+            ln_k = ln_k.reshape(ln_k.shape + (1,)*(ndim-1))
+        return ln_k
+
+    def ln_rates(self, ln_c, ln_k=None):
+        """Returns ln(reaction rates) for the ln(concentrations) of shape [species, ...]"""
+        ln_c = np.asarray(ln_c)
+        return self._broadcast_ln_k(ln_k, ln_c.ndim) + np.tensordot(self.orders.T, ln_c, axes=1)
+
+    def rates(self, c, ln_k=None):
+        """Returns the reaction rates for the concentrations of shape [species, ...]"""
+        c = np.asarray(c, dtype=float)
+        orders = self.orders.reshape(self.orders.shape + (1,)*(c.ndim-1))
+        return np.exp(self._broadcast_ln_k(ln_k, c.ndim))*np.prod(c[:,None]**orders, axis=0)
+
+    def rhs(self, t, c, ln_k=None):
+        """Returns the derivatives of the concentrations, can be used with solve_ivp(..., vectorized=True)"""
+        return np.tensordot(self.stoichiometry, self.rates(c, ln_k), axes=1)
+
+    def jacobian(self, t, c, ln_k=None):
+        """Returns the Jacobian of rhs, J_il = d(dc_i/dt)/dc_l"""
+        c = np.asarray(c, dtype=float)
+        ln_k = self.ln_k if ln_k is None else np.asarray(ln_k)
+
+        # d(rate_j)/dc_l for all reactants l of reaction j
+        d_rates = np.zeros(self.orders.T.shape)
+        for j, l in zip(*np.nonzero(self.orders.T)):
+            orders = self.orders[:,j].copy()
+            orders[l] -= 1
+            d_rates[j,l] = self.orders[l,j]*np.exp(ln_k[j])*np.prod(c**orders)
+
+        jac = self.stoichiometry @ d_rates
+        return sparse.csc_matrix(jac) if self.sparse_jacobian else jac
+
+    def _log_terms(self, ln_c, ln_k):
+        """Returns S_ij*exp(ln_r_j - ln_c_i) for the non-zero entries of the stoichiometry matrix"""
+        ln_r = self.ln_rates(ln_c, ln_k)
+        return self._vals.reshape((-1,) + (1,)*(ln_r.ndim-1))*np.exp(ln_r[self._cols] - ln_c[self._rows])
+
+    def log_rhs(self, t, ln_c, ln_k=None):
+        """Returns the derivatives of ln(concentrations), can be used with solve_ivp(..., vectorized=True)"""
+        ln_c = np.asarray(ln_c)
+        terms = self._log_terms(ln_c, ln_k)
+        return self._scatter @ terms
+
+    def log_jacobian_entries(self, ln_c, ln_k=None):
+        """
+        Returns (rows, columns, values) of the entries of the Jacobian of log_rhs, duplicate entries must be summed.
+        For ln(concentrations) of shape [species, ...], the values have the shape [entry, ...].
+        """
+        ln_c = np.asarray(ln_c)
+        terms = self._log_terms(ln_c, ln_k)
+        data = terms[self._jac_entry]*self._jac_coeff.reshape((-1,) + (1,)*(ln_c.ndim-1))
+        return self._jac_rows, self._jac_cols, data
+
+    def log_jacobian(self, t, ln_c, ln_k=None):
+        """Returns the Jacobian of log_rhs, J_il = d(dln_c_i/dt)/dln_c_l"""
+        _, _, data = self.log_jacobian_entries(ln_c, ln_k)
+        n = len(self.species)
+        if self.sparse_jacobian:
+            return sparse.csc_matrix((data, (self._jac_rows, self._jac_cols)), shape=(n, n))
+        jac = np.zeros((n, n))
+        np.add.at(jac, (self._jac_rows, self._jac_cols), data)
+        return jac
+
+    def log_rate_constant_jacobian(self, t, ln_c, ln_k=None):
+        """Returns the derivatives of log_rhs with respect to ln(rate constants), d(dln_c_i/dt)/dln_k_j of shape [species, reaction, ...]"""
+        ln_c = np.asarray(ln_c)
+        terms = self._log_terms(ln_c, ln_k)
+        result = np.zeros(self.stoichiometry.shape + terms.shape[1:])
+        # ln_k_j enters only ln_r_j, so the derivative is the term of reaction j itself
+        result[self._rows, self._cols] = terms
+        return result
+
+    @property
+    def sparsity(self):
+        """The sparsity pattern of the Jacobian (the same in linear and log space)"""
+        n = len(self.species)
+        return sparse.csc_matrix((np.ones(len(self._jac_rows)), (self._jac_rows, self._jac_cols)), shape=(n, n)).astype(bool)
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    print("Running tests...")
+
+    assert parse_side("2X + Y") == {"X": 2, "Y": 1}
+    assert parse_side("X + X") == {"X": 2}
+    assert parse_side("0") == {}
+
+    network = ReactionNetwork("""
+        A + Y -> X + P; k1
+        2X -> Q; k2   # dimerization
+        X -> 0; k3
+    """, {"k1": np.log(2.), "k2": np.log(0.5), "k3": 0.})
+    assert network.species == ["A", "Y", "X", "P", "Q"]
+
+    c = np.array([0.3, 0.2, 0.7, 0.1, 0.4])
+    r = np.array([2*0.3*0.2, 0.5*0.7**2, 0.7])
+    assert np.allclose(network.rates(c), r)
+    assert np.allclose(network.rhs(0, c), [-r[0], -r[0], r[0]-2*r[1]-r[2], r[0], r[1]])
+
+    # The derivatives in log space
+    assert np.allclose(network.log_rhs(0, np.log(c)), network.rhs(0, c)/c)
+
+    # Vectorized evaluation
+    C = np.random.rand(5, 4)
+    assert np.allclose(network.rhs(0, C), np.array([network.rhs(0, C[:,i]) for i in range(4)]).T)
+    assert np.allclose(network.log_rhs(0, np.log(C)), network.rhs(0, C)/C)
+
+    # The analytic Jacobians match finite differences
+    eps = 1e-7
+    for fun, jac, x in [(network.rhs, network.jacobian, c), (network.log_rhs, network.log_jacobian, np.log(c))]:
+        numerical = np.array([(fun(0, x + eps*np.eye(5)[l]) - fun(0, x - eps*np.eye(5)[l]))/(2*eps) for l in range(5)]).T
+        assert np.allclose(jac(0, x), numerical, atol=1e-6)
+        assert np.all(network.sparsity.toarray() | (numerical == 0))
+
+    numerical_k = np.array([(network.log_rhs(0, np.log(c), network.ln_k + eps*np.eye(3)[j]) -
+                             network.log_rhs(0, np.log(c), network.ln_k - eps*np.eye(3)[j]))/(2*eps) for j in range(3)]).T
+    assert np.allclose(network.log_rate_constant_jacobian(0, np.log(c)), numerical_k, atol=1e-6)
+
+    network.sparse_jacobian = True
+    assert np.allclose(network.log_jacobian(0, np.log(c)).toarray(), numerical, atol=1e-6)
+
+    print("All tests passed")
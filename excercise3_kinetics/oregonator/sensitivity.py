@@ -0,0 +1,127 @@
+# This module calculates the sensitivities of the concentrations to the rate constants by the forward sensitivity method
+# Because the equations are integrated in log space, the sensitivities s_ij = dln[c_i]/dln(k_j) are the relative sensitivities
+# (the percentual change of the concentration for a 1% change of the rate constant), d[c_i]/dln(k_j) = [c_i]*s_ij.
+# They follow the equations ds_j/dt = J*s_j + df/dln(k_j), which are integrated together with the concentrations.
+
+import numpy as np
+from scipy import sparse
+from scipy.integrate import solve_ivp, BDF
+
+class SensitivitySystem:
+    """
+    The ln(concentrations) together with their sensitivities to the ln(rate constants) of the network.
+    The state vector is [ln_c, s_1, s_2, ..., s_n], where s_j = dln_c/dln(k_j).
+    """
+    def __init__(self, network, ln_k=None):
+        self.network = network
+        self.ln_k = network.ln_k if ln_k is None else np.asarray(ln_k)
+        self.n_species = len(network.species)
+        self.n_params = len(self.ln_k)
+
+    def initial_state(self, ln_c0):
+        """The initial concentrations do not depend on the rate constants, so the initial sensitivities are zero"""
+        return np.concatenate([ln_c0, np.zeros(self.n_species*self.n_params)])
+
+    def split(self, y):
+        """Returns ln_c [species, ...] and the sensitivities [species, reaction, ...] from the state vector(s)"""
+        y = np.asarray(y)
+        ln_c = y[:self.n_species]
+        sens = y[self.n_species:].reshape((self.n_params, self.n_species) + y.shape[1:])
+        return ln_c, np.swapaxes(sens, 0, 1)
+
+    def rhs(self, t, y):
+        ln_c, sens = self.split(y)
+        jac = self.network.log_jacobian(t, ln_c, self.ln_k)
+        d_sens = jac @ sens + self.network.log_rate_constant_jacobian(t, ln_c, self.ln_k)
+        return np.concatenate([self.network.log_rhs(t, ln_c, self.ln_k), d_sens.T.ravel()])
+
+    def jacobian(self, t, y):
+        """
+        The Jacobian of the state repeated on the diagonal for each sensitivity. The coupling of the sensitivities to the state
+        is neglected, so the Newton iterations of the sensitivities use the same matrix as the state (simultaneous corrector).
+        This changes only the convergence of the iterations, not the solution.
+        """
+        ln_c, _ = self.split(y)
+        jac = self.network.log_jacobian(t, ln_c, self.ln_k)
+        if sparse.issparse(jac):
+            return sparse.kron(sparse.identity(self.n_params+1), jac, format="csc")
+        return np.kron(np.eye(self.n_params+1), jac)
+
+class SharedFactorizationBDF(BDF):
+    """
+    BDF for systems whose Newton matrix is block-diagonal with identical blocks of block_size (see SensitivitySystem.jacobian).
+    Only the first block is factorized and its LU decomposition is used to solve all the blocks at once,
+    so the sensitivities do not make the factorization more expensive.
+    The factorization is replaced through the private lu and solve_lu attributes of scipy's BDF (present since scipy 1.0,
+    tested with scipy 1.17). If they are missing or block_size is None, the whole Newton matrix is factorized as in plain BDF.
+    """
+    def __init__(self, fun, t0, y0, t_bound, block_size=None, **options):
+        super().__init__(fun, t0, y0, t_bound, **options)
+        if block_size is None or not (hasattr(self, "lu") and hasattr(self, "solve_lu")):
+            return
+        n = block_size
+        lu, solve_lu = self.lu, self.solve_lu
+        self.lu = lambda A: lu(A[:n,:n])
+        self.solve_lu = lambda LU, b: solve_lu(LU, b.reshape(-1, n).T).T.ravel()
+
+def solve_sensitivities(network, ln_c0, times, ln_k=None, sensitivity_atol=0.1, **options):
+    """
+    Integrates the ln(concentrations) and their sensitivities, the options are passed to solve_ivp (method BDF by default).
+    With BDF, the factorization of the Newton matrix of the concentrations is shared by the sensitivities (see SharedFactorizationBDF).
+    The sensitivities of an oscillating system are very large around the peaks (the peaks shift in time), so they have
+    their own absolute tolerance sensitivity_atol, otherwise the step size would be controlled by the sensitivities.
+    Returns ln_c [species, time] and the sensitivities dln_c/dln(k) [species, reaction, time], or raises an error if the integration fails.
+    """
+    system = SensitivitySystem(network, ln_k)
+    options.setdefault("method", "BDF")
+    if options["method"] == "BDF":
+        options["method"] = SharedFactorizationBDF
+        options.setdefault("block_size", system.n_species)
+    atol = np.broadcast_to(options.pop("atol", 1e-6), (system.n_species,))
+    options["atol"] = np.concatenate([atol, np.full(system.n_species*system.n_params, sensitivity_atol)])
+
+    solution = solve_ivp(system.rhs, (times[0], times[-1]), system.initial_state(ln_c0), t_eval=times, jac=system.jacobian, **options)
+    if not solution.success:
+        raise RuntimeError(solution.message)
+    return system.split(solution.y)
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from reaction_network import ReactionNetwork
+
+    print("Running tests...")
+
+    network = ReactionNetwork("""
+        A + B -> C; k1
+        2C -> D;    k2
+        D -> A + B; k3
+    """, {"k1": np.log(3.), "k2": np.log(0.5), "k3": np.log(0.2)})
+    ln_c0 = np.log([1., 0.5, 1e-3, 1e-3])
+    times = np.linspace(0, 5, 11)
+    options = {"rtol": 1e-10, "atol": 1e-12}
+
+    ln_c, sens = solve_sensitivities(network, ln_c0, times, sensitivity_atol=1e-12, **options)
+    assert sens.shape == (4, 3, 11)
+    assert np.all(sens[:,:,0] == 0)
+
+    # The concentrations are the same as without the sensitivities
+    reference = solve_ivp(network.log_rhs, (0, 5), ln_c0, t_eval=times, method="BDF", jac=network.log_jacobian, **options)
+    assert np.allclose(ln_c, reference.y, atol=1e-7)
+
+    # The sensitivities match finite differences
+    eps = 1e-4
+    for j in range(3):
+        shifted = [solve_ivp(network.log_rhs, (0, 5), ln_c0, t_eval=times, method="BDF", jac=network.log_jacobian,
+                             args=(network.ln_k + sign*eps*np.eye(3)[j],), **options).y for sign in (1, -1)]
+        assert np.allclose(sens[:,j], (shifted[0]-shifted[1])/(2*eps), atol=1e-5)
+
+    # Sharing the factorization gives the same result as factorizing the whole block-diagonal Newton matrix
+    _, full_sens = solve_sensitivities(network, ln_c0, times, sensitivity_atol=1e-12, method=BDF, **options)
+    assert np.allclose(full_sens, sens, atol=1e-7)
+
+    # The sparse Jacobian gives the same result
+    network.sparse_jacobian = True
+    _, sparse_sens = solve_sensitivities(network, ln_c0, times, sensitivity_atol=1e-12, **options)
+    assert np.allclose(sparse_sens, sens, atol=1e-7)
+
+    print("All tests passed")
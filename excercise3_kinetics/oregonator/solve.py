@@ -1,14 +1,20 @@
 # This script calculates the numerical solution to the oregonator equations specified in equations.py
-# Run using: python solve.py
+# Run using: python solve.py [--sensitivity, optional]
+#   --sensitivity - also calculate and plot the relative sensitivities dln[c]/dln(k) of all species to the rate constants (see sensitivity.py)
 
 # The concentrations as their logarithm to make the integration more stable
+# The analytic Jacobian generated from the reactions is used by the implicit integrator
 
 import numpy as np
 from scipy.integrate import solve_ivp
 from matplotlib import pyplot as plt
 from datetime import datetime
+from sys import argv
 
 import equations as eq
+from sensitivity import solve_sensitivities
+
+SENSITIVITY = "--sensitivity" in argv[1:]
 
 # Specify the timepoints
 TIME = np.linspace(0,300,1500)
@@ -17,18 +23,29 @@ TIME = np.linspace(0,300,1500)
 print("Solving equations...")
 start = datetime.now()
 
-solution = solve_ivp(eq.conc_changes, (TIME[0],TIME[-1]), eq.initial_concs, t_eval=TIME, method='BDF', vectorized=True, rtol=1e-3, atol=1e-3)
+if SENSITIVITY:
+    # The sensitivities are integrated together with the concentrations, sharing the steps and the Jacobian
+    try:
+        ln_c, sensitivities = solve_sensitivities(eq.network, eq.initial_concs, TIME, rtol=1e-3, atol=1e-3)
+    except RuntimeError as ex:
+        print(ex)
+        print("ERROR: The integration was not successful")
+        exit()
+    print("Finished in", datetime.now()-start)
+    solution = np.exp(ln_c)
+else:
+    solution = solve_ivp(eq.conc_changes, (TIME[0],TIME[-1]), eq.initial_concs, t_eval=TIME, method='BDF', jac=eq.jacobian, vectorized=True, rtol=1e-3, atol=1e-3)
 
-print("Finished in", datetime.now()-start)
-print(solution.message)
+    print("Finished in", datetime.now()-start)
+    print(solution.message)
 
-# Check the integration was successful
-if not solution.success:
-    print("ERROR: The integration was not successful")
-    exit()
+    # Check the integration was successful
+    if not solution.success:
+        print("ERROR: The integration was not successful")
+        exit()
 
-# Convert the concentrations from ln(conc) to conc
-solution = np.exp(solution.y)
+    # Convert the concentrations from ln(conc) to conc
+    solution = np.exp(solution.y)
 
 # Plot the results
 for i in range(len(solution)):
@@ -40,4 +57,15 @@ plt.xlabel("Time [s]")
 plt.ylabel("Concentration [M]")
 
 plt.legend()
-plt.show()
\ No newline at end of file
+
+# Plot the sensitivities of each species to the rate constants
+if SENSITIVITY:
+    fig, axes = plt.subplots(len(eq.variables), 1, sharex=True, figsize=(8, 2*len(eq.variables)))
+    for i, ax in enumerate(axes):
+        for j, name in enumerate(eq.network.rate_constant_names):
+            ax.plot(TIME, sensitivities[i,j], label=name)
+        ax.set_ylabel(f"dln[{eq.variables[i]}]/dln(k)")
+    axes[0].legend(ncol=len(eq.network.rate_constant_names))
+    axes[-1].set_xlabel("Time [s]")
+
+plt.show()
@@ -0,0 +1,85 @@
+# This script simulates the Oregonator in a small volume, where the numbers of molecules are small and the kinetics is stochastic
+# Run using: python stochastic.py [volume] [number of realizations] [--ssa, --eps=, --t-max=, --frames=, --seed=, --save=, optional]
+#   [volume] - the volume in femtolitres (1 fL = 1e-15 L)
+#   [number of realizations] - the number of independent trajectories
+#   --ssa - use the exact stochastic simulation algorithm (Gillespie) instead of tau-leaping, very slow for large volumes
+#   --eps=[number] - the accuracy of tau-leaping, the largest allowed relative change of the propensities in one leap (default 0.03)
+#   --t-max=[number] - the simulated time in seconds (default 300)
+#   --frames=[number] - the number of saved timepoints (default 1500)
+#   --seed=[number] - seed of the random number generator
+#   --save=[file.npz] - save the times and the numbers of molecules of all species
+#
+# All the realizations are simulated together, the numbers of molecules are stored as arrays [species, realization].
+# Every realization has its own time, and in each iteration all unfinished realizations make one step (an event or a leap).
+
+import numpy as np
+
+from stochastic_network import StochasticNetwork
+
+
+if __name__ == "__main__":
+    from matplotlib import pyplot as plt
+    from datetime import datetime
+    from sys import argv
+
+    import equations as eq
+
+    USAGE = "Use: python stochastic.py [volume] [number of realizations] [--ssa, --eps=, --t-max=, --frames=, --seed=, --save=, optional]"
+
+    FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+    argv = [arg for arg in argv if not arg.startswith("--")]
+
+    if len(argv) != 3:
+        print("ERROR: Incorrect number of arguments")
+        print(USAGE)
+        exit()
+
+    try:
+        VOLUME = float(argv[1])*1e-15
+        N_REALIZATIONS = int(argv[2])
+    except:
+        print("ERROR: Could not parse the volume and the number of realizations")
+        print(USAGE)
+        exit()
+
+    EPS, T_MAX, N_FRAMES, SEED, SAVE = 0.03, 300., 1500, None, None
+    for flag in FLAGS:
+        try:
+            if flag.startswith("--eps="):
+                EPS = float(flag[6:])
+            elif flag.startswith("--t-max="):
+                T_MAX = float(flag[8:])
+            elif flag.startswith("--frames="):
+                N_FRAMES = int(flag[9:])
+            elif flag.startswith("--seed="):
+                SEED = int(flag[7:])
+            elif flag.startswith("--save="):
+                SAVE = flag[7:]
+        except:
+            print(f"ERROR: Could not parse {flag}")
+            exit()
+
+    TIME = np.linspace(0, T_MAX, N_FRAMES)
+    system = StochasticNetwork(eq.network, VOLUME)
+    counts0 = system.to_counts(np.exp(eq.initial_concs))
+
+    print(f"Simulating {N_REALIZATIONS} realizations...")
+    start = datetime.now()
+    counts = system.simulate(counts0, TIME, N_REALIZATIONS, np.random.default_rng(SEED), tau_leaping="--ssa" not in FLAGS, eps=EPS)
+    print("Finished in", datetime.now()-start)
+
+    if SAVE is not None:
+        np.savez_compressed(SAVE, time=TIME, counts=counts, species=eq.variables, volume=VOLUME)
+        print(f"Results saved to {SAVE}")
+
+    # Plot the median and the 10-90% range of [X], with a few individual trajectories
+    conc = system.to_concs(counts[:, eq.variables.index("X")])
+    for i in range(min(3, N_REALIZATIONS)):
+        plt.semilogy(TIME, conc[:,i], lw=0.5)
+    plt.fill_between(TIME, *np.percentile(conc, [10, 90], axis=1), color="gray", alpha=0.3, label="10-90%")
+    plt.semilogy(TIME, np.median(conc, axis=1), "k", label="median")
+
+    plt.xlabel("Time [s]")
+    plt.ylabel("[X] [M]")
+    plt.legend()
+    plt.show()
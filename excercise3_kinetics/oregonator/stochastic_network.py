@@ -0,0 +1,186 @@
+# This module simulates reaction networks with small numbers of molecules, where the kinetics is stochastic
+# The exact stochastic simulation algorithm (Gillespie) and adaptive tau-leaping are implemented for many realizations at once,
+# the numbers of molecules are stored as arrays [species, realization] and every realization has its own time.
+
+import numpy as np
+
+N_A = 6.02214076e23
+
+class StochasticNetwork:
+    """
+    Stochastic mass-action kinetics of the reaction network in the given volume (in litres).
+    The propensity of reaction j is a_j = k_j*(N_A*V)^(1-order_j)*prod_i n_i*(n_i-1)*...*(n_i-orders_ij+1),
+    so that the mean agrees with the deterministic rate equations for large numbers of molecules.
+    """
+    def __init__(self, network, volume, ln_k=None):
+        self.network = network
+        self.volume = volume
+        self.species = network.species
+        self.stoichiometry = network.stoichiometry.astype(np.int64)
+        self.orders = network.orders.astype(np.int64)
+
+        ln_k = network.ln_k if ln_k is None else np.asarray(ln_k)
+        total_orders = self.orders.sum(axis=0)
+        self.ln_c = ln_k + (1-total_orders)*np.log(N_A*volume)
+        self.c = np.exp(self.ln_c)
+
+        # The factors n_i-k of the propensities as (reaction, species, k)
+        self._factors = [(j, i, k) for j in range(self.orders.shape[1]) for i in np.nonzero(self.orders[:,j])[0] for k in range(self.orders[i,j])]
+        # The reactions in which each species is a reactant as (orders_ij, order_j), used for the selection of the leaps
+        self._reactant = [[(self.orders[i,j], total_orders[j]) for j in np.nonzero(self.orders[i])[0]] for i in range(len(self.species))]
+
+    def to_counts(self, conc):
+        """Converts the concentrations [M] to the (rounded) numbers of molecules"""
+        return np.round(np.asarray(conc)*N_A*self.volume).astype(np.int64)
+
+    def to_concs(self, counts):
+        """Converts the numbers of molecules to the concentrations [M]"""
+        return np.asarray(counts)/(N_A*self.volume)
+
+    def propensities(self, counts):
+        """Returns the propensities [reaction, realization] for the numbers of molecules [species, realization]"""
+        a = np.repeat(self.c[:,None], counts.shape[1], axis=1)
+        for j, i, k in self._factors:
+            a[j] *= np.maximum(counts[i]-k, 0)
+        return a
+
+    def leap_size(self, counts, a, eps):
+        """
+        Returns the largest leap for each realization for which the propensities change by less than eps (relatively),
+        see Cao, Gillespie and Petzold (2006), J. Chem. Phys. 124, 044109
+        """
+        tau = np.full(counts.shape[1], np.inf)
+        mean = self.stoichiometry @ a
+        variance = (self.stoichiometry**2) @ a
+        for i, reactions in enumerate(self._reactant):
+            if len(reactions) == 0:
+                continue
+            # g_i = max_j order_j/orders_ij*(orders_ij + sum_k k/(n_i-k))
+            n = counts[i].astype(float)
+            g = 0.
+            for nu, order in reactions:
+                g_j = nu + sum(k/np.maximum(n-k, 1) for k in range(1, nu))
+                g = np.maximum(g, order/nu*g_j)
+            bound = np.maximum(eps*n/g, 1)
+            with np.errstate(divide="ignore"):
+                tau = np.minimum(tau, np.minimum(bound/np.abs(mean[i]), bound**2/variance[i]))
+        return tau
+
+    def simulate(self, counts0, times, n_realizations, rng, tau_leaping=True, eps=0.03, exact_threshold=10., record=None):
+        """
+        Simulates n_realizations trajectories starting from the numbers of molecules counts0 [species].
+        With tau_leaping, the leaps are used whenever they are longer than exact_threshold times the mean time between the events,
+        otherwise single events are simulated exactly (SSA). The leaps also end at the saved timepoints.
+        record is a list of the saved species (all by default).
+        Returns the numbers of molecules at the given times [time, species, realization]
+        """
+        record = np.arange(len(self.species)) if record is None else np.array([self.species.index(s) for s in record])
+        times = np.asarray(times, dtype=float)
+        t_end = times[-1]
+
+        counts = np.repeat(np.asarray(counts0, dtype=np.int64)[:,None], n_realizations, axis=1)
+        t = np.full(n_realizations, times[0])
+        next_frame = np.zeros(n_realizations, dtype=int)
+        scale = np.ones(n_realizations)
+        result = np.empty((len(times), len(record), n_realizations), dtype=np.int64)
+
+        active = np.arange(n_realizations)
+        while len(active) > 0:
+            n = counts[:,active]
+            a = self.propensities(n)
+            a0 = a.sum(axis=0)
+
+            # The time of the next event for the exact steps
+            with np.errstate(divide="ignore"):
+                t_new = t[active] + rng.exponential(1., len(active))/a0
+            exact = np.ones(len(active), dtype=bool)
+
+            if tau_leaping:
+                tau = self.leap_size(n, a, eps)*scale[active]
+                with np.errstate(divide="ignore"):
+                    exact = tau < exact_threshold/a0
+                # The leaps end at the next saved timepoint at the latest
+                next_time = times[np.minimum(np.searchsorted(times, t[active], side="right"), len(times)-1)]
+                t_new = np.where(exact, t_new, np.minimum(t[active] + tau, next_time))
+
+            # Save the frames before the step (the numbers of molecules are constant between the events)
+            while True:
+                frame = next_frame[active]
+                save = (frame < len(times)) & (times[np.minimum(frame, len(times)-1)] < np.minimum(t_new, np.nextafter(t_end, np.inf)))
+                if not np.any(save):
+                    break
+                result[frame[save], :, active[save]] = counts[record][:, active[save]].T
+                next_frame[active[save]] += 1
+
+            # The realizations which passed the end
+            finished = t_new > t_end
+            changes = np.zeros(n.shape, dtype=np.int64)
+
+            # Exact steps, the reaction is chosen with the probability a_j/a0
+            step = exact & ~finished
+            if np.any(step):
+                cumulative = np.cumsum(a[:,step], axis=0)
+                u = rng.random(np.sum(step))*a0[step]
+                reaction = np.minimum(np.sum(cumulative < u, axis=0), a.shape[0]-1)
+                changes[:,step] = self.stoichiometry[:,reaction]
+
+            # Leaps, the numbers of firings are Poisson-distributed
+            leap = ~exact & ~finished
+            if np.any(leap):
+                firings = rng.poisson(a[:,leap]*(t_new[leap]-t[active[leap]]))
+                changes[:,leap] = self.stoichiometry @ firings
+
+                # Leaps which would make the number of molecules negative are rejected and repeated with a halved length
+                rejected = np.zeros(len(active), dtype=bool)
+                rejected[leap] = np.any(n[:,leap] + changes[:,leap] < 0, axis=0)
+                changes[:,rejected] = 0
+                t_new[rejected] = t[active[rejected]]
+                scale[active[rejected]] *= 0.5
+                scale[active[leap & ~rejected]] = 1.
+
+            counts[:,active] = n + changes
+            t[active] = np.where(finished, t_end, t_new)
+
+            # The leaps which ended exactly at the end save the last frames after the leap
+            for i in active[~finished & (t_new >= t_end)]:
+                result[next_frame[i]:, :, i] = counts[record, i]
+                next_frame[i] = len(times)
+            active = active[t[active] < t_end]
+
+        return result
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from scipy.integrate import solve_ivp
+    from reaction_network import ReactionNetwork
+
+    print("Running tests...")
+
+    # Reversible dimerization, the mean of the realizations follows the rate equations when the numbers of molecules are large
+    network = ReactionNetwork("""
+        A + B -> C; k1
+        C -> A + B; k2
+    """, {"k1": np.log(1e6), "k2": np.log(0.5)})
+    system = StochasticNetwork(network, 1e-15)
+    conc0 = np.array([2e-6, 1e-6, 0.])
+    counts0 = system.to_counts(conc0)
+    assert np.all(counts0 == [1204, 602, 0])
+
+    times = np.linspace(0, 3, 7)
+    reference = solve_ivp(network.rhs, (0, 3), conc0, t_eval=times, method="LSODA", rtol=1e-10, atol=1e-14).y
+    for tau_leaping in (False, True):
+        counts = system.simulate(counts0, times, 200, np.random.default_rng(0), tau_leaping=tau_leaping)
+        assert counts.shape == (7, 3, 200) and np.all(counts[0] == counts0[:,None])
+        # Conservation of A + C and B + C
+        assert np.all(counts[:,0] + counts[:,2] == counts0[0]) and np.all(counts[:,1] + counts[:,2] == counts0[1])
+        # The error of the mean is a few standard errors
+        mean = system.to_concs(counts.mean(axis=2)).T
+        error = system.to_concs(counts.std(axis=2)/np.sqrt(200)).T
+        assert np.all(np.abs(mean - reference) <= 4*error + 1e-9)
+
+        # The same seed gives the same realizations
+        again = system.simulate(counts0, times, 200, np.random.default_rng(0), tau_leaping=tau_leaping)
+        assert np.array_equal(counts, again)
+
+    print("All tests passed")
@@ -0,0 +1,84 @@
+# This script explores how the oscillations of the Oregonator depend on the rate constants
+# Run using: python sweep.py [number of parameter sets] [output file] [--spread=, --workers=, --block=, --t-max=, --seed=, optional]
+#   [number of parameter sets] - how many random sets of rate constants are simulated
+#   [output file] - .csv file where the rate constants and the features of the oscillations are saved
+#   --spread=[number] - ln(k) of each reaction is drawn uniformly within +-spread around the value in equations.py (default 0.5)
+#   --workers=[number] - number of worker processes (all cores by default)
+#   --block=[number] - number of systems which are integrated together (default 50)
+#   --t-max=[number] - the simulated time in seconds (default 300)
+#   --seed=[number] - seed of the random number generator
+#
+# The independent systems in a block are stacked into one large system with a block-diagonal sparse Jacobian.
+# Instead of saving the trajectories, each run is reduced on the fly to the period, amplitude and onset of the oscillations in [X].
+# The systems for which the integration fails are marked in the failed column, they are not counted as not oscillating.
+
+import numpy as np
+
+from multiprocessing import Pool
+from datetime import datetime
+from sys import argv
+
+import equations as eq
+from ensemble import simulate_block, sample_parameters
+
+
+if __name__ == "__main__":
+    USAGE = "Use: python sweep.py [number of parameter sets] [output file] [--spread=, --workers=, --block=, --t-max=, --seed=, optional]"
+
+    FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+    argv = [arg for arg in argv if not arg.startswith("--")]
+
+    if len(argv) != 3:
+        print("ERROR: Incorrect number of arguments")
+        print(USAGE)
+        exit()
+
+    try:
+        N_SETS = int(argv[1])
+    except:
+        print(f"ERROR: Could not parse the number of parameter sets '{argv[1]}'")
+        print(USAGE)
+        exit()
+
+    FILENAME = argv[2]
+    if not FILENAME.endswith(".csv"):
+        print(f"ERROR: the output file must be .csv, not {FILENAME}")
+        print(USAGE)
+        exit()
+
+    SPREAD, WORKERS, BLOCK, T_MAX, SEED = 0.5, None, 50, 300., None
+    for flag in FLAGS:
+        try:
+            if flag.startswith("--spread="):
+                SPREAD = float(flag[9:])
+            elif flag.startswith("--workers="):
+                WORKERS = int(flag[10:])
+            elif flag.startswith("--block="):
+                BLOCK = int(flag[8:])
+            elif flag.startswith("--t-max="):
+                T_MAX = float(flag[8:])
+            elif flag.startswith("--seed="):
+                SEED = int(flag[7:])
+        except:
+            print(f"ERROR: Could not parse {flag}")
+            exit()
+
+    ln_k = sample_parameters(N_SETS, SPREAD, np.random.default_rng(SEED))
+    blocks = [ln_k[i:i+BLOCK] for i in range(0, N_SETS, BLOCK)]
+
+    print(f"Simulating {N_SETS} parameter sets...")
+    start = datetime.now()
+
+    with Pool(WORKERS) as pool:
+        results = pool.starmap(simulate_block, [(block, T_MAX) for block in blocks])
+    features = np.concatenate([r[0] for r in results])
+    failed = np.concatenate([r[1] for r in results])
+
+    print("Finished in", datetime.now()-start)
+    print(f"{np.sum(~np.isnan(features[:,0]))} of {N_SETS} parameter sets oscillate")
+    if np.any(failed):
+        print(f"WARNING: The integration failed for {np.sum(failed)} parameter sets, they are marked in the failed column")
+
+    header = ";".join([f"ln_{name}" for name in eq.network.rate_constant_names] + ["period", "amplitude", "onset", "failed"])
+    np.savetxt(FILENAME, np.concatenate([ln_k, features, failed[:,None]], axis=1), delimiter=";", header=header, comments="")
+    print(f"Results saved to {FILENAME}")
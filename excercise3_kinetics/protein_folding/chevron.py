@@ -0,0 +1,78 @@
+# This script calculates the chevron plot (the observed relaxation rates at different urea concentrations)
+# and fits the rate constants and their urea dependence to the measured equilibrium and kinetic data
+# Run using: python chevron.py [equilibrium data] [kinetic data] (the data files are optional, without them the chevron plot of constants.py is shown)
+#   [equilibrium data] - .csv file with the columns urea;state;fraction, e.g. 2.5;N;0.93
+#   [kinetic data] - .csv file with the columns urea;phase;rate, where phase 1 is the slowest relaxation, e.g. 2.5;1;0.0123
+#
+# The relaxation rates are the (negative) non-zero eigenvalues of the rate matrix, see linear_kinetics.py.
+# The equilibrium and the kinetic data are fitted together (global fit) by least squares with analytic derivatives.
+
+import numpy as np
+
+import constants as const
+from linear_kinetics import LinearKinetics
+from chevron_fit import relaxation_rates, ChevronFit
+
+
+def read_data(filename):
+    """Reads the columns urea;label;value from the .csv file, the first line is a header"""
+    urea, labels, values = [], [], []
+    with open(filename, "r") as f:
+        for line in f.readlines()[1:]:
+            if not line.strip():
+                continue
+            u, label, value = line.strip().split(";")
+            urea.append(float(u))
+            labels.append(label.strip())
+            values.append(float(value))
+    return np.array(urea), labels, np.array(values)
+
+
+if __name__ == "__main__":
+    from matplotlib import pyplot as plt
+    from datetime import datetime
+    from sys import argv
+
+    scheme = LinearKinetics(const.states, const.transitions, const.rate_const, const.urea_coeff)
+    UREA_CONCENTRATIONS = np.linspace(0,10,500)
+
+    if len(argv) == 3:
+        eq_urea, eq_state, eq_fraction = read_data(argv[1])
+        kin_urea, kin_phase, kin_rate = read_data(argv[2])
+
+        print("Fitting...")
+        start = datetime.now()
+        model = ChevronFit(scheme, eq_urea, eq_state, eq_fraction, kin_urea, [int(p) for p in kin_phase], kin_rate)
+        result = model.fit()
+        print("Finished in", datetime.now()-start)
+        print(result.message)
+
+        ln_k0, urea_coeff = model.split(result.x)
+        for name, ln_k, m in zip(scheme.rate_constant_names, ln_k0, urea_coeff):
+            print(f"{name}: rate_const = {np.exp(ln_k):.4g}, urea_coeff = {m:.3f}")
+        scheme.ln_k0, scheme.urea_coeff = ln_k0, urea_coeff
+    elif len(argv) != 1:
+        print("ERROR: Incorrect number of arguments")
+        print("Use: python chevron.py [equilibrium data] [kinetic data] (optional)")
+        exit()
+
+    rates = relaxation_rates(scheme, UREA_CONCENTRATIONS)
+    p = scheme.equilibrium(UREA_CONCENTRATIONS)
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 4))
+    for i in range(rates.shape[1]):
+        ax1.semilogy(UREA_CONCENTRATIONS, rates[:,i], label=f"phase {i+1}")
+    for i, state in enumerate(scheme.states):
+        ax2.plot(UREA_CONCENTRATIONS, p[:,i], label=state)
+
+    if len(argv) == 3:
+        ax1.semilogy(kin_urea, kin_rate, "k.", ms=2)
+        ax2.plot(eq_urea, eq_fraction, "k.", ms=2)
+
+    ax1.set_xlabel("Urea concentration [M]")
+    ax1.set_ylabel("Relaxation rate [1/s]")
+    ax2.set_xlabel("Urea concentration [M]")
+    ax2.set_ylabel("Fractional composition")
+    ax1.legend()
+    ax2.legend()
+    plt.show()
@@ -0,0 +1,145 @@
+# This module calculates the relaxation rates of first-order kinetic schemes (the chevron plot) and their derivatives,
+# and fits the rate constants and their urea dependence to the measured equilibrium and kinetic data (global fit)
+# The relaxation rates are the (negative) non-zero eigenvalues of the rate matrix, see linear_kinetics.py.
+
+import numpy as np
+from scipy.optimize import least_squares
+
+
+def relaxation_rates(scheme, urea_conc, ln_k=None, derivatives=False):
+    """
+    Returns the relaxation rates [..., n-1] sorted from the slowest, and optionally also their derivatives
+    with respect to ln(rate constants) [..., n-1, transition]. For the eigenvalue lambda_i with left and right eigenvectors
+    w_i and v_i (w_i^T*v_i = 1), d(lambda_i)/d(ln k_t) = k_t*w_i^T*basis_t*v_i
+    """
+    if ln_k is None:
+        ln_k = scheme.ln_rate_constants(urea_conc)
+    eigenvalues, V, W = scheme.eigen(urea_conc, ln_k)
+    rates = -eigenvalues[...,1:].real
+    if not derivatives:
+        return rates
+
+    d_rates = -np.einsum("...in,tij,...jn->...nt", W[...,1:], scheme.basis, V[...,1:]).real*np.exp(ln_k)[...,None,:]
+    return rates, d_rates
+
+def equilibrium_derivatives(scheme, urea_conc, ln_k=None):
+    """
+    Returns the equilibrium populations [..., n] and their derivatives with respect to ln(rate constants) [..., n, transition].
+    Differentiating K*p = 0 and sum(p) = 1 gives K*dp = -dK*p and sum(dp) = 0, which are solved the same way as the equilibrium.
+    """
+    if ln_k is None:
+        ln_k = scheme.ln_rate_constants(urea_conc)
+    p = scheme.equilibrium(urea_conc, ln_k)
+
+    K = scheme.rate_matrix(urea_conc, ln_k)
+    K[...,-1,:] = 1.
+    rhs = -np.einsum("tij,...j->...it", scheme.basis, p)*np.exp(ln_k)[...,None,:]
+    rhs[...,-1,:] = 0.
+    return p, np.linalg.solve(K, rhs)
+
+class ChevronFit:
+    """
+    Global least-squares fit of ln(rate constants) and urea coefficients to the equilibrium fractions and the relaxation rates.
+    The equilibrium residuals are (fraction - measured)/eq_sigma, the kinetic residuals are (ln(rate) - ln(measured))/kin_sigma.
+    The parameters are [ln(rate_const) of each transition, urea_coeff of each transition].
+    """
+    def __init__(self, scheme, eq_urea, eq_state, eq_fraction, kin_urea, kin_phase, kin_rate, eq_sigma=0.02, kin_sigma=0.1):
+        self.scheme = scheme
+        self.eq_urea = np.asarray(eq_urea, dtype=float)
+        self.eq_state = np.array([scheme.states.index(s) for s in eq_state], dtype=int)
+        self.eq_fraction = np.asarray(eq_fraction, dtype=float)
+        self.kin_urea = np.asarray(kin_urea, dtype=float)
+        self.kin_phase = np.asarray(kin_phase, dtype=int) - 1
+        self.ln_kin_rate = np.log(kin_rate)
+        self.eq_sigma = eq_sigma
+        self.kin_sigma = kin_sigma
+
+    def split(self, params):
+        """Returns ln(rate_const) and urea_coeff from the parameters"""
+        n = len(self.scheme.ln_k0)
+        return params[:n], params[n:]
+
+    def _ln_k(self, params, urea_conc):
+        ln_k0, urea_coeff = self.split(params)
+        return ln_k0 + urea_coeff*urea_conc[:,None]
+
+    def residuals(self, params):
+        p = self.scheme.equilibrium(self.eq_urea, self._ln_k(params, self.eq_urea))
+        rates = relaxation_rates(self.scheme, self.kin_urea, self._ln_k(params, self.kin_urea))
+        eq = (p[np.arange(len(p)), self.eq_state] - self.eq_fraction)/self.eq_sigma
+        kin = (np.log(rates[np.arange(len(rates)), self.kin_phase]) - self.ln_kin_rate)/self.kin_sigma
+        return np.concatenate([eq, kin])
+
+    def jacobian(self, params):
+        """The derivatives with respect to ln(k) are multiplied by 1 for ln(rate_const) and by [urea] for urea_coeff"""
+        _, dp = equilibrium_derivatives(self.scheme, self.eq_urea, self._ln_k(params, self.eq_urea))
+        rates, d_rates = relaxation_rates(self.scheme, self.kin_urea, self._ln_k(params, self.kin_urea), derivatives=True)
+
+        d_eq = dp[np.arange(len(dp)), self.eq_state]/self.eq_sigma
+        idx = np.arange(len(rates)), self.kin_phase
+        d_kin = d_rates[idx]/rates[idx][:,None]/self.kin_sigma
+        return np.concatenate([np.concatenate([d_eq, d_eq*self.eq_urea[:,None]], axis=1),
+                               np.concatenate([d_kin, d_kin*self.kin_urea[:,None]], axis=1)])
+
+    def fit(self, params0=None, **options):
+        """Fits the parameters starting from params0 (by default from constants.py), the options are passed to least_squares"""
+        if params0 is None:
+            params0 = np.concatenate([self.scheme.ln_k0, self.scheme.urea_coeff])
+        return least_squares(self.residuals, params0, jac=self.jacobian, **options)
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    import constants as const
+    from linear_kinetics import LinearKinetics
+
+    print("Running tests...")
+
+    scheme = LinearKinetics(const.states, const.transitions, const.rate_const, const.urea_coeff)
+    urea_conc = np.linspace(0, 10, 21)
+    ln_k = scheme.ln_rate_constants(urea_conc)
+    eps = 1e-4
+
+    # The derivatives of the relaxation rates (relative to the rates, which span many orders of magnitude)
+    # and of the equilibrium match finite differences
+    rates, d_rates = relaxation_rates(scheme, urea_conc, derivatives=True)
+    p, dp = equilibrium_derivatives(scheme, urea_conc)
+    assert rates.shape == (21, 2) and d_rates.shape == (21, 2, 4) and dp.shape == (21, 3, 4)
+    assert np.all(rates[:,0] < rates[:,1])
+    for t in range(4):
+        shift = eps*np.eye(4)[t]
+        numerical = (relaxation_rates(scheme, urea_conc, ln_k+shift) - relaxation_rates(scheme, urea_conc, ln_k-shift))/(2*eps)
+        assert np.all(np.abs(d_rates[...,t] - numerical) < 1e-7*rates)
+        numerical = (scheme.equilibrium(urea_conc, ln_k+shift) - scheme.equilibrium(urea_conc, ln_k-shift))/(2*eps)
+        assert np.allclose(dp[...,t], numerical, atol=1e-8)
+
+    # The Jacobian of the fit matches finite differences
+    rng = np.random.default_rng(0)
+    eq_urea = np.repeat(np.linspace(0, 8, 17), 3)
+    eq_state = scheme.states*17
+    kin_urea = np.repeat(np.linspace(0, 8, 17), 2)
+    kin_phase = [1, 2]*17
+    true_params = np.concatenate([scheme.ln_k0 + [0.3, -0.2, 0.1, 0.2], scheme.urea_coeff + [0.1, -0.05, 0.05, -0.1]])
+    true_ln_k0, true_urea_coeff = true_params[:4], true_params[4:]
+    true_scheme = LinearKinetics(const.states, const.transitions, dict(zip(scheme.rate_constant_names, np.exp(true_ln_k0))),
+                                 dict(zip(scheme.rate_constant_names, true_urea_coeff)))
+    eq_fraction = true_scheme.equilibrium(eq_urea)[np.arange(len(eq_urea)), [scheme.states.index(s) for s in eq_state]]
+    kin_rate = relaxation_rates(true_scheme, kin_urea)[np.arange(len(kin_urea)), np.array(kin_phase)-1]
+
+    model = ChevronFit(scheme, eq_urea, eq_state, eq_fraction, kin_urea, kin_phase, kin_rate)
+    params = np.concatenate([scheme.ln_k0, scheme.urea_coeff])
+    numerical = np.array([(model.residuals(params + eps*e) - model.residuals(params - eps*e))/(2*eps) for e in np.eye(8)]).T
+    assert np.allclose(model.jacobian(params), numerical, rtol=1e-5, atol=1e-6)
+
+    # The fit of exact synthetic data recovers the parameters it was made with, starting from constants.py
+    result = model.fit()
+    ln_k0, urea_coeff = model.split(result.x)
+    assert result.success and np.allclose(ln_k0, true_ln_k0, atol=1e-4) and np.allclose(urea_coeff, true_urea_coeff, atol=1e-4)
+
+    # With noisy data, the parameters are recovered within the noise
+    noisy = ChevronFit(scheme, eq_urea, eq_state, eq_fraction + rng.normal(0, 0.01, len(eq_fraction)),
+                       kin_urea, kin_phase, kin_rate*np.exp(rng.normal(0, 0.05, len(kin_rate))))
+    ln_k0, urea_coeff = noisy.split(noisy.fit().x)
+    assert np.allclose(ln_k0, true_ln_k0, atol=0.3) and np.allclose(urea_coeff, true_urea_coeff, atol=0.1)
+
+    print("All tests passed")
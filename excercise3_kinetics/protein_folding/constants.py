@@ -4,4 +4,8 @@ import numpy as np
 
 variables = "kf_R15 ku_R15 kf_R16 ku_R16".split()
 rate_const = {"kf_R15":26e3, "ku_R15":6.0e-2, "kf_R16":730, "ku_R16":7.5e-4}
-urea_coeff = {"kf_R15":-1.68, "ku_R15":0.95, "kf_R16":-1.72, "ku_R16":1.20}
\ No newline at end of file
+urea_coeff = {"kf_R15":-1.68, "ku_R15":0.95, "kf_R16":-1.72, "ku_R16":1.20}
+
+# The kinetic scheme D <-> I <-> N, each transition is written as (from, to, rate constant)
+states = "D I N".split()
+transitions = [("D", "I", "kf_R15"), ("I", "D", "ku_R15"), ("I", "N", "kf_R16"), ("N", "I", "ku_R16")]
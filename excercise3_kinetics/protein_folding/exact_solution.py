@@ -5,26 +5,22 @@ import numpy as np
 from matplotlib import pyplot as plt
 
 import constants as cons
+from partition_function import SequentialChain
+
+CHAIN = SequentialChain.from_transitions(cons.states, cons.transitions, cons.rate_const, cons.urea_coeff)
 
 def get_equilibrium_constants(urea_conc):
     """Calculates the two equilibrium constants at given urea concentration"""
 
-    K_R15 = cons.rate_const["kf_R15"]*np.exp(cons.urea_coeff["kf_R15"]*urea_conc)
-    K_R15 /= cons.rate_const["ku_R15"]*np.exp(cons.urea_coeff["ku_R15"]*urea_conc)
-
-    K_R16 = cons.rate_const["kf_R16"]*np.exp(cons.urea_coeff["kf_R16"]*urea_conc)
-    K_R16 /= cons.rate_const["ku_R16"]*np.exp(cons.urea_coeff["ku_R16"]*urea_conc)
+    K_R15, K_R16 = np.moveaxis(np.exp(CHAIN.ln_equilibrium_constants(urea_conc)), -1, 0)
 
     return K_R15, K_R16
 
 def get_fractional_composition(urea_conc):
     """Calculates the fractional composition at given urea concentration"""
-    
-    K_R15, K_R16 = get_equilibrium_constants(urea_conc)
 
-    D = 1/(1+K_R15+K_R15*K_R16)
-    I = D*K_R15
-    N = I*K_R16
+    # The populations are calculated in log space, 1/(1+K_R15+K_R15*K_R16) would overflow at extreme urea concentrations
+    D, I, N = np.moveaxis(CHAIN.populations(urea_conc), -1, 0)
 
     return D, I, N
 
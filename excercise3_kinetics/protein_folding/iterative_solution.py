@@ -1,12 +1,17 @@
 # This script finds the equilibrium concentrations of the species by numerically solving the kinetics equations
-# Run as: python iterative_solution.py
+# Run as: python iterative_solution.py [--solve-ivp, optional]
+#   --solve-ivp - integrate the equations separately for each urea concentration using solve_ivp (slow)
+# By default, the linear equations are solved for all urea concentrations at once from the eigendecomposition of the rate matrix (see linear_kinetics.py)
 
 import numpy as np
 from scipy.integrate import solve_ivp
 
 from matplotlib import pyplot as plt
+from datetime import datetime
+from sys import argv
 
 import constants as const
+from linear_kinetics import LinearKinetics
 
 # Constants
 T_MAX = 1e6
@@ -35,22 +40,28 @@ def d_conc(t, y, rate_constants):
 
 if __name__ == "__main__":
     print("Solving the equations...")
-    results = np.zeros([len(UREA_CONCENTRATIONS), 3])
-    for i, conc in enumerate(UREA_CONCENTRATIONS):
-        # Get the rate constants
-        rate_constants = get_rate_constants(conc)
-        fun = lambda t,y: d_conc(t,y, rate_constants)
+    start = datetime.now()
+    if "--solve-ivp" in argv[1:]:
+        results = np.zeros([len(UREA_CONCENTRATIONS), 3])
+        for i, conc in enumerate(UREA_CONCENTRATIONS):
+            # Get the rate constants
+            rate_constants = get_rate_constants(conc)
+            fun = lambda t,y: d_conc(t,y, rate_constants)
 
-        # Solve the kinetic equations
-        solution = solve_ivp(fun, [0,T_MAX], INITIAL_CONC, method='LSODA', t_eval=[T_MAX])
-        if not solution.success:
-            print(f"ERROR: The integration did not converge (urea concentration = {conc:0.2f} M)")
-            exit()
-        # Save the solution
-        eq = solution.y[:,0]
-        results[i] = eq
+            # Solve the kinetic equations
+            solution = solve_ivp(fun, [0,T_MAX], INITIAL_CONC, method='LSODA', t_eval=[T_MAX])
+            if not solution.success:
+                print(f"ERROR: The integration did not converge (urea concentration = {conc:0.2f} M)")
+                exit()
+            # Save the solution
+            eq = solution.y[:,0]
+            results[i] = eq
+    else:
+        # The populations at T_MAX for all urea concentrations at once
+        scheme = LinearKinetics(const.states, const.transitions, const.rate_const, const.urea_coeff)
+        results = scheme.time_course(UREA_CONCENTRATIONS, INITIAL_CONC, [T_MAX])[:,0]
 
-    print("Equations solved")
+    print("Equations solved in", datetime.now()-start)
 
     # Extract the concentrations
     D, I, N = results.T
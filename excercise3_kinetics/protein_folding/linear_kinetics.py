@@ -0,0 +1,149 @@
+# This module solves first-order (linear) kinetic schemes, such as D <-> I <-> N, for many urea concentrations at once
+# The kinetics is dP/dt = K*P, where K is the rate matrix, so the equilibrium is the null space of K
+# and the time course is P(t) = exp(K*t)*P(0), no numerical integration is needed
+
+import numpy as np
+from scipy.linalg import expm
+
+class LinearKinetics:
+    """
+    First-order kinetic scheme with the given states and transitions [(from, to, rate constant name), ...].
+    The rate constants depend on the urea concentration as k = rate_const*exp(urea_coeff*[urea]),
+    rate constants missing in urea_coeff do not depend on the urea concentration.
+    All methods accept urea concentrations of any shape (the batch shape), the results have the batch shape in front.
+    """
+    def __init__(self, states, transitions, rate_const, urea_coeff):
+        self.states = list(states)
+        self.rate_constant_names = [name for _, _, name in transitions]
+        self.ln_k0 = np.log([rate_const[name] for name in self.rate_constant_names])
+        self.urea_coeff = np.array([urea_coeff.get(name, 0.) for name in self.rate_constant_names])
+
+        # K = sum_t k_t*basis_t, each transition moves the population from one state to another
+        n = len(self.states)
+        self.basis = np.zeros((len(transitions), n, n))
+        for t, (start, end, _) in enumerate(transitions):
+            i, j = self.states.index(start), self.states.index(end)
+            self.basis[t, j, i] += 1
+            self.basis[t, i, i] -= 1
+
+    def ln_rate_constants(self, urea_conc):
+        """Returns ln(rate constants) [..., transition]"""
+        return self.ln_k0 + self.urea_coeff*np.asarray(urea_conc, dtype=float)[...,None]
+
+    def rate_matrix(self, urea_conc, ln_k=None):
+        """Returns the rate matrices [..., n, n], optionally for the given ln(rate constants) [..., transition]"""
+        if ln_k is None:
+            ln_k = self.ln_rate_constants(urea_conc)
+        n = len(self.states)
+        return (np.exp(ln_k) @ self.basis.reshape(len(self.basis), n*n)).reshape(ln_k.shape[:-1] + (n, n))
+
+    def equilibrium(self, urea_conc, ln_k=None):
+        """
+        Returns the equilibrium populations [..., n] (the null space of K normalized to 1).
+        The columns of K sum to zero, so one of the equations is replaced by the normalization and the systems are solved together.
+        """
+        K = self.rate_matrix(urea_conc, ln_k)
+        K[...,-1,:] = 1.
+        b = np.zeros(K.shape[:-1])
+        b[...,-1] = 1.
+        return np.linalg.solve(K, b[...,None])[...,0]
+
+    def eigen(self, urea_conc, ln_k=None):
+        """
+        Returns the eigenvalues [..., n] and the right and left eigenvectors [..., n, n] (as columns, normalized so that W^T*V = 1).
+        The eigenvalues are sorted from zero (equilibrium) to the most negative (fastest relaxation).
+        """
+        K = self.rate_matrix(urea_conc, ln_k)
+
+        # With detailed balance, K is similar to the symmetric matrix P^(-1/2)*K*P^(1/2) (P is the diagonal of equilibrium populations),
+        # which has real eigenvalues and orthogonal eigenvectors and is diagonalized faster
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = np.sqrt(self.equilibrium(urea_conc, ln_k))
+            S = K*s[...,None,:]/s[...,:,None]
+            asymmetry = np.abs(S - np.swapaxes(S, -1, -2)).max(axis=(-1, -2)) - 1e-8*np.abs(S).max(axis=(-1, -2))
+        if np.all(s > 0) and np.all(asymmetry <= 0):
+            eigenvalues, U = np.linalg.eigh((S + np.swapaxes(S, -1, -2))/2)
+            eigenvalues, U = eigenvalues[...,::-1], U[...,::-1]
+            return eigenvalues, s[...,:,None]*U, U/s[...,:,None]
+
+        eigenvalues, V = np.linalg.eig(K)
+        # Schemes with detailed balance have real eigenvalues, small imaginary parts are only rounding errors
+        if np.all(np.abs(eigenvalues.imag) <= 1e-12*np.abs(eigenvalues).max(axis=-1, keepdims=True)):
+            eigenvalues, V = eigenvalues.real, V.real
+        order = np.argsort(-eigenvalues.real, axis=-1)
+        eigenvalues = np.take_along_axis(eigenvalues, order, axis=-1)
+        V = np.take_along_axis(V, order[...,None,:], axis=-1)
+        W = np.swapaxes(np.linalg.inv(V), -1, -2)
+        return eigenvalues, V, W
+
+    def time_course(self, urea_conc, p0, times, method="eig"):
+        """
+        Returns the populations [..., time, n] at the given times starting from p0 [n] (or [..., n]).
+        method="eig" uses the eigendecomposition (fast), method="expm" the matrix exponential (robust also for degenerate eigenvalues).
+        """
+        times = np.asarray(times, dtype=float)
+        p0 = np.asarray(p0, dtype=float)
+        if method == "eig":
+            eigenvalues, V, W = self.eigen(urea_conc)
+            # P(t) = V*exp(lambda*t)*W^T*P(0)
+            coeffs = np.einsum("...ji,...j->...i", W, np.broadcast_to(p0, eigenvalues.shape))
+            decay = np.exp(eigenvalues[...,None,:]*times[:,None])
+            return np.einsum("...ij,...tj->...ti", V, decay*coeffs[...,None,:]).real
+        elif method == "expm":
+            K = self.rate_matrix(urea_conc)
+            propagators = expm(K[...,None,:,:]*times[:,None,None])
+            return np.einsum("...tij,...j->...ti", propagators, np.broadcast_to(p0, K.shape[:-1])[...,None,:])
+        else:
+            raise ValueError(f"Unknown method '{method}'")
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+    from scipy.integrate import solve_ivp
+
+    import constants as const
+    from exact_solution import get_fractional_composition
+    from iterative_solution import get_rate_constants, d_conc
+
+    print("Running tests...")
+
+    scheme = LinearKinetics(const.states, const.transitions, const.rate_const, const.urea_coeff)
+    urea_conc = np.linspace(0, 10, 100)
+
+    # The rate matrix is the same as the kinetic equations
+    y = np.array([0.2, 0.3, 0.5])
+    assert np.allclose(scheme.rate_matrix(3.)@y, d_conc(0, y, get_rate_constants(3.)))
+
+    # The equilibrium is the same as the exact solution
+    assert np.allclose(scheme.equilibrium(urea_conc), np.array(get_fractional_composition(urea_conc)).T)
+    assert scheme.equilibrium(np.zeros((4, 5))).shape == (4, 5, 3)
+
+    # The time course is the same as the numerical integration
+    times = np.logspace(-4, 4, 9)
+    for conc in [0., 4., 10.]:
+        reference = solve_ivp(d_conc, (0, times[-1]), [0., 1., 0.], t_eval=times, args=(get_rate_constants(conc),),
+                              method="LSODA", rtol=1e-10, atol=1e-12).y.T
+        assert np.allclose(scheme.time_course(conc, [0., 1., 0.], times), reference, atol=1e-7)
+        assert np.allclose(scheme.time_course(conc, [0., 1., 0.], times, method="expm"), reference, atol=1e-7)
+
+    # The eigenvalues of the rate matrix, zero for the equilibrium and negative relaxation rates
+    eigenvalues, V, W = scheme.eigen(urea_conc)
+    assert np.allclose(eigenvalues[:,0], 0, atol=1e-8) and np.all(eigenvalues[:,1:] < 0)
+    assert np.allclose(np.swapaxes(W, -1, -2)@V, np.eye(3), atol=1e-8)
+
+    # A scheme with a cycle and a constant rate
+    cycle = LinearKinetics("A B C".split(), [("A", "B", "k1"), ("B", "C", "k2"), ("C", "A", "k3")], {"k1": 1., "k2": 2., "k3": 3.}, {"k1": 0.5})
+    p = cycle.equilibrium([0., 1.])
+    assert np.allclose(p.sum(axis=-1), 1) and np.allclose(np.einsum("bij,bj->bi", cycle.rate_matrix([0., 1.]), p), 0)
+    assert np.allclose(cycle.time_course(1., [1., 0., 0.], [0., 1., 100.]), cycle.time_course(1., [1., 0., 0.], [0., 1., 100.], method="expm"))
+
+    # Large sweeps
+    start = datetime.now()
+    p = scheme.equilibrium(np.linspace(0, 10, 100000))
+    print("Equilibrium of 100000 urea concentrations in", datetime.now()-start)
+    start = datetime.now()
+    scheme.time_course(np.linspace(0, 10, 100000), [0., 1., 0.], [1., 10., 100.])
+    print("Time course of 100000 urea concentrations in", datetime.now()-start)
+
+    print("All tests passed")
@@ -0,0 +1,140 @@
+# This module calculates the equilibrium of sequential folding chains S_0 <-> S_1 <-> ... <-> S_n-1 in log space
+# The population of state i is proportional to the product K_1*K_2*...*K_i of the equilibrium constants of the preceding steps,
+# so ln(p_i) = sum_{j<=i} ln(K_j) - ln(Z), where ln(Z) is evaluated by log-sum-exp. Nothing overflows even for huge K.
+
+import numpy as np
+
+# The number of grid points which are evaluated at once, this limits the memory for long chains on large grids
+CHUNK_SIZE = 2**15
+
+def log_weights(ln_K):
+    """Returns the ln(statistical weights) [..., n] of the states relative to the first state for ln(equilibrium constants) [..., n-1]"""
+    ln_K = np.asarray(ln_K, dtype=float)
+    ln_w = np.zeros(ln_K.shape[:-1] + (ln_K.shape[-1]+1,))
+    np.cumsum(ln_K, axis=-1, out=ln_w[...,1:])
+    return ln_w
+
+def log_sum_exp(x, axis=-1):
+    """Returns ln(sum(exp(x))) along the axis, the largest term is factored out so the exponentials never overflow"""
+    x_max = np.max(x, axis=axis, keepdims=True)
+    return np.squeeze(x_max, axis) + np.log(np.sum(np.exp(x - x_max), axis=axis))
+
+def log_populations(ln_K):
+    """Returns ln(fractional populations) [..., n] of the states for ln(equilibrium constants) [..., n-1]"""
+    ln_w = log_weights(ln_K)
+    return ln_w - log_sum_exp(ln_w)[...,None]
+
+class SequentialChain:
+    """
+    Sequential chain of states, where the step i (states[i] <-> states[i+1]) has the forward and backward rate constants
+    k = rate_const*exp(urea_coeff*[urea]). The equilibrium constants optionally depend on the temperature as ln(K(T)) = ln(K)*T_ref/T,
+    which assumes that the free energies of the steps do not depend on the temperature.
+    """
+    def __init__(self, states, ln_kf, ln_ku, urea_coeff_f, urea_coeff_u, T_ref=298.15):
+        self.states = list(states)
+        # ln(K) = ln(kf/ku) + (mf - mu)*[urea]
+        self.ln_K0 = np.asarray(ln_kf, dtype=float) - np.asarray(ln_ku, dtype=float)
+        self.urea_coeff = np.asarray(urea_coeff_f, dtype=float) - np.asarray(urea_coeff_u, dtype=float)
+        self.T_ref = T_ref
+
+    @classmethod
+    def from_transitions(cls, states, transitions, rate_const, urea_coeff, T_ref=298.15):
+        """Creates the chain from the transitions [(from, to, rate constant name), ...] as in constants.py"""
+        names = {(start, end): name for start, end, name in transitions}
+        forward = [names[(a, b)] for a, b in zip(states[:-1], states[1:])]
+        backward = [names[(b, a)] for a, b in zip(states[:-1], states[1:])]
+        return cls(states, np.log([rate_const[n] for n in forward]), np.log([rate_const[n] for n in backward]),
+                   [urea_coeff.get(n, 0.) for n in forward], [urea_coeff.get(n, 0.) for n in backward], T_ref)
+
+    def ln_equilibrium_constants(self, urea_conc, temperature=None):
+        """Returns ln(equilibrium constants) [..., n-1], the urea concentrations and temperatures are broadcast together"""
+        ln_K = self.ln_K0 + self.urea_coeff*np.asarray(urea_conc, dtype=float)[...,None]
+        if temperature is not None:
+            ln_K = ln_K*(self.T_ref/np.asarray(temperature, dtype=float))[...,None]
+        return ln_K
+
+    def log_partition_function(self, urea_conc, temperature=None):
+        """Returns ln(Z) relative to the first state, evaluated in chunks of the grid"""
+        urea_conc, temperature = self._broadcast(urea_conc, temperature)
+        result = np.empty(urea_conc.shape)
+        flat = result.reshape(-1)
+        for chunk, ln_K in self._chunks(urea_conc, temperature):
+            flat[chunk] = log_sum_exp(log_weights(ln_K))
+        return result
+
+    def log_populations(self, urea_conc, temperature=None, states=None):
+        """Returns ln(fractional populations) [..., state] of the given states (all by default)"""
+        idx = np.arange(len(self.states)) if states is None else np.array([self.states.index(s) for s in states])
+        urea_conc, temperature = self._broadcast(urea_conc, temperature)
+        result = np.empty(urea_conc.shape + (len(idx),))
+        flat = result.reshape(-1, len(idx))
+        for chunk, ln_K in self._chunks(urea_conc, temperature):
+            flat[chunk] = log_populations(ln_K)[:,idx]
+        return result
+
+    def populations(self, urea_conc, temperature=None, states=None):
+        """Returns the fractional populations [..., state], which underflow to zero instead of overflowing"""
+        return np.exp(self.log_populations(urea_conc, temperature, states))
+
+    def _broadcast(self, urea_conc, temperature):
+        if temperature is None:
+            return np.asarray(urea_conc, dtype=float), None
+        return np.broadcast_arrays(np.asarray(urea_conc, dtype=float), np.asarray(temperature, dtype=float))
+
+    def _chunks(self, urea_conc, temperature):
+        """Yields the chunks of the flattened grid together with their ln(equilibrium constants)"""
+        urea_conc = urea_conc.ravel()
+        temperature = None if temperature is None else temperature.ravel()
+        for start in range(0, len(urea_conc), CHUNK_SIZE):
+            chunk = slice(start, min(start+CHUNK_SIZE, len(urea_conc)))
+            yield chunk, self.ln_equilibrium_constants(urea_conc[chunk], None if temperature is None else temperature[chunk])
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+
+    import constants as const
+    from linear_kinetics import LinearKinetics
+
+    print("Running tests...")
+
+    chain = SequentialChain.from_transitions(const.states, const.transitions, const.rate_const, const.urea_coeff)
+    scheme = LinearKinetics(const.states, const.transitions, const.rate_const, const.urea_coeff)
+    urea_conc = np.linspace(0, 10, 100)
+
+    # The same as the null space of the rate matrix
+    assert np.allclose(chain.populations(urea_conc), scheme.equilibrium(urea_conc))
+    assert np.allclose(np.exp(chain.log_partition_function(urea_conc)), np.sum(np.exp(log_weights(chain.ln_equilibrium_constants(urea_conc))), axis=-1))
+
+    # Extreme urea concentrations, where K overflows
+    p = chain.populations([-1000., 1000.])
+    assert np.all(np.isfinite(p)) and np.allclose(p, [[0, 0, 1], [1, 0, 0]])
+    ln_p = chain.log_populations([-1000., 1000.])
+    assert np.all(np.isfinite(ln_p)) and np.allclose(np.exp(ln_p).sum(axis=-1), 1)
+
+    # Temperature grid, the chain is the same at T_ref
+    T = np.array([280., 298.15, 320.])
+    grid = chain.populations(urea_conc[:,None], T[None,:])
+    assert grid.shape == (100, 3, 3)
+    assert np.allclose(grid[:,1], chain.populations(urea_conc))
+
+    # Selected states on a grid larger than one chunk
+    u = np.linspace(0, 10, 3*CHUNK_SIZE+7)
+    assert np.allclose(chain.populations(u, states=["N"])[:,0], chain.populations(u)[:,2])
+
+    # A long chain
+    rng = np.random.default_rng(0)
+    long_chain = SequentialChain([f"S{i}" for i in range(50)], rng.normal(0, 1, 49), rng.normal(0, 1, 49), rng.normal(0, 1, 49), rng.normal(0, 1, 49))
+    reference = LinearKinetics(long_chain.states,
+                               [(f"S{i}", f"S{i+1}", f"f{i}") for i in range(49)] + [(f"S{i+1}", f"S{i}", f"u{i}") for i in range(49)],
+                               {**{f"f{i}": np.exp(long_chain.ln_K0[i]) for i in range(49)}, **{f"u{i}": 1. for i in range(49)}},
+                               {f"f{i}": long_chain.urea_coeff[i] for i in range(49)})
+    assert np.allclose(long_chain.populations([0., 0.5]), reference.equilibrium([0., 0.5]), atol=1e-10)
+
+    start = datetime.now()
+    ln_p = long_chain.log_populations(np.linspace(-100, 100, 1000000), states=["S0", "S49"])
+    print("50-state chain on 1000000 points in", datetime.now()-start)
+    assert np.all(np.isfinite(ln_p))
+
+    print("All tests passed")
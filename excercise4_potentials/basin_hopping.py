@@ -0,0 +1,206 @@
+# This module runs several basin hopping walkers (the same search as randomized_optimization.py) in parallel processes
+# The walkers share the best energy and structure found so far, optionally they periodically restart from it.
+# Each walker has its own random generator spawned from one seed, so the walkers explore different basins and the runs are reproducible.
+# The walkers recognize the minima they have already visited (see fingerprints.py) and randomize more after falling into them again.
+
+import numpy as np
+from scipy.optimize import minimize
+
+import multiprocessing
+import queue
+import os
+
+import utils
+import potentials
+from neighbor_list import NeighborListEnergy
+from fingerprints import MinimaIndex
+
+class SharedBest:
+    """The best energy and vector shared by the processes, stored as [energy, vector...] in the shared memory"""
+    def __init__(self, n, context=multiprocessing):
+        self.array = context.Array("d", n+1)
+        self.array[0] = np.inf
+
+    def get(self):
+        """Returns the best energy and a copy of the best vector"""
+        with self.array.get_lock():
+            return self.array[0], np.array(self.array[1:])
+
+    def update(self, energy, vec):
+        """Stores the energy and the vector if the energy is lower than the best one, returns True if it was stored"""
+        with self.array.get_lock():
+            if energy < self.array[0]:
+                self.array[0] = energy
+                self.array[1:] = vec
+                return True
+            return False
+
+def energy_functions(potential_name, n_particles, cutoff=None):
+    """Returns the energy and the gradient functions of 1D vectors, the same as in the scripts"""
+    if cutoff is None:
+        evaluator = utils.EnergyEvaluator(n_particles, potentials.potentials[potential_name], potentials.derivatives[potential_name])
+        return evaluator, evaluator.gradient
+    engine = NeighborListEnergy(potential_name, cutoff=cutoff, switch_start=cutoff*5/6)
+    return engine.get_energy, engine.get_gradient
+
+def walk(potential_name, n_particles, iterations, seed, shared, restart_interval=None, target=None, cutoff=None, initial_vec=None, newton=False, name="Walker", verbose=True):
+    """
+    Runs one walker: finds a local minimum, randomizes the best coordinates by an amplitude decreasing from 2 to 0 and repeats.
+    Every restart_interval iterations, the walker continues from the shared best structure if it is better than its own.
+    The walker stops early when the shared best energy reaches the target. The walker starts from initial_vec (random coordinates by default).
+    The amplitude of the randomization is multiplied by sqrt(number of visits) of the last minimum, so the walker escapes the basins it keeps finding.
+    With newton=True, the local minimizations use the trust-region Newton method with the analytic Hessian (see normal_modes.py).
+    Returns the best energy and vector of this walker and the index of the visited minima.
+    """
+    energy_fun, gradient_fun = energy_functions(potential_name, n_particles, cutoff)
+    options = {}
+    if newton:
+        derivative, second_derivative = potentials.derivatives[potential_name], potentials.second_derivatives[potential_name]
+        options = {"method": "trust-ncg", "hess": lambda vec: utils.get_hessian(vec, derivative, second_derivative)}
+    rng = np.random.default_rng(seed)
+
+    pos0 = rng.random(n_particles*3-6)*8-4 if initial_vec is None else np.array(initial_vec)
+    best_energy = np.inf
+    best_vec = pos0
+    index = MinimaIndex()
+    visits = 1
+    for i, rnd in enumerate(np.linspace(2., 0., iterations)):
+        solution = minimize(energy_fun, pos0, jac=gradient_fun, tol=1e-5, **options)
+        # After a failed minimization, the count of the previous minimum does not apply
+        visits = 1
+        if solution.success:
+            idx, _ = index.add(solution.fun, solution.x)
+            visits = index.visits[idx]
+        if solution.success and solution.fun < best_energy:
+            best_energy = solution.fun
+            best_vec = solution.x
+            if shared.update(best_energy, best_vec) and verbose:
+                print(f"{name}, iter {i}: E = {best_energy}", flush=True)
+
+        shared_energy, shared_vec = shared.get()
+        if target is not None and shared_energy <= target:
+            break
+        if restart_interval and (i+1) % restart_interval == 0 and shared_energy < best_energy:
+            best_energy, best_vec = shared_energy, shared_vec
+
+        pos0 = best_vec + rng.standard_normal(len(best_vec))*rnd*np.sqrt(visits)
+    return best_energy, best_vec, index
+
+def _walker(walker_id, args, kwargs, shared, walker_energies, minima):
+    """Runs the walker in its process, the visited minima are sent back through the queue (None if the walker failed)"""
+    distinct = None
+    try:
+        energy, _, index = walk(*args, shared=shared, name=f"Walker {walker_id}", **kwargs)
+        walker_energies[walker_id] = energy
+        distinct = index.distinct()
+    finally:
+        minima.put(distinct)
+
+def parallel_basin_hopping(potential_name, n_particles, iterations, n_walkers=None, seed=None, restart_interval=None, target=None, cutoff=None, initial_vec=None, newton=False, verbose=True):
+    """
+    Runs n_walkers (by default one per core) walkers in parallel processes, each for the given number of iterations.
+    Returns the best energy, the best vector, the best energies of the individual walkers and the index of the minima visited by all walkers.
+    The walker processes are forked, so that the calling script is not run again in them. On platforms without fork
+    (e.g. Windows), the walkers run one after another in the main process.
+    """
+    n_walkers = n_walkers or os.cpu_count()
+    seeds = np.random.SeedSequence(seed).spawn(n_walkers)
+    kwargs = dict(restart_interval=restart_interval, target=target, cutoff=cutoff, initial_vec=initial_vec, newton=newton, verbose=verbose)
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        shared = SharedBest(n_particles*3-6)
+        walker_energies = np.full(n_walkers, np.inf)
+        index = MinimaIndex()
+        for w in range(n_walkers):
+            walker_energies[w], _, walker_index = walk(potential_name, n_particles, iterations, seeds[w], shared, name=f"Walker {w}", **kwargs)
+            for energy, vec, visits in walker_index.distinct():
+                index.add(energy, vec, visits)
+        best_energy, best_vec = shared.get()
+        return best_energy, best_vec, walker_energies, index
+
+    context = multiprocessing.get_context("fork")
+    shared = SharedBest(n_particles*3-6, context)
+    walker_energies = context.Array("d", n_walkers)
+    minima = context.Queue()
+
+    workers = [context.Process(target=_walker, args=(w, (potential_name, n_particles, iterations, seeds[w]), kwargs, shared, walker_energies, minima))
+               for w in range(n_walkers)]
+    for worker in workers:
+        worker.start()
+    # The queue must be emptied before joining, otherwise the walkers could wait until their minima are read.
+    # A killed walker never sends its minima, so the queue is polled and the walkers which exited are counted.
+    index = MinimaIndex()
+    received = 0
+    while received < n_walkers:
+        try:
+            distinct = minima.get(timeout=1.)
+        except queue.Empty:
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                break
+            continue
+        received += 1
+        for energy, vec, visits in distinct or []:
+            index.add(energy, vec, visits)
+    if received < n_walkers:
+        for worker in workers:
+            worker.terminate()
+    for worker in workers:
+        worker.join()
+    if any(worker.exitcode != 0 for worker in workers):
+        raise RuntimeError("Some of the walkers failed")
+
+    best_energy, best_vec = shared.get()
+    return best_energy, best_vec, np.array(walker_energies[:]), index
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+
+    print("Running tests...")
+
+    # The shared best is only replaced by lower energies
+    shared = SharedBest(3)
+    assert shared.update(-1., [1., 2., 3.])
+    assert not shared.update(-0.5, [4., 5., 6.])
+    energy, vec = shared.get()
+    assert energy == -1. and np.all(vec == [1., 2., 3.])
+
+    # A single walker is reproducible
+    e1, v1, index = walk("lennard-jones", 7, 5, 42, SharedBest(15), verbose=False)
+    e2, v2, _ = walk("lennard-jones", 7, 5, 42, SharedBest(15), verbose=False)
+    assert e1 == e2 and np.all(v1 == v2)
+    assert index.distinct(1)[0][0] == e1
+    assert np.isclose(e1, utils.get_energy(v1, potentials.lennard_jones))
+
+    # The global minimum of LJ7 (pentagonal bipyramid)
+    start = datetime.now()
+    energy, vec, walker_energies, index = parallel_basin_hopping("lennard-jones", 7, 10, n_walkers=4, seed=0, restart_interval=5, verbose=False)
+    print("4 walkers for LJ7 in", datetime.now()-start)
+    assert np.isclose(energy, -4.1263, atol=1e-4)
+    assert np.isclose(energy, utils.get_energy(vec, potentials.lennard_jones))
+    assert len(walker_energies) == 4 and np.isclose(np.min(walker_energies), energy)
+    assert np.isclose(index.distinct(1)[0][0], energy) and sum(index.visits) <= 40
+
+    # A killed walker (e.g. by the out-of-memory killer) is detected instead of waiting for it forever
+    import signal
+    original_walker = _walker
+    def _walker(walker_id, *args):
+        if walker_id == 0:
+            os.kill(os.getpid(), signal.SIGKILL)
+        original_walker(walker_id, *args)
+    try:
+        parallel_basin_hopping("lennard-jones", 7, 10, n_walkers=2, seed=0, verbose=False)
+        assert False, "The killed walker was not detected"
+    except RuntimeError:
+        pass
+    _walker = original_walker
+
+    # The trust-region Newton method finds the same minimum
+    energy, _, _, _ = parallel_basin_hopping("lennard-jones", 7, 10, n_walkers=2, seed=0, newton=True, verbose=False)
+    assert np.isclose(energy, -4.1263, atol=1e-4)
+
+    # The walkers stop when the target is reached
+    energy, _, _, _ = parallel_basin_hopping("morse-1", 6, 1000, n_walkers=2, seed=0, target=0.2819, verbose=False)
+    assert energy <= 0.2819
+
+    print("All tests passed")
@@ -0,0 +1,181 @@
+# This module keeps the best known minima of all potentials and cluster sizes in a folder, one .xyz file for each (potential, N)
+# The searches can start from the stored minimum, or from the minimum with one particle less or more, instead of random coordinates.
+# The files are always replaced atomically, so several processes can use the same folder and an interrupted run never leaves a broken file.
+# Saving is done under a lock file, so two processes saving the same minimum at once can not replace the better one by the worse one.
+
+import numpy as np
+import os
+import time
+
+import utils
+import potentials
+
+def fibonacci_sphere(n):
+    """Returns n unit vectors distributed evenly on the sphere"""
+    i = np.arange(n) + 0.5
+    phi = np.arccos(1 - 2*i/n)
+    theta = np.pi*(1 + 5**0.5)*i
+    return np.stack([np.cos(theta)*np.sin(phi), np.sin(theta)*np.sin(phi), np.cos(phi)], axis=1)
+
+def add_particle(xyz, potential, n_directions=64):
+    """
+    Returns the coordinates with one particle added at the best surface site. The candidate sites are around each particle
+    at the typical nearest-neighbor distance, the sites too close to the other particles are left out and the site with the lowest energy is used.
+    """
+    dist_mat = utils.distance_matrix(xyz)
+    np.fill_diagonal(dist_mat, np.inf)
+    r0 = np.median(np.min(dist_mat, axis=1))
+
+    sites = (xyz[:,None,:] + r0*fibonacci_sphere(n_directions)[None,:,:]).reshape(-1, 3)
+    r = np.sqrt(np.sum((sites[:,None,:] - xyz[None,:,:])**2, axis=2))
+    energies = np.sum(potential(r), axis=1)
+    energies[np.min(r, axis=1) < 0.9*r0] = np.inf
+    return np.concatenate([xyz, sites[np.argmin(energies)][None,:]])
+
+def remove_particle(xyz, potential):
+    """Returns the coordinates without the least bound particle (the particle with the highest energy of its pairs)"""
+    dist_mat = utils.distance_matrix(xyz)
+    np.fill_diagonal(dist_mat, 1.) # prevents division by zero
+    energies = potential(dist_mat)
+    np.fill_diagonal(energies, 0.)
+    return np.delete(xyz, np.argmax(np.sum(energies, axis=1)), axis=0)
+
+class MinimaDatabase:
+    """The best known minima in the folder path, the file of the potential and N is [potential]_[N].xyz"""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, potential_name, n_particles):
+        return os.path.join(self.path, f"{potential_name}_{n_particles}.xyz")
+
+    def load(self, potential_name, n_particles):
+        """Returns the best known energy and the 1D vector, or None if the minimum is not in the database"""
+        filename = self.filename(potential_name, n_particles)
+        if not os.path.exists(filename):
+            return None
+        xyz, note = utils.load_coordinates(filename)
+        return float(note.split("E = ")[1]), utils.xyz_to_vec(utils.align(xyz))
+
+    def _lock(self, filename, timeout=60.):
+        """
+        Creates the lock file of the minimum, waits while another process holds it. A lock older than timeout seconds
+        was left by a killed process and is removed.
+        """
+        lock = filename + ".lock"
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > timeout:
+                        os.remove(lock)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.01)
+
+    def save(self, potential_name, n_particles, energy, vec):
+        """Saves the minimum if it is better than the stored one, returns True if it was saved"""
+        filename = self.filename(potential_name, n_particles)
+        # The comparison and the replacement are done under the lock, so a worse minimum can not replace a better one saved meanwhile
+        lock = self._lock(filename)
+        try:
+            stored = self.load(potential_name, n_particles)
+            if stored is not None and stored[0] <= energy:
+                return False
+
+            # Written with full precision to a temporary file first, so the file is either the old one or the new one
+            tmp = f"{filename}.{os.getpid()}.tmp"
+            xyz = utils.vec_to_xyz(vec)
+            with open(tmp, 'w') as f:
+                f.write(f"{len(xyz)}\n")
+                f.write(f"{potential_name}, E = {energy!r}\n")
+                for line in xyz:
+                    f.write("H {: .12f} {: .12f} {: .12f}\n".format(*line))
+            os.replace(tmp, filename)
+            return True
+        finally:
+            os.remove(lock)
+
+    def entries(self):
+        """Returns the list of (potential, N, energy) of all minima in the database, sorted by potential and N"""
+        result = []
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            potential_name, _, n = name.rpartition("_")
+            if ext == ".xyz" and potential_name in potentials.potentials and n.isdigit():
+                result.append((potential_name, int(n), self.load(potential_name, int(n))[0]))
+        return sorted(result)
+
+    def initial_vec(self, potential_name, n_particles):
+        """
+        Returns the starting 1D vector for the search and its source: the stored minimum of N,
+        the minimum of N-1 with an added particle or the minimum of N+1 without the least bound particle. Returns (None, None) if there are none.
+        """
+        potential = potentials.potentials[potential_name]
+        stored = self.load(potential_name, n_particles)
+        if stored is not None:
+            return stored[1], f"stored minimum of {n_particles} particles"
+        smaller = self.load(potential_name, n_particles-1)
+        if smaller is not None:
+            xyz = add_particle(utils.vec_to_xyz(smaller[1]), potential)
+            return utils.xyz_to_vec(utils.align(xyz)), f"minimum of {n_particles-1} particles with an added particle"
+        larger = self.load(potential_name, n_particles+1)
+        if larger is not None:
+            xyz = remove_particle(utils.vec_to_xyz(larger[1]), potential)
+            return utils.xyz_to_vec(utils.align(xyz)), f"minimum of {n_particles+1} particles without the least bound particle"
+        return None, None
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    import tempfile
+    from scipy.optimize import minimize
+
+    print("Running tests...")
+
+    evaluator = utils.EnergyEvaluator(6, potentials.lennard_jones, potentials.lennard_jones_derivative)
+    # Octahedron, the global minimum of LJ6
+    octahedron = utils.align(np.array([[1,0,0],[-1,0,0],[0,1,0],[0,-1,0],[0,0,1],[0,0,-1]])*2**(1/6)/np.sqrt(2))
+    solution = minimize(evaluator, utils.xyz_to_vec(octahedron), jac=evaluator.gradient, tol=1e-10)
+    energy, vec = solution.fun, solution.x
+    assert np.isclose(energy, -3.1780, atol=1e-4)
+
+    with tempfile.TemporaryDirectory() as folder:
+        db = MinimaDatabase(folder)
+        assert db.load("lennard-jones", 6) is None and db.initial_vec("lennard-jones", 6) == (None, None)
+
+        # Only better minima are saved, the stored values are exact
+        assert db.save("lennard-jones", 6, energy, vec)
+        assert not db.save("lennard-jones", 6, energy + 0.1, vec)
+        stored_energy, stored_vec = db.load("lennard-jones", 6)
+        assert stored_energy == energy and np.allclose(evaluator(stored_vec), energy)
+        assert db.entries() == [("lennard-jones", 6, energy)]
+        assert not any(filename.endswith((".tmp", ".lock")) for filename in os.listdir(folder))
+
+        # Many processes saving at once keep the best minimum
+        from multiprocessing import Pool
+        with Pool(4) as pool:
+            pool.starmap(db.save, [("lennard-jones", 3, -3. + 0.01*(i % 7), np.array([1., 0.5, 0.8])) for i in range(40)])
+        assert db.load("lennard-jones", 3)[0] == -3.
+
+        # A lock left by a killed process is removed after the timeout
+        lock = db.filename("lennard-jones", 3) + ".lock"
+        open(lock, "w").close()
+        os.utime(lock, (0, 0))
+        assert db.save("lennard-jones", 3, -4., np.array([1., 0.5, 0.8])) and not os.path.exists(lock)
+
+        # Growing the octahedron to 7 particles gives a good starting point, minimizing it finds the pentagonal bipyramid
+        vec7, source = db.initial_vec("lennard-jones", 7)
+        assert "added" in source
+        solution = minimize(utils.EnergyEvaluator(7, potentials.lennard_jones), vec7)
+        assert solution.fun < -3.9
+
+        # Removing a particle from the octahedron gives the square pyramid, all particles are equivalent,
+        # so one particle takes part in 1/3 of the pairs (each pair has 2 of the 6 particles)
+        vec5, source = db.initial_vec("lennard-jones", 5)
+        assert "without" in source and len(vec5) == 5*3-6
+        assert np.isclose(utils.get_energy(vec5, potentials.lennard_jones), energy*2/3)
+
+    print("All tests passed")
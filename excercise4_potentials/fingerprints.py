@@ -0,0 +1,125 @@
+# This module keeps an index of the visited local minima, so the searches can recognize the basins they have already found
+# A minimum is identified by its energy and the sorted list of all pair distances (the distance spectrum),
+# which does not depend on the rotation, translation or the numbering of the particles.
+# The minima are stored in buckets by their energy, so a new minimum is only compared to the few minima with similar energies.
+
+import numpy as np
+
+import utils
+
+def distance_spectrum(xyz):
+    """Returns the sorted distances of all pairs of particles"""
+    dist_mat = utils.distance_matrix(xyz)
+    return np.sort(dist_mat[np.triu_indices(len(xyz), k=1)])
+
+class MinimaIndex:
+    """
+    Index of the distinct minima, two minima are the same if their energies differ by at most energy_tol
+    and their distance spectra by at most distance_tol (in each distance).
+    """
+    def __init__(self, energy_tol=1e-3, distance_tol=1e-2):
+        self.energy_tol = energy_tol
+        self.distance_tol = distance_tol
+
+        # Bucket (energy rounded down to energy_tol) -> indices of the minima
+        self.buckets = {}
+        self.energies = []
+        self.vecs = []
+        self.spectra = []
+        self.visits = []
+
+    def __len__(self):
+        return len(self.energies)
+
+    def _bucket(self, energy):
+        return int(np.floor(energy/self.energy_tol))
+
+    def find(self, energy, vec, spectrum=None):
+        """Returns the index of the minimum if it is already in the index, otherwise None"""
+        if spectrum is None:
+            spectrum = distance_spectrum(utils.vec_to_xyz(vec))
+        # The same minimum can be in the neighboring bucket, when its energy is close to the bucket boundary
+        key = self._bucket(energy)
+        for k in (key-1, key, key+1):
+            for idx in self.buckets.get(k, []):
+                if abs(self.energies[idx] - energy) <= self.energy_tol and np.max(np.abs(self.spectra[idx] - spectrum)) <= self.distance_tol:
+                    return idx
+        return None
+
+    def add(self, energy, vec, visits=1):
+        """Adds the minimum (or counts another visit of it), returns its index and whether it is new"""
+        spectrum = distance_spectrum(utils.vec_to_xyz(vec))
+        idx = self.find(energy, vec, spectrum)
+        if idx is not None:
+            self.visits[idx] += visits
+            return idx, False
+
+        self.buckets.setdefault(self._bucket(energy), []).append(len(self.energies))
+        self.energies.append(energy)
+        self.vecs.append(np.array(vec))
+        self.spectra.append(spectrum)
+        self.visits.append(visits)
+        return len(self.energies)-1, True
+
+    def distinct(self, n=None):
+        """Returns the n (all by default) lowest distinct minima as a list of (energy, vec, visits)"""
+        order = np.argsort(self.energies)[:n]
+        return [(self.energies[idx], self.vecs[idx], self.visits[idx]) for idx in order]
+
+    def summary(self, n=5):
+        """Returns a string with the number of the distinct minima and the lowest of them"""
+        lines = [f"Found {len(self)} distinct minima in {sum(self.visits)} minimizations, the lowest:"]
+        for energy, _, visits in self.distinct(n):
+            lines.append(f"E = {energy:0.4f}, visited {visits}x")
+        return '\n'.join(lines)
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+    from scipy.optimize import minimize
+    from scipy.spatial.transform import Rotation
+
+    import potentials
+
+    print("Running tests...")
+
+    rng = np.random.default_rng(0)
+    evaluator = utils.EnergyEvaluator(7, potentials.lennard_jones, potentials.lennard_jones_derivative)
+
+    # The spectrum does not depend on the rotation, translation and the order of the particles
+    xyz = rng.random((7, 3))
+    moved = Rotation.random(random_state=1).apply(xyz)[rng.permutation(7)] + [1., 2., 3.]
+    assert np.allclose(distance_spectrum(xyz), distance_spectrum(moved))
+
+    # The local minima of LJ7, the same minimum found from different starting points is recognized
+    index = MinimaIndex()
+    for _ in range(30):
+        solution = minimize(evaluator, rng.random(15)*3-1.5, jac=evaluator.gradient, tol=1e-8)
+        index.add(solution.fun, solution.x)
+    assert 1 < len(index) < 30 and sum(index.visits) == 30
+    energies = [energy for energy, _, _ in index.distinct()]
+    assert np.all(np.diff(energies) > 0)
+    assert np.isclose(energies[0], -4.1263, atol=1e-4)
+    for energy, vec, _ in index.distinct():
+        assert index.find(energy, vec) is not None
+        assert index.find(energy + 0.01, vec) is None
+
+    # Energies close to the bucket boundary
+    index = MinimaIndex(energy_tol=1e-3)
+    vec = rng.random(15)
+    assert index.add(1e-3 - 1e-6, vec) == (0, True)
+    assert index.add(1e-3 + 1e-6, vec) == (0, False)
+    assert index.visits == [2]
+
+    # Looking up many minima
+    index = MinimaIndex()
+    vecs = rng.random((2000, 15))*3
+    for vec in vecs:
+        index.add(evaluator(vec), vec)
+    start = datetime.now()
+    for vec in vecs:
+        assert index.find(evaluator(vec), vec) is not None
+    print("2000 lookups in", datetime.now()-start)
+
+    print("All tests passed")
@@ -0,0 +1,191 @@
+# This module contains the building blocks of the Monte Carlo (annealing) searches
+# IncrementalEnergy keeps the energies of all pairs, so moving a single particle only recalculates its N-1 pairs, O(N) instead of O(N^2)
+# ParallelTempering runs replicas at a ladder of temperatures, which move together and exchange their configurations
+
+import numpy as np
+
+import utils
+
+class IncrementalEnergy:
+    """
+    Energy of the system represented by the 1D vector, updated incrementally for single-particle moves.
+    A move is proposed by trial(), which returns the new energy, and then either accepted by accept() or discarded by reject().
+    Only the free (non-redundant) coordinates of the particles are moved, see utils.vec_to_xyz.
+    """
+    def __init__(self, vec, potential):
+        self.potential = potential
+        self.xyz = utils.vec_to_xyz(vec)
+        # True for the coordinates which are in the 1D vector
+        self.free = np.ones(self.xyz.size, dtype=bool)
+        self.free[[0,1,2,3,4,6]] = False
+        self.free = self.free.reshape(self.xyz.shape)
+        # The first particle has no free coordinates, so it is never moved
+        self.movable = np.arange(1, len(self.xyz))
+
+        self.pair_energies = self._pair_energies(self.xyz)
+        self.energy = np.sum(self.pair_energies)/2
+        self._trial = None
+
+    def _pair_energies(self, xyz):
+        """Returns the matrix of the pair energies with zero diagonal"""
+        i, j = np.triu_indices(len(xyz), k=1)
+        E = np.zeros((len(xyz), len(xyz)))
+        E[i,j] = self.potential(np.sqrt(np.sum((xyz[i]-xyz[j])**2, axis=1)))
+        return E + E.T
+
+    @property
+    def vec(self):
+        return utils.xyz_to_vec(self.xyz)
+
+    def random_move(self, step, rng=np.random):
+        """Returns a random particle and its new position, displaced by a normal distribution with the width step"""
+        k = self.movable[rng.randint(len(self.movable))]
+        return k, self.xyz[k] + rng.randn(3)*step*self.free[k]
+
+    def trial(self, k, position):
+        """Returns the energy after moving the particle k to the position, the move is kept until accept() or reject()"""
+        r = np.sqrt(np.sum((self.xyz - position)**2, axis=1))
+        r[k] = 1. # prevents division by zero
+        row = self.potential(r)
+        row[k] = 0.
+        dE = np.sum(row) - np.sum(self.pair_energies[k])
+        self._trial = (k, position, row, dE)
+        return self.energy + dE
+
+    def accept(self):
+        """Moves the particle of the last trial and updates the pair energies"""
+        k, position, row, dE = self._trial
+        self.xyz[k] = position
+        self.pair_energies[k,:] = row
+        self.pair_energies[:,k] = row
+        self.energy += dE
+        self._trial = None
+
+    def reject(self):
+        """Discards the last trial, nothing has to be restored"""
+        self._trial = None
+
+    def refresh(self):
+        """Recalculates the total energy from the pair energies, this removes the rounding errors accumulated over many moves"""
+        self.energy = np.sum(self.pair_energies)/2
+
+class ParallelTempering:
+    """
+    Replica exchange Monte Carlo, replica r samples the Boltzmann distribution at temperatures[r] with moves of the width step_sizes[r].
+    All replicas are moved at once and energy_fun returns the energies [R] of the stacked vectors [R, 3N-6] (e.g. EnergyEvaluator.energies).
+    Neighboring replicas exchange their configurations with the probability min(1, exp((1/T_i - 1/T_j)*(E_i - E_j))).
+    """
+    def __init__(self, vecs, temperatures, step_sizes, energy_fun, box=5.):
+        self.vecs = np.array(vecs, dtype=float)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.step_sizes = np.asarray(step_sizes, dtype=float)
+        self.energy_fun = energy_fun
+        # The moves outside of the box are rejected, the clusters would fall apart
+        self.box = box
+
+        self.energies = energy_fun(self.vecs)
+        self.best_energy = np.min(self.energies)
+        self.best_vec = self.vecs[np.argmin(self.energies)].copy()
+        self.n_swaps = np.zeros(len(self.temperatures)-1, dtype=int)
+        self.n_swaps_accepted = np.zeros(len(self.temperatures)-1, dtype=int)
+
+    def step(self, rng=np.random):
+        """Moves all replicas by the Metropolis criterion at their temperatures, returns which moves were accepted"""
+        trial = self.vecs + rng.randn(*self.vecs.shape)*self.step_sizes[:,None]
+        trial_energies = self.energy_fun(trial)
+        with np.errstate(over="ignore", invalid="ignore"):
+            prob = np.exp(-np.maximum(trial_energies - self.energies, 0)/self.temperatures)
+        accepted = (prob >= rng.rand(len(prob))) & np.all(np.abs(trial) <= self.box, axis=1)
+
+        self.vecs[accepted] = trial[accepted]
+        self.energies[accepted] = trial_energies[accepted]
+        if np.min(self.energies) < self.best_energy:
+            self.best_energy = np.min(self.energies)
+            self.best_vec = self.vecs[np.argmin(self.energies)].copy()
+        return accepted
+
+    def swap(self, offset=0, rng=np.random):
+        """Attempts the exchanges of the replica pairs (offset, offset+1), (offset+2, offset+3), ..., alternate offset 0 and 1"""
+        i = np.arange(offset, len(self.temperatures)-1, 2)
+        j = i + 1
+        delta = (1/self.temperatures[i] - 1/self.temperatures[j])*(self.energies[i] - self.energies[j])
+        accepted = np.exp(np.minimum(delta, 0)) >= rng.rand(len(i))
+        i, j = i[accepted], j[accepted]
+
+        self.vecs[i], self.vecs[j] = self.vecs[j], self.vecs[i]
+        self.energies[i], self.energies[j] = self.energies[j], self.energies[i]
+        self.n_swaps[offset::2] += 1
+        self.n_swaps_accepted[i] += 1
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+
+    import potentials
+
+    print("Running tests...")
+
+    rng = np.random.RandomState(0)
+    for name, potential in potentials.potentials.items():
+        # Perturbed 3x3x3 lattice, the first particles are (0,0,0), (0,0,1.1) and (0,0,2.2), so leaving out the redundant coordinates changes little
+        lattice = np.array(np.meshgrid(*[np.arange(3)]*3, indexing="ij")).reshape(3,-1).T*1.1
+        vec = utils.xyz_to_vec(lattice + rng.randn(27,3)*0.05)
+        system = IncrementalEnergy(vec, potential)
+        assert np.isclose(system.energy, utils.get_energy(system.vec, potential))
+
+        # Accepted and rejected moves
+        for _ in range(200):
+            k, position = system.random_move(0.1, rng)
+            energy = system.trial(k, position)
+            if rng.rand() < 0.5:
+                system.accept()
+                assert np.isclose(energy, utils.get_energy(system.vec, potential))
+            else:
+                system.reject()
+        assert np.isclose(system.energy, utils.get_energy(system.vec, potential))
+
+    # The redundant coordinates are never moved
+    assert np.all(utils.xyz_to_vec(np.arange(81).reshape(27,3)) == np.arange(81)[system.free.ravel()])
+    assert np.all(system.xyz.ravel()[[0,1,2,3,4,6]] == 0)
+
+    # Speed of the single-particle moves
+    N = 150
+    lattice = np.array(np.meshgrid(np.arange(6), np.arange(5), np.arange(5), indexing="ij")).reshape(3,-1).T*1.1
+    vec = utils.xyz_to_vec(lattice + rng.randn(N,3)*0.05)
+    system = IncrementalEnergy(vec, potentials.lennard_jones)
+    start = datetime.now()
+    for _ in range(10000):
+        system.trial(*system.random_move(0.1, rng))
+        system.accept()
+    print(f"10000 moves of {N} particles in", datetime.now()-start)
+    assert np.isclose(system.energy, utils.get_energy(system.vec, potentials.lennard_jones))
+    system.refresh()
+    assert np.isclose(system.energy, utils.get_energy(system.vec, potentials.lennard_jones))
+
+    # Parallel tempering samples the Boltzmann distributions, the energy x^2 has <x^2> = T/2 at the temperature T
+    temperatures = np.array([0.1, 0.2, 0.4, 0.8])
+    tempering = ParallelTempering(np.zeros((4, 1)), temperatures, np.sqrt(temperatures), lambda x: np.sum(x**2, axis=1))
+    samples = []
+    for i in range(40000):
+        tempering.step(rng)
+        if i % 5 == 0:
+            tempering.swap(i % 2, rng)
+        samples.append(tempering.vecs[:,0]**2)
+    assert np.allclose(np.mean(samples, axis=0), temperatures/2, rtol=0.1)
+    assert np.all(tempering.n_swaps_accepted > 0) and np.all(tempering.n_swaps_accepted < tempering.n_swaps)
+
+    # Batched replicas of a cluster
+    evaluator = utils.EnergyEvaluator(13, potentials.lennard_jones)
+    vecs = np.array([utils.xyz_to_vec(lattice[:13]) for _ in range(8)])
+    tempering = ParallelTempering(vecs, np.geomspace(0.005, 0.1, 8), np.geomspace(0.005, 0.1, 8), evaluator.energies)
+    start = datetime.now()
+    for i in range(10000):
+        tempering.step(rng)
+        if i % 10 == 0:
+            tempering.swap(i//10 % 2, rng)
+    print("10000 steps of 8 replicas of 13 particles in", datetime.now()-start)
+    assert np.allclose(tempering.energies, [utils.get_energy(v, potentials.lennard_jones) for v in tempering.vecs])
+    assert np.isclose(tempering.best_energy, utils.get_energy(tempering.best_vec, potentials.lennard_jones))
+
+    print("All tests passed")
@@ -0,0 +1,134 @@
+# This module calculates the energy and the gradient of large clusters using neighbor lists
+# Only the pairs closer than the cutoff interact, the rest contributes the value of the potential at infinity.
+# The potential is smoothly switched off between switch_start and cutoff, so the energy and the forces are continuous.
+# The neighbor list contains all pairs closer than cutoff + skin, and it is rebuilt only when some particle moves by more than skin/2.
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import utils
+import potentials
+
+def switching_function(r, start, end):
+    """Returns the switching function S(r) and its derivative, S = 1 below start, 0 above end and smooth (C2) in between"""
+    x = np.clip((r-start)/(end-start), 0., 1.)
+    S = 1 - x**3*(10 - 15*x + 6*x**2)
+    dS = -30*x**2*(1-x)**2/(end-start)
+    return S, dS
+
+class NeighborListEnergy:
+    """
+    Energy and gradient of the cluster with the potential of the given name (see potentials.py) using a neighbor list.
+    The energy of each pair is V_inf + (V(r) - V_inf)*S(r), where V_inf is the value at infinity and S the switching function.
+    """
+    def __init__(self, potential_name, cutoff=3., switch_start=2.5, skin=0.3):
+        self.potential = potentials.potentials[potential_name]
+        self.derivative = potentials.derivatives[potential_name]
+        self.asymptote = potentials.asymptotes[potential_name]
+        self.cutoff = cutoff
+        self.switch_start = switch_start
+        self.skin = skin
+
+        self.pairs = None
+        self.xyz_built = None
+        self.n_builds = 0
+
+    def update(self, xyz):
+        """Rebuilds the neighbor list if it does not exist or if any particle moved by more than skin/2 since the last build"""
+        if self.pairs is not None and len(xyz) == len(self.xyz_built):
+            displacement = np.max(np.sum((xyz - self.xyz_built)**2, axis=1))
+            if displacement <= (self.skin/2)**2:
+                return
+        self.pairs = cKDTree(xyz).query_pairs(self.cutoff + self.skin, output_type="ndarray")
+        self.xyz_built = xyz.copy()
+        self.n_builds += 1
+
+    def _pair_terms(self, xyz):
+        """Returns the pair vectors, distances and the switched energies and derivatives of the pairs in the neighbor list"""
+        self.update(xyz)
+        i, j = self.pairs.T
+        diff = xyz[i] - xyz[j]
+        r = np.sqrt(np.sum(diff**2, axis=1))
+        S, dS = switching_function(r, self.switch_start, self.cutoff)
+        V = self.potential(r) - self.asymptote
+        return i, j, diff, r, V*S, self.derivative(r)*S + V*dS
+
+    def energy_and_gradient(self, xyz):
+        """Returns the energy of the cluster with the coordinates xyz [particle, 3] and its gradient [particle, 3]"""
+        i, j, diff, r, E, dE = self._pair_terms(xyz)
+        n = len(xyz)
+        energy = np.sum(E) + self.asymptote*n*(n-1)/2
+
+        forces = (dE/r)[:,None]*diff
+        gradient = np.empty(xyz.shape)
+        for d in range(3):
+            gradient[:,d] = np.bincount(i, forces[:,d], minlength=n) - np.bincount(j, forces[:,d], minlength=n)
+        return energy, gradient
+
+    def energy(self, xyz):
+        """Returns the energy of the cluster with the coordinates xyz [particle, 3]"""
+        _, _, _, _, E, _ = self._pair_terms(xyz)
+        n = len(xyz)
+        return np.sum(E) + self.asymptote*n*(n-1)/2
+
+    def gradient(self, xyz):
+        """Returns the gradient of the energy with respect to the coordinates [particle, 3]"""
+        return self.energy_and_gradient(xyz)[1]
+
+    def get_energy(self, vec):
+        """Returns the energy for the 1D vector of reduced coordinates (see utils.vec_to_xyz)"""
+        return self.energy(utils.vec_to_xyz(vec))
+
+    def get_gradient(self, vec):
+        """Returns the gradient with respect to the 1D vector of reduced coordinates"""
+        return utils.xyz_to_vec(self.gradient(utils.vec_to_xyz(vec)))
+
+    def get_energy_and_gradient(self, vec):
+        """Returns both the energy and the gradient for the 1D vector, can be used as minimize(..., jac=True)"""
+        energy, gradient = self.energy_and_gradient(utils.vec_to_xyz(vec))
+        return energy, utils.xyz_to_vec(gradient)
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+
+    print("Running tests...")
+
+    rng = np.random.default_rng(0)
+    vec = rng.random(3*10-6)*2
+
+    # With the cutoff larger than the cluster, the energy and gradient are exact
+    for name in potentials.potentials:
+        engine = NeighborListEnergy(name, cutoff=20., switch_start=19.)
+        assert np.isclose(engine.get_energy(vec), utils.get_energy(vec, potentials.potentials[name]))
+        assert np.allclose(engine.get_gradient(vec), utils.get_gradient(vec, potentials.derivatives[name]))
+
+    # The gradient is consistent with the switched energy
+    xyz = np.stack(np.meshgrid(*[np.arange(6)*1.12]*3), axis=-1).reshape(-1, 3) + rng.normal(0, 0.1, (6**3, 3))
+    engine = NeighborListEnergy("lennard-jones", cutoff=1.5, switch_start=1.2)
+    eps = 1e-6
+    numerical = np.zeros(xyz.shape)
+    for k in range(5):
+        for d in range(3):
+            shift = np.zeros(xyz.shape)
+            shift[k,d] = eps
+            numerical[k,d] = (engine.energy(xyz+shift) - engine.energy(xyz-shift))/(2*eps)
+    assert np.allclose(engine.gradient(xyz)[:5], numerical[:5], rtol=1e-4, atol=1e-6)
+
+    # The list is rebuilt only after large displacements
+    n_builds = engine.n_builds
+    engine.energy(xyz + 0.1*engine.skin)
+    assert engine.n_builds == n_builds
+    engine.energy(xyz + engine.skin)
+    assert engine.n_builds == n_builds+1
+
+    # A large cluster
+    xyz = np.stack(np.meshgrid(*[np.arange(16)*1.12]*3), axis=-1).reshape(-1, 3) + rng.normal(0, 0.02, (16**3, 3))
+    engine = NeighborListEnergy("lennard-jones")
+    start = datetime.now()
+    for _ in range(10):
+        engine.energy_and_gradient(xyz)
+    print(f"10 evaluations of energy and gradient for {len(xyz)} particles in", datetime.now()-start)
+
+    print("All tests passed")
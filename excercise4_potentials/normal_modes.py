@@ -0,0 +1,103 @@
+# This module checks whether the optimized structures are true minima, using the normal modes of the analytic Hessian
+# At a minimum, all eigenvalues of the Hessian are positive, except the 6 zero eigenvalues of the rigid-body motions
+# (3 translations and 3 rotations), which are projected out. A saddle point of order k has k negative eigenvalues.
+# All functions accept stacked structures [..., N, 3] and analyze them at once.
+
+import numpy as np
+
+import utils
+import potentials
+
+def rigid_body_modes(xyz):
+    """Returns the orthonormal basis [..., 3N, 6] of the translations and rotations of the structures [..., N, 3]"""
+    xyz = np.asarray(xyz, dtype=float)
+    centered = xyz - np.mean(xyz, axis=-2, keepdims=True)
+    translations = np.broadcast_to(np.eye(3), xyz.shape + (3,))
+    # The rotation around the axis e moves the particles by e x r
+    rotations = np.stack([np.cross(e, centered) for e in np.eye(3)], axis=-1)
+    modes = np.concatenate([translations, rotations], axis=-1).reshape(xyz.shape[:-2] + (xyz.shape[-2]*3, 6))
+    return np.linalg.qr(modes)[0]
+
+def internal_basis(xyz):
+    """Returns the orthonormal basis [..., 3N, 3N-6] of the motions orthogonal to the translations and rotations"""
+    B = rigid_body_modes(xyz)
+    Q = np.linalg.qr(B, mode="complete")[0]
+    return Q[...,6:]
+
+def normal_modes(xyz, potential_derivative, potential_second_derivative):
+    """
+    Returns the eigenvalues [..., 3N-6] (sorted from the lowest) and the normal modes [..., 3N, 3N-6] of the Hessian
+    without the rigid-body motions. All masses are 1, so the vibrational frequencies are sqrt(eigenvalues).
+    """
+    H = utils.xyz_hessian(xyz, potential_derivative, potential_second_derivative)
+    Q = internal_basis(xyz)
+    eigenvalues, vectors = np.linalg.eigh(np.swapaxes(Q, -1, -2) @ H @ Q)
+    return eigenvalues, Q @ vectors
+
+def saddle_order(eigenvalues, tol=1e-6):
+    """Returns the number of negative eigenvalues [...], 0 for a minimum. Eigenvalues smaller than tol*(the largest) are counted as zero."""
+    scale = np.max(np.abs(eigenvalues), axis=-1, keepdims=True)
+    return np.sum(eigenvalues < -tol*scale, axis=-1)
+
+def analyze(vecs, potential_name):
+    """Returns the eigenvalues and the saddle orders of the 1D vectors [..., 3N-6] of the potential with the given name"""
+    vecs = np.asarray(vecs, dtype=float)
+    # The same as utils.vec_to_xyz for each vector
+    xyz = np.zeros(vecs.shape[:-1] + (vecs.shape[-1]+6,))
+    xyz[...,utils.xyz_to_vec(np.arange(vecs.shape[-1]+6))] = vecs
+    xyz = xyz.reshape(vecs.shape[:-1] + (-1, 3))
+
+    eigenvalues, _ = normal_modes(xyz, potentials.derivatives[potential_name], potentials.second_derivatives[potential_name])
+    return eigenvalues, saddle_order(eigenvalues)
+
+
+# Run this file to run the tests
+if __name__ == "__main__":
+    from datetime import datetime
+    from scipy.optimize import minimize, minimize_scalar
+
+    print("Running tests...")
+
+    d1, d2 = potentials.lennard_jones_derivative, potentials.lennard_jones_second_derivative
+    rng = np.random.default_rng(0)
+
+    # The rigid-body modes are orthonormal and the internal basis is orthogonal to them
+    xyz = rng.random((5, 3))
+    B, Q = rigid_body_modes(xyz), internal_basis(xyz)
+    assert np.allclose(B.T @ B, np.eye(6)) and np.allclose(Q.T @ Q, np.eye(9)) and np.allclose(B.T @ Q, 0)
+
+    # The tetrahedron is a minimum, the optimal square is a saddle point of order 2 (it can fold out of the plane or distort into a rhombus)
+    r = minimize_scalar(lambda a: 6*potentials.lennard_jones(a), bounds=(0.9, 1.5), method="bounded", options={"xatol": 1e-12}).x
+    tetrahedron = np.array([[1,1,1],[1,-1,-1],[-1,1,-1],[-1,-1,1]])*r/np.sqrt(8)
+    a = minimize_scalar(lambda a: 4*potentials.lennard_jones(a) + 2*potentials.lennard_jones(a*np.sqrt(2)), bounds=(0.9, 1.5), method="bounded", options={"xatol": 1e-12}).x
+    square = np.array([[0,0,0],[a,0,0],[a,a,0],[0,a,0]])
+    eigenvalues, modes = normal_modes(np.stack([tetrahedron, square]), d1, d2)
+    assert eigenvalues.shape == (2, 6) and modes.shape == (2, 12, 6)
+    assert np.all(saddle_order(eigenvalues) == [0, 2])
+
+    # At a stationary point, the rigid-body motions do not change the energy
+    H = utils.xyz_hessian(tetrahedron, d1, d2)
+    assert np.allclose(H @ rigid_body_modes(tetrahedron), 0, atol=1e-6)
+
+    # The minimum of LJ13 (icosahedron) found by the trust-region Newton method with the analytic Hessian,
+    # which needs fewer iterations than BFGS
+    evaluator = utils.EnergyEvaluator(13, potentials.lennard_jones, d1)
+    hessian = lambda vec: utils.get_hessian(vec, d1, d2)
+    vec0 = utils.xyz_to_vec(utils.align(np.concatenate([[[0,0,0]], np.array([[0,1,1.618],[0,-1,1.618],[0,1,-1.618],[0,-1,-1.618],
+            [1,1.618,0],[-1,1.618,0],[1,-1.618,0],[-1,-1.618,0],[1.618,0,1],[-1.618,0,1],[1.618,0,-1],[-1.618,0,-1]])*0.58]) + rng.normal(0, 0.05, (13, 3))))
+    start = datetime.now()
+    newton = minimize(evaluator, vec0, jac=evaluator.gradient, hess=hessian, method="trust-ncg")
+    print("Trust-region Newton:", newton.nit, "iterations in", datetime.now()-start)
+    start = datetime.now()
+    bfgs = minimize(evaluator, vec0, jac=evaluator.gradient)
+    print("BFGS:", bfgs.nit, "iterations in", datetime.now()-start)
+    assert newton.success and np.isclose(newton.fun, -11.0817, atol=1e-4) and newton.nit < bfgs.nit
+    eigenvalues, order = analyze(newton.x, "lennard-jones")
+    assert order == 0 and np.all(eigenvalues > 0)
+
+    # Many structures at once
+    vecs = np.stack([newton.x, utils.xyz_to_vec(utils.align(rng.random((13, 3))*3))])
+    eigenvalues, order = analyze(vecs, "lennard-jones")
+    assert eigenvalues.shape == (2, 33) and order[0] == 0 and order[1] > 0
+
+    print("All tests passed")
@@ -17,4 +17,33 @@ def morse(r, re):
     V = (1-np.exp(-(r-re)))**2
     return V
 
+def lennard_jones_derivative(r):
+    """Returns the derivative of the Lennard-Jones potential dV/dr for the distance r"""
+    r6 = r**6
+    dV = (-12/(r6**2) + 6/r6)/r
+    return dV
+
+def morse_derivative(r, re):
+    """Returns the derivative of the Morse potential dV/dr for the distance r and equilibrium distance re"""
+    e = np.exp(-(r-re))
+    dV = 2*(1-e)*e
+    return dV
+
+def lennard_jones_second_derivative(r):
+    """Returns the second derivative of the Lennard-Jones potential d2V/dr2 for the distance r"""
+    r6 = r**6
+    d2V = (156/(r6**2) - 42/r6)/r**2
+    return d2V
+
+def morse_second_derivative(r, re):
+    """Returns the second derivative of the Morse potential d2V/dr2 for the distance r and equilibrium distance re"""
+    e = np.exp(-(r-re))
+    d2V = 2*e*(2*e-1)
+    return d2V
+
 potentials = {"lennard-jones": lennard_jones, "morse-1": lambda r: morse(r,1.), "morse-2": lambda r: morse(r,2.)}
+derivatives = {"lennard-jones": lennard_jones_derivative, "morse-1": lambda r: morse_derivative(r,1.), "morse-2": lambda r: morse_derivative(r,2.)}
+second_derivatives = {"lennard-jones": lennard_jones_second_derivative, "morse-1": lambda r: morse_second_derivative(r,1.), "morse-2": lambda r: morse_second_derivative(r,2.)}
+
+# The values of the potentials at infinite distance, the pairs beyond the cutoff contribute this energy (see neighbor_list.py)
+asymptotes = {"lennard-jones": 0., "morse-1": 1., "morse-2": 1.}
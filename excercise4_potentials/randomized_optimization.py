@@ -1,16 +1,29 @@
 # This script attempts to find global minimum by iteratively finding local minimum and randomizing the coordinates
-# Rus using: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]
+# Rus using: python randomized_optimization.py [potential] [number of particles] [iterations] [output file] [--cutoff=, optional] [--database=, optional] [--newton, optional] [--walkers=, optional] [--restart=, optional]
+#   --cutoff=[distance] - only the pairs closer than the cutoff interact, for large clusters (see neighbor_list.py)
+#   --database=[folder] - start from the best known minimum of this or similar size and save the improved minima (see database.py)
+#   --newton - use the trust-region Newton method with the analytic Hessian for the local minimizations (see normal_modes.py)
+#   --walkers=[number] - run this number of independent walkers in parallel processes, 0 for one per core (see basin_hopping.py)
+#   --restart=[iterations] - the parallel walkers continue from the best structure of all walkers after this number of iterations
 
 import numpy as np
 from scipy.optimize import minimize
 
 import utils
 import potentials
+from neighbor_list import NeighborListEnergy
+from database import MinimaDatabase
+from basin_hopping import parallel_basin_hopping
+from fingerprints import MinimaIndex
+import normal_modes
 
 from sys import argv
 from datetime import datetime
 
 # PARSE THE USER INPUT
+FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+argv = [arg for arg in argv if not arg.startswith("--")]
+
 if len(argv) != 5:
     print("ERROR: Incorrect number of arguments")
     print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
@@ -18,6 +31,7 @@ if len(argv) != 5:
 
 if argv[1] in potentials.potentials:
     POTENTIAL = potentials.potentials[argv[1]]
+    POTENTIAL_DERIVATIVE = potentials.derivatives[argv[1]]
 else:
     print(f"ERROR: Unknown potential '{argv[1]}'")
     print("The possible potentials are:", ', '.join(potentials.potentials.keys()))
@@ -49,6 +63,30 @@ if not FILENAME.endswith(".xyz"):
     print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
     exit()
 
+CUTOFF = None
+DATABASE = None
+NEWTON = False
+N_WALKERS = None
+RESTART = None
+for flag in FLAGS:
+    try:
+        if flag.startswith("--cutoff="):
+            CUTOFF = float(flag[9:])
+        elif flag.startswith("--database="):
+            DATABASE = MinimaDatabase(flag[11:])
+        elif flag == "--newton":
+            NEWTON = True
+        elif flag.startswith("--walkers="):
+            N_WALKERS = int(flag[10:])
+        elif flag.startswith("--restart="):
+            RESTART = int(flag[10:])
+    except:
+        print(f"ERROR: Could not parse {flag}")
+        exit()
+if NEWTON and CUTOFF is not None:
+    print("ERROR: --newton and --cutoff can not be used together")
+    exit()
+
 # INITIALIZE VARIABLES
 
 # Amplitudes used for randomization
@@ -56,8 +94,30 @@ RANDOMIZATION = np.linspace(2.,0.,ITERATIONS)
 
 # Initialize position of all particles randomly in a 8x8x8 box around origin
 POS0 = np.random.rand(N_PARTICLES*3-6)*8-4
+vec0 = None
+if DATABASE is not None:
+    # Warm start from the best known minimum (see database.py)
+    vec0, source = DATABASE.initial_vec(argv[1], N_PARTICLES)
+    if vec0 is not None:
+        print(f"Starting from the {source}")
+        POS0 = vec0
+
+if CUTOFF is None:
+    # All pairs are evaluated in preallocated arrays (see utils.EnergyEvaluator)
+    evaluator = utils.EnergyEvaluator(N_PARTICLES, POTENTIAL, POTENTIAL_DERIVATIVE)
+    energy_fun = evaluator
+    gradient_fun = evaluator.gradient
+else:
+    # Large clusters, only the pairs within the cutoff are evaluated (see neighbor_list.py)
+    engine = NeighborListEnergy(argv[1], cutoff=CUTOFF, switch_start=CUTOFF*5/6)
+    energy_fun = engine.get_energy
+    gradient_fun = engine.get_gradient
 
-energy_fun = lambda vec: utils.get_energy(vec, POTENTIAL)
+# The options of the local minimizations
+MINIMIZE_OPTIONS = {}
+if NEWTON:
+    POTENTIAL_SECOND_DERIVATIVE = potentials.second_derivatives[argv[1]]
+    MINIMIZE_OPTIONS = {"method": "trust-ncg", "hess": lambda vec: utils.get_hessian(vec, POTENTIAL_DERIVATIVE, POTENTIAL_SECOND_DERIVATIVE)}
 
 # RUN THE OPTIMIZATION
 
@@ -67,23 +127,33 @@ start = datetime.now()
 pos0 = POS0
 best_energy = np.inf
 best_vec = pos0
-for i, rnd in enumerate(RANDOMIZATION):
-    solution = minimize(energy_fun, pos0, tol=1e-5)
-    if not solution.success:
-        print("WARNING: Solution did not converge, skipping this iteration")
-        print(solution.message)
-
-        pos0 = best_vec + np.random.randn(len(solution.x))*rnd
-        continue
-    energy = energy_fun(solution.x)
-    if energy < best_energy:
-        best_energy = energy
-        best_vec = solution.x
-
-    print(f"Iter {i}: E = {energy_fun(best_vec)}")
-    pos0 = best_vec + np.random.randn(len(solution.x))*rnd
+if N_WALKERS is not None:
+    # Independent walkers in parallel processes, which share the best structure (see basin_hopping.py)
+    best_energy, best_vec, walker_energies, index = parallel_basin_hopping(argv[1], N_PARTICLES, ITERATIONS, n_walkers=N_WALKERS,
+                                                                    restart_interval=RESTART, cutoff=CUTOFF, initial_vec=vec0, newton=NEWTON)
+    print("Best energies of the walkers:", ', '.join(f"{e:0.4f}" for e in walker_energies))
+else:
+    # The visited minima, the randomization is larger after falling into an already visited minimum (see fingerprints.py)
+    index = MinimaIndex()
+    for i, rnd in enumerate(RANDOMIZATION):
+        solution = minimize(energy_fun, pos0, jac=gradient_fun, tol=1e-5, **MINIMIZE_OPTIONS)
+        if not solution.success:
+            print("WARNING: Solution did not converge, skipping this iteration")
+            print(solution.message)
+
+            pos0 = best_vec + np.random.randn(len(solution.x))*rnd
+            continue
+        energy = energy_fun(solution.x)
+        if energy < best_energy:
+            best_energy = energy
+            best_vec = solution.x
+        idx, new = index.add(energy, solution.x)
+
+        print(f"Iter {i}: E = {energy_fun(best_vec)}" + ("" if new else f" (minimum visited {index.visits[idx]}x)"))
+        pos0 = best_vec + np.random.randn(len(solution.x))*rnd*np.sqrt(index.visits[idx])
 
 print(f"Minimization ended in {datetime.now()-start}")
+print(index.summary())
 
 # PRINT AND SAVE THE RESULTS
 
@@ -91,8 +161,25 @@ energy = energy_fun(best_vec)
 
 print(f"Minimum energy = {energy:0.4f}")
 
-print("Distance matrix:")
-print(utils.distance_matrix_to_str(best_vec))
+# Check that the structure is a minimum, not a saddle point (see normal_modes.py)
+if CUTOFF is None:
+    eigenvalues, order = normal_modes.analyze(best_vec, argv[1])
+    if order == 0:
+        print(f"The structure is a minimum, the lowest normal mode eigenvalue is {eigenvalues[0]:0.4f}")
+    else:
+        print(f"WARNING: The structure is a saddle point with {order} negative normal mode eigenvalues, the lowest is {eigenvalues[0]:0.4f}")
+
+# The distance matrix of large clusters is too large to print
+if CUTOFF is None:
+    print("Distance matrix:")
+    print(utils.distance_matrix_to_str(best_vec))
 
 utils.save_coordinates(best_vec, FILENAME, f"Optimized solution, E = {energy:0.4f}")
-print(f"Coordinates saved to {FILENAME}")
\ No newline at end of file
+print(f"Coordinates saved to {FILENAME}")
+
+# The energies with a cutoff are not exact, so they are not saved to the database
+if DATABASE is not None and CUTOFF is None:
+    if DATABASE.save(argv[1], N_PARTICLES, energy, best_vec):
+        print("New best known minimum saved to the database")
+    else:
+        print("The database already contains the same or a better minimum")
\ No newline at end of file
@@ -1,5 +1,11 @@
 # This script attempts to find the global minimum using simulated annealing
-# Use as: python simulated_annealing.py [potential] [number of particles] [iterations] [output file]
+# Use as: python simulated_annealing.py [potential] [number of particles] [iterations] [output file] [--cutoff=, optional] [--database=, optional] [--newton, optional] [--float32, optional] [--single-particle, optional] [--tempering=, optional]
+#   --cutoff=[distance] - only the pairs closer than the cutoff interact, for large clusters (see neighbor_list.py)
+#   --database=[folder] - start from the best known minimum of this or similar size and save the improved minima (see database.py)
+#   --newton - use the trust-region Newton method with the analytic Hessian for the local minimizations (see normal_modes.py)
+#   --float32 - evaluate the energies of the annealing steps in single precision (faster for large clusters), the refinement is always in double precision
+#   --single-particle - move a single particle in each iteration, its energy is updated in O(N) instead of O(N^2) (see monte_carlo.py)
+#   --tempering=[replicas] - parallel tempering, the replicas at fixed temperatures from 0.005 to 0.08 exchange their configurations (see monte_carlo.py)
 
 import numpy as np
 from matplotlib import pyplot as plt
@@ -7,18 +13,27 @@ from scipy.optimize import minimize
 
 import utils
 import potentials
+from neighbor_list import NeighborListEnergy
+from database import MinimaDatabase
+from monte_carlo import IncrementalEnergy, ParallelTempering
+import normal_modes
 
 from sys import argv
 from datetime import datetime
 
 # PARSE THE USER INPUT
+USAGE = "Use: python simulated_annealing.py [potential] [number of particles] [iterations] [output file] [--cutoff=, --database=, --newton, --float32, --single-particle, --tempering=, optional]"
+FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+argv = [arg for arg in argv if not arg.startswith("--")]
+
 if len(argv) != 5:
     print("ERROR: Incorrect number of arguments")
-    print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
+    print(USAGE)
     exit()
 
 if argv[1] in potentials.potentials:
     POTENTIAL = potentials.potentials[argv[1]]
+    POTENTIAL_DERIVATIVE = potentials.derivatives[argv[1]]
 else:
     print(f"ERROR: Unknown potential '{argv[1]}'")
     print("The possible potentials are:", ', '.join(potentials.potentials.keys()))
@@ -28,7 +43,7 @@ try:
     N_PARTICLES = int(argv[2])
 except:
     print(f"ERROR: Could not parse the number of particles '{argv[2]}'")
-    print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
+    print(USAGE)
     exit()
 if N_PARTICLES < 3:
     print(f"ERROR: The number of particles must be at least 3, not {N_PARTICLES}")
@@ -38,7 +53,7 @@ try:
     ITERATIONS = int(argv[3])
 except:
     print(f"ERROR: Could not parse the number of iterations '{argv[3]}'")
-    print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
+    print(USAGE)
     exit()
 if ITERATIONS < 100:
     print(f"ERROR: The number of iterations must be at least 100, not {ITERATIONS}")
@@ -47,7 +62,46 @@ if ITERATIONS < 100:
 FILENAME = argv[4]
 if not FILENAME.endswith(".xyz"):
     print(f"ERROR: the output file must be .xyz, not {FILENAME}")
-    print("Use: python randomized_optimization.py [potential] [number of particles] [iterations] [output file]")
+    print(USAGE)
+    exit()
+
+CUTOFF = None
+DATABASE = None
+NEWTON = False
+DTYPE = np.float64
+SINGLE_PARTICLE = False
+N_REPLICAS = None
+for flag in FLAGS:
+    try:
+        if flag.startswith("--cutoff="):
+            CUTOFF = float(flag[9:])
+        elif flag.startswith("--database="):
+            DATABASE = MinimaDatabase(flag[11:])
+        elif flag == "--newton":
+            NEWTON = True
+        elif flag == "--float32":
+            DTYPE = np.float32
+        elif flag == "--single-particle":
+            SINGLE_PARTICLE = True
+        elif flag.startswith("--tempering="):
+            N_REPLICAS = int(flag[12:])
+    except:
+        print(f"ERROR: Could not parse {flag}")
+        exit()
+if NEWTON and CUTOFF is not None:
+    print("ERROR: --newton and --cutoff can not be used together")
+    exit()
+if N_REPLICAS is not None and N_REPLICAS < 2:
+    print(f"ERROR: The number of replicas must be at least 2, not {N_REPLICAS}")
+    exit()
+if SINGLE_PARTICLE and (CUTOFF is not None or DTYPE != np.float64):
+    print("ERROR: --single-particle can not be used together with --cutoff or --float32")
+    exit()
+if N_REPLICAS is not None and CUTOFF is not None:
+    print("ERROR: --tempering and --cutoff can not be used together")
+    exit()
+if N_REPLICAS is not None and SINGLE_PARTICLE:
+    print("ERROR: --tempering and --single-particle can not be used together")
     exit()
 
 # INITIALIZE VARIABLES
@@ -55,10 +109,43 @@ TIME = np.linspace(0,1,ITERATIONS)
 TEMP = (1-TIME)*0.1+1e-7
 RANDOMIZATION = TEMP*1.
 
+# The temperatures of the replicas in parallel tempering, the replicas are swapped every SWAP_INTERVAL iterations
+if N_REPLICAS is not None:
+    TEMP_LADDER = np.geomspace(0.005, 0.08, N_REPLICAS)
+    SWAP_INTERVAL = 10
+
 # Initialize position of all particles randomly in a 8x8x8 box around origin
 POS0 = np.random.rand(N_PARTICLES*3-6)*8-4
+vec0 = None
+if DATABASE is not None:
+    # Warm start from the best known minimum (see database.py)
+    vec0, source = DATABASE.initial_vec(argv[1], N_PARTICLES)
+    if vec0 is not None:
+        print(f"Starting from the {source}")
+        POS0 = vec0
+
+if CUTOFF is None:
+    # All pairs are evaluated in preallocated arrays (see utils.EnergyEvaluator)
+    evaluator = utils.EnergyEvaluator(N_PARTICLES, POTENTIAL, POTENTIAL_DERIVATIVE)
+    energy_fun = evaluator
+    gradient_fun = evaluator.gradient
+else:
+    # Large clusters, only the pairs within the cutoff are evaluated (see neighbor_list.py)
+    engine = NeighborListEnergy(argv[1], cutoff=CUTOFF, switch_start=CUTOFF*5/6)
+    energy_fun = engine.get_energy
+    gradient_fun = engine.get_gradient
 
-energy_fun = lambda vec: utils.get_energy(vec, POTENTIAL)
+# The options of the local minimizations
+MINIMIZE_OPTIONS = {}
+if NEWTON:
+    POTENTIAL_SECOND_DERIVATIVE = potentials.second_derivatives[argv[1]]
+    MINIMIZE_OPTIONS = {"method": "trust-ncg", "hess": lambda vec: utils.get_hessian(vec, POTENTIAL_DERIVATIVE, POTENTIAL_SECOND_DERIVATIVE)}
+
+# The energies of the annealing steps, optionally in single precision
+if DTYPE == np.float64 or CUTOFF is not None:
+    step_energy_fun = energy_fun
+else:
+    step_energy_fun = utils.EnergyEvaluator(N_PARTICLES, POTENTIAL, dtype=DTYPE)
 
 # RUN SIMULATED ANNEALING
 print("Minimizing energy...")
@@ -70,31 +157,81 @@ curr_e = 999.
 curr_vec = POS0
 energies = []
 iters = []
-for i, (rnd, temp) in enumerate(zip(RANDOMIZATION, TEMP)):
-    test_vec = curr_vec + np.random.randn(len(curr_vec))*rnd
-    test_e = energy_fun(test_vec)
+if N_REPLICAS is not None:
+    # All replicas are moved at once, their energies are evaluated in one call (see utils.EnergyEvaluator.energies)
+    replica_energy_fun = utils.EnergyEvaluator(N_PARTICLES, POTENTIAL, dtype=DTYPE).energies
+    replicas = np.random.rand(N_REPLICAS, N_PARTICLES*3-6)*8-4
+    if vec0 is not None:
+        replicas[:] = vec0
+    tempering = ParallelTempering(replicas, TEMP_LADDER, TEMP_LADDER, replica_energy_fun)
+    for i in range(ITERATIONS):
+        accepted = tempering.step()
+        if i % SWAP_INTERVAL == 0:
+            tempering.swap(i//SWAP_INTERVAL % 2)
+        # The coldest replica
+        if accepted[0]:
+            energies.append(tempering.energies[0])
+            iters.append(i)
+    best_e = tempering.best_energy
+    best_vec = tempering.best_vec
+    print("Swap acceptance ratios:", ', '.join(f"{r:0.2f}" for r in tempering.n_swaps_accepted/np.maximum(tempering.n_swaps, 1)))
+elif SINGLE_PARTICLE:
+    # Only one particle is moved in each step and only its pairs are recalculated (see monte_carlo.py)
+    system = IncrementalEnergy(POS0, POTENTIAL)
+    curr_e = system.energy
+    for i, (rnd, temp) in enumerate(zip(RANDOMIZATION, TEMP)):
+        k, position = system.random_move(rnd)
+        if max(abs(position) > 5.):
+            continue
+        test_e = system.trial(k, position)
+
+        dE = test_e - curr_e
+        if dE < 0:
+            prob = 1
+        else:
+            prob = np.exp(-dE/temp)
+
+        if prob >= np.random.rand():
+            system.accept()
+            curr_e = test_e
+            energies.append(curr_e)
+            iters.append(i)
+            if curr_e < best_e:
+                best_e = curr_e
+                best_vec = system.vec
+        else:
+            system.reject()
+
+        # Remove the accumulated rounding errors
+        if i % 10000 == 0:
+            system.refresh()
+            curr_e = system.energy
+else:
+    for i, (rnd, temp) in enumerate(zip(RANDOMIZATION, TEMP)):
+        test_vec = curr_vec + np.random.randn(len(curr_vec))*rnd
+        test_e = step_energy_fun(test_vec)
 
-    if max(abs(test_vec) > 5.):# or test_e > 5.:
-        continue
+        if max(abs(test_vec) > 5.):# or test_e > 5.:
+            continue
     
-    if test_e < best_e:
-        best_e = test_e
-        best_vec = test_vec
+        if test_e < best_e:
+            best_e = test_e
+            best_vec = test_vec
 
-    dE = test_e - curr_e
-    if dE < 0:
-        prob = 1
-    else:
-        prob = np.exp(-dE/temp)
+        dE = test_e - curr_e
+        if dE < 0:
+            prob = 1
+        else:
+            prob = np.exp(-dE/temp)
 
-    if prob >= np.random.rand():
-        curr_e = test_e
-        curr_vec = test_vec
-        energies.append(curr_e)
-        iters.append(i)
+        if prob >= np.random.rand():
+            curr_e = test_e
+            curr_vec = test_vec
+            energies.append(curr_e)
+            iters.append(i)
 
 # Refine the result
-solution = minimize(energy_fun, best_vec)
+solution = minimize(energy_fun, best_vec, jac=gradient_fun, **MINIMIZE_OPTIONS)
 if not solution.success:
         print("WARNING: Solution did not converge")
         print(solution.message)
@@ -111,12 +248,29 @@ print(f"Minimization ended in {datetime.now()-start}")
 
 print(f"Minimum energy = {best_e:0.4f}")
 
-print("Distance matrix:")
-print(utils.distance_matrix_to_str(best_vec))
+# Check that the structure is a minimum, not a saddle point (see normal_modes.py)
+if CUTOFF is None:
+    eigenvalues, order = normal_modes.analyze(best_vec, argv[1])
+    if order == 0:
+        print(f"The structure is a minimum, the lowest normal mode eigenvalue is {eigenvalues[0]:0.4f}")
+    else:
+        print(f"WARNING: The structure is a saddle point with {order} negative normal mode eigenvalues, the lowest is {eigenvalues[0]:0.4f}")
+
+# The distance matrix of large clusters is too large to print
+if CUTOFF is None:
+    print("Distance matrix:")
+    print(utils.distance_matrix_to_str(best_vec))
 
 utils.save_coordinates(best_vec, FILENAME, f"Optimized solution, E = {best_e:0.4f}")
 print(f"Coordinates saved to {FILENAME}")
 
+# The energies with a cutoff are not exact, so they are not saved to the database
+if DATABASE is not None and CUTOFF is None:
+    if DATABASE.save(argv[1], N_PARTICLES, best_e, best_vec):
+        print("New best known minimum saved to the database")
+    else:
+        print("The database already contains the same or a better minimum")
+
 # Show the energy over iterations
 plt.plot(iters, energies)
 plt.show()
\ No newline at end of file
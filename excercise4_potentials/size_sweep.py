@@ -0,0 +1,179 @@
+# This script finds the global minima of many cluster sizes for one or more potentials, the tasks run in parallel processes
+# Run using: python size_sweep.py [potentials] [smallest N] [largest N] [output folder] [--seeds=, --time=, --workers=, optional]
+#   [potentials] - comma separated names of the potentials (e.g. lennard-jones,morse-1) or "all"
+#   [smallest N], [largest N] - the range of the numbers of particles
+#   [output folder] - the folder for the results table (results.csv), the structures (xyz/) and the database of the best minima (database/)
+#   --seeds=[number] - number of independent searches of each size (default 1)
+#   --time=[seconds] - the time of one search of 10 particles, larger clusters get proportionally more time (default 10)
+#   --workers=[number] - number of worker processes (all cores by default)
+#
+# Each task (potential, N, seed) runs basin hopping (see basin_hopping.py) in rounds until its time is up, each round continues from the best structure.
+# The tasks start from the best known minima in the database, which is filled by the finished tasks. A task of N starts only after
+# all tasks of N-1 of the same potential have finished, so it can grow its starting structure from their minimum.
+# Each finished task is immediately appended to results.csv, an interrupted sweep continues with the unfinished tasks when it is run again.
+
+import numpy as np
+
+from multiprocessing import Pool
+from datetime import datetime
+from sys import argv
+import os
+import time
+import queue
+
+import utils
+import potentials
+from basin_hopping import SharedBest, walk
+from database import MinimaDatabase
+
+HEADER = "potential;N;seed;energy;time;file"
+ITERATIONS_PER_ROUND = 10
+
+def time_budget(n_particles, base_time):
+    """Returns the time of one search, proportional to the number of particles (base_time for 10 particles)"""
+    return base_time*n_particles/10
+
+def run_task(potential_name, n_particles, seed, base_time, folder):
+    """
+    Searches for the global minimum of the cluster and saves the structure to the xyz folder and to the database.
+    Returns the row of the results table.
+    """
+    start = time.perf_counter()
+    database = MinimaDatabase(os.path.join(folder, "database"))
+    vec, _ = database.initial_vec(potential_name, n_particles)
+    seeds = np.random.SeedSequence([seed, n_particles, list(potentials.potentials).index(potential_name)])
+
+    # At least one round is run, even if the time is shorter
+    best_energy = np.inf
+    rounds = 0
+    while rounds == 0 or time.perf_counter() - start < time_budget(n_particles, base_time):
+        energy, round_vec, _ = walk(potential_name, n_particles, ITERATIONS_PER_ROUND, seeds.spawn(1)[0], SharedBest(n_particles*3-6),
+                                    initial_vec=vec, verbose=False)
+        if energy < best_energy:
+            best_energy, vec = energy, round_vec
+        rounds += 1
+
+    # All minimizations failed, nothing is saved
+    if best_energy == np.inf:
+        return f"{potential_name};{n_particles};{seed};inf;{time.perf_counter()-start:0.1f};"
+
+    filename = os.path.join("xyz", f"{potential_name}_{n_particles}_{seed}.xyz")
+    utils.save_coordinates(vec, os.path.join(folder, filename), f"{potential_name}, E = {best_energy:0.4f}")
+    database.save(potential_name, n_particles, best_energy, vec)
+    return f"{potential_name};{n_particles};{seed};{best_energy!r};{time.perf_counter()-start:0.1f};{filename}"
+
+def read_results(filename):
+    """Returns the rows of the results table as a list of (potential, N, seed, energy), an empty list if the file does not exist"""
+    if not os.path.exists(filename):
+        return []
+    rows = []
+    with open(filename, "r") as f:
+        for line in f.readlines()[1:]:
+            values = line.strip().split(";")
+            # A line can be incomplete if the sweep was interrupted while writing it
+            if len(values) == len(HEADER.split(";")):
+                rows.append((values[0], int(values[1]), int(values[2]), float(values[3])))
+    return rows
+
+
+if __name__ == "__main__":
+    USAGE = "Use: python size_sweep.py [potentials] [smallest N] [largest N] [output folder] [--seeds=, --time=, --workers=, optional]"
+
+    FLAGS = [arg for arg in argv[1:] if arg.startswith("--")]
+    argv = [arg for arg in argv if not arg.startswith("--")]
+
+    if len(argv) != 5:
+        print("ERROR: Incorrect number of arguments")
+        print(USAGE)
+        exit()
+
+    POTENTIALS = list(potentials.potentials) if argv[1] == "all" else argv[1].split(",")
+    for name in POTENTIALS:
+        if name not in potentials.potentials:
+            print(f"ERROR: Unknown potential '{name}'")
+            print("The possible potentials are:", ', '.join(potentials.potentials.keys()))
+            exit()
+
+    try:
+        N_MIN, N_MAX = int(argv[2]), int(argv[3])
+    except:
+        print(f"ERROR: Could not parse the numbers of particles '{argv[2]}', '{argv[3]}'")
+        print(USAGE)
+        exit()
+    if N_MIN < 3 or N_MAX < N_MIN:
+        print(f"ERROR: The numbers of particles must be at least 3 and the largest must not be smaller than the smallest, not {N_MIN}, {N_MAX}")
+        exit()
+
+    FOLDER = argv[4]
+
+    N_SEEDS, BASE_TIME, WORKERS = 1, 10., None
+    for flag in FLAGS:
+        try:
+            if flag.startswith("--seeds="):
+                N_SEEDS = int(flag[8:])
+            elif flag.startswith("--time="):
+                BASE_TIME = float(flag[7:])
+            elif flag.startswith("--workers="):
+                WORKERS = int(flag[10:])
+        except:
+            print(f"ERROR: Could not parse {flag}")
+            exit()
+
+    os.makedirs(os.path.join(FOLDER, "xyz"), exist_ok=True)
+    RESULTS = os.path.join(FOLDER, "results.csv")
+
+    # The finished tasks are skipped
+    done = {(name, n, seed) for name, n, seed, _ in read_results(RESULTS)}
+    tasks = [(name, n, seed, BASE_TIME, FOLDER) for n in range(N_MIN, N_MAX+1) for name in POTENTIALS for seed in range(N_SEEDS)
+             if (name, n, seed) not in done]
+    if not os.path.exists(RESULTS):
+        with open(RESULTS, "w") as f:
+            f.write(HEADER + "\n")
+
+    print(f"Running {len(tasks)} tasks ({len(done)} already finished)...")
+    start = datetime.now()
+
+    # A line left incomplete by an interrupted sweep is ended, so that the next row starts on its own line
+    with open(RESULTS, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        incomplete = False
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            incomplete = f.read(1) != b"\n"
+    if incomplete:
+        with open(RESULTS, "a") as f:
+            f.write("\n")
+
+    # The task of N starts only after all tasks of N-1 of the same potential have finished, so that it can start from their minimum
+    remaining = {}
+    for name, n, *_ in tasks:
+        remaining[(name, n)] = remaining.get((name, n), 0) + 1
+    waiting = list(tasks)
+    finished = queue.Queue()
+    with Pool(WORKERS) as pool, open(RESULTS, "a") as f:
+        def submit_ready():
+            for task in [task for task in waiting if remaining.get((task[0], task[1]-1), 0) == 0]:
+                waiting.remove(task)
+                pool.apply_async(run_task, task, callback=lambda row, task=task: finished.put((task, row)),
+                                 error_callback=lambda ex, task=task: finished.put((task, ex)))
+
+        submit_ready()
+        for i in range(len(tasks)):
+            task, row = finished.get()
+            if isinstance(row, Exception):
+                raise row
+            f.write(row + "\n")
+            f.flush()
+            print(f"[{i+1}/{len(tasks)}] {row}")
+            remaining[(task[0], task[1])] -= 1
+            submit_ready()
+
+    print("Finished in", datetime.now()-start)
+
+    # The best energy of each potential and size
+    best = {}
+    for name, n, _, energy in read_results(RESULTS):
+        best[(name, n)] = min(energy, best.get((name, n), np.inf))
+    print("potential;N;best energy")
+    for (name, n), energy in sorted(best.items()):
+        print(f"{name};{n};{energy:0.4f}")
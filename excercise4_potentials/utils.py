@@ -15,6 +15,32 @@ def vec_to_xyz(vec):
 
     return xyz
 
+def xyz_to_vec(xyz):
+    """
+    Converts the xyz coordinates into 1D vector of values, the inverse of vec_to_xyz.
+    The redundant coordinates (x1,y1,z1,x2,y2,x3) are left out.
+    """
+    vec = np.ravel(xyz)
+    return np.delete(vec, [0,1,2,3,4,6])
+
+def align(xyz):
+    """
+    Translates and rotates the xyz coordinates, so that the redundant coordinates (x1,y1,z1,x2,y2,x3) are 0.
+    The first particle is moved to the origin, the second to the z axis and the third to the yz plane.
+    """
+    xyz = np.array(xyz, dtype=float) - xyz[0]
+    e_z = xyz[1]/np.linalg.norm(xyz[1])
+    v = xyz[2] - np.dot(xyz[2], e_z)*e_z
+    if np.linalg.norm(v) < 1e-12:
+        # The first three particles are on a line, any direction perpendicular to it can be used
+        v = np.cross(e_z, np.eye(3)[np.argmin(np.abs(e_z))])
+    e_y = v/np.linalg.norm(v)
+    e_x = np.cross(e_y, e_z)
+    xyz = xyz @ np.array([e_x, e_y, e_z]).T
+    # Remove the rounding errors
+    xyz.flat[[0,1,2,3,4,6]] = 0.
+    return xyz
+
 def distance_matrix(xyz):
     """Returns the distance matrix for the given coordinates"""
     N = len(xyz)
@@ -45,6 +71,105 @@ def get_energy(vec, potential):
     energy = sum_potential(dist_mat, potential)
     return energy
 
+def get_gradient(vec, potential_derivative):
+    """
+    Returns the gradient of the potential energy with respect to the 1D vector, potential_derivative is dV/dr.
+    The gradient with respect to the xyz coordinates of particle i is sum_j dV/dr(r_ij)*(xyz_i-xyz_j)/r_ij,
+    the gradient with respect to the vector is the same without the redundant coordinates.
+    """
+    xyz = vec_to_xyz(vec)
+    diff = xyz[:,None,:] - xyz[None,:,:]
+    dist_mat = distance_matrix(xyz)
+
+    # The diagonal is set to 1 to prevent division-by-zero errors, its contributions are zero because diff is zero
+    np.fill_diagonal(dist_mat, 1.)
+    dV = potential_derivative(dist_mat)/dist_mat
+    gradient = np.sum(dV[:,:,None]*diff, axis=1)
+
+    return xyz_to_vec(gradient)
+
+def xyz_hessian(xyz, potential_derivative, potential_second_derivative):
+    """
+    Returns the Hessian [..., 3N, 3N] of the potential energy with respect to the xyz coordinates [..., N, 3].
+    The pair i,j with the unit vector u = (xyz_i-xyz_j)/r contributes the block K = d2V/dr2*u*u^T + dV/dr/r*(1 - u*u^T)
+    to the diagonal blocks ii and jj and -K to the blocks ij and ji.
+    """
+    xyz = np.asarray(xyz, dtype=float)
+    N = xyz.shape[-2]
+    i, j = np.triu_indices(N, k=1)
+    diff = xyz[...,i,:] - xyz[...,j,:]
+    r = np.sqrt(np.sum(diff**2, axis=-1))
+    u = diff/r[...,None]
+    uu = u[...,:,None]*u[...,None,:]
+    dV_r = (potential_derivative(r)/r)[...,None,None]
+    K = potential_second_derivative(r)[...,None,None]*uu + dV_r*(np.eye(3) - uu)
+
+    H = np.zeros(xyz.shape[:-2] + (N, N, 3, 3))
+    H[...,i,j,:,:] = -K
+    H[...,j,i,:,:] = -K
+    H[...,np.arange(N),np.arange(N),:,:] = -np.sum(H, axis=-3)
+    return np.swapaxes(H, -3, -2).reshape(xyz.shape[:-2] + (3*N, 3*N))
+
+def get_hessian(vec, potential_derivative, potential_second_derivative):
+    """Returns the Hessian of the potential energy with respect to the 1D vector, the redundant coordinates are left out"""
+    free = xyz_to_vec(np.arange(len(vec)+6))
+    return xyz_hessian(vec_to_xyz(vec), potential_derivative, potential_second_derivative)[np.ix_(free, free)]
+
+class EnergyEvaluator:
+    """
+    Evaluates the energy (and the gradient) of the system with n_particles for 1D vectors, a faster replacement of get_energy.
+    The unique pairs i<j are precomputed and the coordinate and distance arrays are allocated once and reused in every call,
+    the evaluations of the potential (and its derivative) still allocate temporary arrays of the pair length, as does energies.
+    Use dtype=np.float32 to evaluate in single precision.
+    """
+    def __init__(self, n_particles, potential, potential_derivative=None, dtype=np.float64):
+        self.potential = potential
+        self.potential_derivative = potential_derivative
+        self.dtype = np.dtype(dtype)
+
+        self.i, self.j = np.triu_indices(n_particles, k=1)
+        # The positions of the vector values in the flattened xyz coordinates (see vec_to_xyz)
+        self.free = xyz_to_vec(np.arange(3*n_particles))
+
+        self.xyz = np.zeros((n_particles, 3), dtype=self.dtype)
+        self.xyz_i = np.empty((len(self.i), 3), dtype=self.dtype)
+        self.xyz_j = np.empty((len(self.i), 3), dtype=self.dtype)
+        self.diff = np.empty((len(self.i), 3), dtype=self.dtype)
+        self.r = np.empty(len(self.i), dtype=self.dtype)
+        self.grad = np.empty((n_particles, 3))
+
+    def _distances(self, vec):
+        """Fills the pair difference vectors and distances for the vector"""
+        self.xyz.flat[self.free] = vec
+        np.take(self.xyz, self.i, axis=0, out=self.xyz_i)
+        np.take(self.xyz, self.j, axis=0, out=self.xyz_j)
+        np.subtract(self.xyz_i, self.xyz_j, out=self.diff)
+        np.einsum("ij,ij->i", self.diff, self.diff, out=self.r)
+        np.sqrt(self.r, out=self.r)
+
+    def __call__(self, vec):
+        """Returns the potential energy, the same as get_energy(vec, potential)"""
+        self._distances(vec)
+        return float(np.sum(self.potential(self.r), dtype=np.float64))
+
+    def gradient(self, vec):
+        """Returns the gradient of the potential energy, the same as get_gradient(vec, potential_derivative)"""
+        self._distances(vec)
+        # The forces of the pairs are stored in place of the difference vectors
+        self.diff *= (self.potential_derivative(self.r)/self.r)[:,None]
+        for d in range(3):
+            self.grad[:,d] = np.bincount(self.i, self.diff[:,d], minlength=len(self.xyz))
+            self.grad[:,d] -= np.bincount(self.j, self.diff[:,d], minlength=len(self.xyz))
+        return self.grad.flat[self.free]
+
+    def energies(self, vecs):
+        """Returns the potential energies [R] of R stacked vectors [R, 3N-6], all pairs of all vectors are evaluated at once"""
+        xyz = np.zeros((len(vecs), self.xyz.size), dtype=self.dtype)
+        xyz[:,self.free] = vecs
+        xyz = xyz.reshape(len(vecs), -1, 3)
+        r = np.sqrt(np.sum((xyz[:,self.i] - xyz[:,self.j])**2, axis=2))
+        return np.sum(self.potential(r), axis=1, dtype=np.float64)
+
 def save_coordinates(vec, filename, note):
     xyz = vec_to_xyz(vec)
     with open(filename, 'w') as f:
@@ -53,6 +178,14 @@ def save_coordinates(vec, filename, note):
         for line in xyz:
             f.write("H {: .5f}  {: .5f} {: .5f}\n".format(*line))
 
+def load_coordinates(filename):
+    """Returns the xyz coordinates and the note (the second line) from the .xyz file saved by save_coordinates"""
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    n = int(lines[0])
+    xyz = np.array([[float(x) for x in line.split()[1:4]] for line in lines[2:2+n]])
+    return xyz, lines[1].strip()
+
 def distance_matrix_to_str(vec):
     """Returns string representation of the distance matrix"""
     xyz = vec_to_xyz(vec)
@@ -76,4 +209,39 @@ if __name__ == '__main__':
 
     assert abs(sum_potential(dist_mat, potentials.lennard_jones) - (1/2**6-1/2**3)) < 1e-5
 
+    vec = np.random.default_rng(0).random(3*7-6)*2
+    assert (xyz_to_vec(vec_to_xyz(vec)) == vec).all()
+
+    # Aligned coordinates are the same cluster with zero redundant coordinates
+    xyz = np.random.default_rng(2).random((7,3))
+    aligned = align(xyz)
+    assert np.allclose(distance_matrix(aligned), distance_matrix(xyz))
+    assert np.allclose(vec_to_xyz(xyz_to_vec(aligned)), aligned)
+    assert np.allclose(align(vec_to_xyz(vec)), vec_to_xyz(vec))
+
+    # The Hessians of stacked coordinates
+    stack = np.stack([vec_to_xyz(vec), xyz])
+    H = xyz_hessian(stack, potentials.lennard_jones_derivative, potentials.lennard_jones_second_derivative)
+    assert H.shape == (2, 21, 21)
+    assert np.allclose(H[1], xyz_hessian(xyz, potentials.lennard_jones_derivative, potentials.lennard_jones_second_derivative))
+
+    # The analytic gradients match finite differences
+    eps = 1e-6
+    for name, potential in potentials.potentials.items():
+        numerical = np.array([(get_energy(vec+eps*e, potential) - get_energy(vec-eps*e, potential))/(2*eps) for e in np.eye(len(vec))])
+        assert np.allclose(get_gradient(vec, potentials.derivatives[name]), numerical, rtol=1e-5, atol=1e-5)
+        numerical = np.array([(get_gradient(vec+eps*e, potentials.derivatives[name]) - get_gradient(vec-eps*e, potentials.derivatives[name]))/(2*eps)
+                              for e in np.eye(len(vec))])
+        hessian = get_hessian(vec, potentials.derivatives[name], potentials.second_derivatives[name])
+        assert np.allclose(hessian, numerical, rtol=1e-5, atol=1e-4) and np.allclose(hessian, hessian.T)
+
+        # The evaluator gives the same results
+        evaluator = EnergyEvaluator(7, potential, potentials.derivatives[name])
+        assert np.isclose(evaluator(vec), get_energy(vec, potential))
+        assert np.allclose(evaluator.gradient(vec), get_gradient(vec, potentials.derivatives[name]))
+        vecs = vec + np.random.default_rng(1).normal(0, 0.01, (4, len(vec)))
+        assert np.allclose(evaluator.energies(vecs), [get_energy(v, potential) for v in vecs])
+        evaluator = EnergyEvaluator(7, potential, potentials.derivatives[name], dtype=np.float32)
+        assert np.isclose(evaluator(vec), get_energy(vec, potential), rtol=1e-4)
+
     print("All tests passed")